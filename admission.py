@@ -0,0 +1,216 @@
+import asyncio
+import math
+import os
+import threading
+import time
+
+# Defaults for the details keys max_queue and queue_timeout. Limits only apply
+# to AIs that set max_concurrency and/or rate_limit (calls per second).
+ADMISSION_QUEUE_SIZE = int(os.getenv('ADMISSION_QUEUE_SIZE', '32'))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', '5'))
+
+
+class Overloaded(Exception):
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class AdmissionLimiter:
+    # Admits a call when a concurrency slot is free and a rate token is
+    # available. Otherwise the caller waits in a bounded queue until its
+    # deadline; a full queue is rejected straight away. Threads (acquire) and
+    # coroutines (acquire_async) share the same slots and queue.
+    def __init__(self, max_concurrency=None, rate_limit=None, burst=None,
+                 max_queue=ADMISSION_QUEUE_SIZE, queue_timeout=ADMISSION_QUEUE_TIMEOUT):
+        self.max_concurrency = max_concurrency
+        self.rate_limit = rate_limit
+        self.burst = burst if burst is not None else max(1.0, rate_limit or 0)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._tokens = self.burst
+        self._refilled_at = time.monotonic()
+        self._condition = threading.Condition()
+        # (loop, future) for each coroutine waiting in the queue.
+        self._async_waiters = []
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def _refill(self, now):
+        if self.rate_limit:
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate_limit)
+        self._refilled_at = now
+
+    def _token_wait(self):
+        # Seconds until the next rate token, 0.0 if one is available.
+        if not self.rate_limit or self._tokens >= 1:
+            return 0.0
+        return (1 - self._tokens) / self.rate_limit
+
+    def _try_admit(self, now):
+        self._refill(now)
+        if self.max_concurrency and self.active >= self.max_concurrency:
+            return False
+        if self._token_wait() > 0:
+            return False
+        if self.rate_limit:
+            self._tokens -= 1
+        self.active += 1
+        self.admitted += 1
+        return True
+
+    def retry_after(self):
+        # Rough time until a queued call would get through, in whole seconds.
+        if self.rate_limit:
+            return max(1, math.ceil((self.waiting + 1 - self._tokens) / self.rate_limit))
+        return max(1, math.ceil(self.queue_timeout))
+
+    def acquire(self):
+        with self._condition:
+            now = time.monotonic()
+            if self.waiting == 0 and self._try_admit(now):
+                return
+            if self.waiting >= self.max_queue:
+                self.rejected += 1
+                raise Overloaded("Too many requests queued", self.retry_after())
+
+            deadline = now + self.queue_timeout
+            self.waiting += 1
+            try:
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timed_out += 1
+                        raise Overloaded("Timed out waiting in the request queue", self.retry_after())
+                    token_wait = self._token_wait()
+                    self._condition.wait(min(remaining, token_wait) if token_wait else remaining)
+                    if self._try_admit(time.monotonic()):
+                        return
+            finally:
+                self.waiting -= 1
+                self._notify()
+
+    async def acquire_async(self):
+        # As acquire(), but waits on the event loop rather than a thread. The
+        # caller is counted as waiting, and its deadline set, as it arrives.
+        loop = asyncio.get_running_loop()
+        with self._condition:
+            now = time.monotonic()
+            if self.waiting == 0 and self._try_admit(now):
+                return
+            if self.waiting >= self.max_queue:
+                self.rejected += 1
+                raise Overloaded("Too many requests queued", self.retry_after())
+            deadline = now + self.queue_timeout
+            self.waiting += 1
+        try:
+            while True:
+                with self._condition:
+                    now = time.monotonic()
+                    if self._try_admit(now):
+                        return
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self.timed_out += 1
+                        raise Overloaded("Timed out waiting in the request queue", self.retry_after())
+                    token_wait = self._token_wait()
+                    waiter = (loop, loop.create_future())
+                    self._async_waiters.append(waiter)
+                try:
+                    await asyncio.wait_for(waiter[1], min(remaining, token_wait) if token_wait else remaining)
+                except asyncio.TimeoutError:
+                    pass
+                finally:
+                    with self._condition:
+                        self._async_waiters.remove(waiter)
+        finally:
+            with self._condition:
+                self.waiting -= 1
+                self._notify()
+
+    def _notify(self):
+        # Called with the condition held.
+        self._condition.notify_all()
+        for loop, future in self._async_waiters:
+            try:
+                loop.call_soon_threadsafe(_wake, future)
+            except RuntimeError:
+                pass  # that loop has closed
+
+    def try_acquire(self):
+        # Admits only when no wait is needed, so it never blocks an event loop.
+        with self._condition:
+            return self.waiting == 0 and self._try_admit(time.monotonic())
+
+    def release(self):
+        with self._condition:
+            self.active -= 1
+            self._notify()
+
+    def stats(self):
+        with self._condition:
+            return {
+                'active': self.active,
+                'waiting': self.waiting,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+            }
+
+
+def admission_config(details):
+    max_concurrency = details.get('max_concurrency')
+    rate_limit = details.get('rate_limit')
+    burst = details.get('burst')
+    return (
+        int(max_concurrency) if max_concurrency else None,
+        float(rate_limit) if rate_limit else None,
+        float(burst) if burst else None,
+        int(details.get('max_queue', ADMISSION_QUEUE_SIZE)),
+        float(details.get('queue_timeout', ADMISSION_QUEUE_TIMEOUT)),
+    )
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(ai_id, details):
+    # None when the AI has no limits configured.
+    config = admission_config(details)
+    if config[0] is None and config[1] is None:
+        if ai_id in _limiters:
+            remove_limiter(ai_id)
+        return None
+    with _limiters_lock:
+        entry = _limiters.get(ai_id)
+        if entry is not None and entry[0] == config:
+            return entry[1]
+        limiter = AdmissionLimiter(*config)
+        _limiters[ai_id] = (config, limiter)
+        return limiter
+
+
+def remove_limiter(ai_id):
+    with _limiters_lock:
+        _limiters.pop(ai_id, None)
+
+
+def retain_limiters(ai_ids):
+    with _limiters_lock:
+        for ai_id in [ai_id for ai_id in _limiters if ai_id not in ai_ids]:
+            del _limiters[ai_id]
+
+
+def limiter_stats():
+    with _limiters_lock:
+        limiters = {ai_id: entry[1] for ai_id, entry in _limiters.items()}
+    return {ai_id: limiter.stats() for ai_id, limiter in limiters.items()}
@@ -1,79 +1,474 @@
-import json
 import uuid
 import os
-from cryptography.fernet import Fernet
+import tempfile
+import threading
+import time
+from collections import deque
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+from registry_store import JsonRegistryStore, SqliteRegistryStore, migrate_json_to_sqlite
 
 AI_DATABASE_FILE = 'ai_database.json'
+AI_REGISTRY_DB = os.getenv('AI_REGISTRY_DB', 'ai_registry.db')
+# 'json' keeps the whole registry in AI_DATABASE_FILE; 'sqlite' stores one row
+# per AI in AI_REGISTRY_DB and imports the JSON file the first time it is used.
+AI_REGISTRY_BACKEND = os.getenv('AI_REGISTRY_BACKEND', 'json')
 KEY_FILE = 'encryption_key.key'
+REGISTRY_CHECK_INTERVAL = float(os.getenv('REGISTRY_CHECK_INTERVAL', '1.0'))
+# History kept for delta queries: changes held in memory for the JSON store,
+# versions kept in the database for SQLite.
+REGISTRY_CHANGE_LOG_SIZE = int(os.getenv('REGISTRY_CHANGE_LOG_SIZE', '1000'))
 
-def get_encryption_key():
-    if not os.path.exists(KEY_FILE):
-        key = Fernet.generate_key()
-        with open(KEY_FILE, 'wb') as key_file:
-            key_file.write(key)
-    else:
+# Numeric settings the backends read from details (connection pools, worker
+# pools, admission limits, plugin affinity), checked when an AI is saved.
+NUMERIC_DETAILS = {
+    'pool_size': int,
+    'retries': int,
+    'max_concurrency': int,
+    'max_queue': int,
+    'affinity': int,
+    'timeout': float,
+    'connect_timeout': float,
+    'backoff_factor': float,
+    'rate_limit': float,
+    'burst': float,
+    'queue_timeout': float,
+}
+
+# Registry shared by every caller in this process. It is reloaded only when the
+# store changes (e.g. written by another worker). Secrets stay encrypted in it
+# and are decrypted on demand.
+_store = None
+_registry = None
+_registry_signature = None
+_registry_checked_at = 0.0
+_registry_version = 0
+_registry_lock = threading.RLock()
+_registry_listeners = []
+
+# Changes seen by this process, as (version, ai_id, removed), for delta
+# queries on the JSON store. Versions are only comparable within one epoch:
+# the database for a versioned store, shared by every worker, otherwise this
+# process.
+_process_epoch = uuid.uuid4().hex[:8]
+_changes = deque(maxlen=REGISTRY_CHANGE_LOG_SIZE)
+_changes_from = None
+_registry_order = None
+
+# The key file holds one key per line, newest first: new secrets are
+# encrypted with the first and any of them can decrypt. Every process rereads
+# it when it changes, so a rotation done by another worker is picked up.
+_fernet = None
+_key_signature = None
+_key_checked_at = 0.0
+_cipher_lock = threading.Lock()
+# Plaintext by ciphertext, only for secrets still in the registry: entries
+# go when their AI is updated or removed, here or (on reload) elsewhere.
+_decrypted_secrets = {}
+
+def _key_file_signature():
+    try:
+        stat = os.stat(KEY_FILE)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+def _write_key_file(keys, exclusive=False):
+    # Atomic, so other processes never read a partly written key file. An
+    # exclusive write leaves an existing key file alone: when several workers
+    # start at once, the first key written is the one they all use.
+    fd, new_key_file = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(KEY_FILE)), prefix='.key.')
+    try:
+        with os.fdopen(fd, 'wb') as key_file:
+            key_file.write(b'\n'.join(keys) + b'\n')
+            key_file.flush()
+            os.fsync(key_file.fileno())
+        if exclusive:
+            try:
+                os.link(new_key_file, KEY_FILE)
+            except FileExistsError:
+                pass
+        else:
+            os.replace(new_key_file, KEY_FILE)
+    finally:
+        if os.path.exists(new_key_file):
+            os.remove(new_key_file)
+
+def get_encryption_key(force=False):
+    global _fernet, _key_signature, _key_checked_at
+    with _cipher_lock:
+        now = time.monotonic()
+        if _fernet is not None and not force and now - _key_checked_at < REGISTRY_CHECK_INTERVAL:
+            return _fernet
+        _key_checked_at = now
+        signature = _key_file_signature()
+        if _fernet is not None and signature == _key_signature:
+            return _fernet
+        if signature is None:
+            _write_key_file([Fernet.generate_key()], exclusive=True)
+            signature = _key_file_signature()
         with open(KEY_FILE, 'rb') as key_file:
-            key = key_file.read()
-    return Fernet(key)
+            keys = [line.strip() for line in key_file.read().splitlines() if line.strip()]
+        _fernet = MultiFernet([Fernet(key) for key in keys])
+        _key_signature = signature
+        return _fernet
 
 def encrypt_sensitive_data(data):
-    fernet = get_encryption_key()
+    # Always rechecks the key file (one stat), so a secret is never encrypted
+    # with a key that a rotation elsewhere has already retired.
+    fernet = get_encryption_key(force=True)
     return fernet.encrypt(data.encode()).decode()
 
 def decrypt_sensitive_data(encrypted_data):
-    fernet = get_encryption_key()
-    return fernet.decrypt(encrypted_data.encode()).decode()
+    data = _decrypted_secrets.get(encrypted_data)
+    if data is None:
+        try:
+            data = get_encryption_key().decrypt(encrypted_data.encode()).decode()
+        except InvalidToken:
+            # Possibly encrypted with a key this process has not seen yet.
+            try:
+                data = get_encryption_key(force=True).decrypt(encrypted_data.encode()).decode()
+            except InvalidToken:
+                raise ValueError("Stored secret cannot be decrypted with the current encryption key")
+        _decrypted_secrets[encrypted_data] = data
+    return data
 
-def load_ai_database():
-    try:
-        with open(AI_DATABASE_FILE, 'r') as f:
-            database = json.load(f)
-        for ai_id, ai_info in database.items():
-            if 'api_key' in ai_info['details']:
-                ai_info['details']['api_key'] = decrypt_sensitive_data(ai_info['details']['api_key'])
-        return database
-    except FileNotFoundError:
-        return {}
+def _forget_secrets(records):
+    for ai_info in records:
+        _decrypted_secrets.pop(ai_info['details'].get('api_key'), None)
+
+def _prune_secrets(database):
+    stored = {ai_info['details'].get('api_key') for ai_info in database.values()}
+    for encrypted_data in [encrypted_data for encrypted_data in _decrypted_secrets if encrypted_data not in stored]:
+        _decrypted_secrets.pop(encrypted_data, None)
+
+def rotate_encryption_key():
+    # Crash-safe: the new key is added to the key file before any secret uses
+    # it, and the old keys are dropped only after every secret has been
+    # re-encrypted, so the key file can always decrypt what is stored.
+    # Secrets are re-encrypted in place, inside the store's write transaction,
+    # so AIs added or updated by other workers meanwhile are kept. Writers
+    # encrypt inside that transaction too, so each write either lands before
+    # the re-encryption pass or already sees the new key. Run one rotation at
+    # a time.
+    with _registry_lock:
+        get_encryption_key(force=True)
+        with open(KEY_FILE, 'rb') as key_file:
+            old_keys = [line.strip() for line in key_file.read().splitlines() if line.strip()]
+        new_key = Fernet.generate_key()
+        new_fernet = Fernet(new_key)
+        _write_key_file([new_key] + old_keys)
+        all_keys = get_encryption_key(force=True)
+
+        def reencrypt(ai_id, ai_info):
+            encrypted_key = ai_info['details'].get('api_key')
+            if encrypted_key is None:
+                return None
+            try:
+                new_fernet.decrypt(encrypted_key.encode())
+                return None
+            except InvalidToken:
+                pass
+            try:
+                rotated = all_keys.rotate(encrypted_key.encode()).decode()
+            except InvalidToken:
+                return None  # Unreadable with any key; nothing to save.
+            return {**ai_info, 'details': {**ai_info['details'], 'api_key': rotated}}
+
+        get_registry_store().update_each(reencrypt)
+        _write_key_file([new_key])
+        get_encryption_key(force=True)
+        _decrypted_secrets.clear()
+        # Picks up the re-encrypted records; listeners hear an update for each.
+        load_ai_database(force=True)
+
+def create_registry_store(backend=None):
+    backend = backend or AI_REGISTRY_BACKEND
+    if backend == 'json':
+        return JsonRegistryStore(AI_DATABASE_FILE)
+    if backend == 'sqlite':
+        if not os.path.exists(AI_REGISTRY_DB) and os.path.exists(AI_DATABASE_FILE):
+            migrate_json_to_sqlite(AI_DATABASE_FILE, AI_REGISTRY_DB)
+        return SqliteRegistryStore(AI_REGISTRY_DB, change_log_versions=REGISTRY_CHANGE_LOG_SIZE)
+    raise ValueError(f"Unknown registry backend: {backend}")
+
+def get_registry_store():
+    global _store
+    with _registry_lock:
+        if _store is None:
+            _store = create_registry_store()
+        return _store
+
+def add_registry_listener(listener):
+    with _registry_lock:
+        _registry_listeners.append(listener)
+
+def _notify_listeners(event, ai_id=None, ai_info=None):
+    for listener in list(_registry_listeners):
+        listener(event, ai_id, ai_info)
+
+def _set_registry(database, signature, changed=None):
+    global _registry, _registry_signature, _registry_checked_at, _registry_version
+    previous = _registry
+    _registry = database
+    _registry_signature = signature
+    _registry_checked_at = time.monotonic()
+    # A versioned store already counts every committed change, across processes.
+    _registry_version = signature if get_registry_store().versioned else _registry_version + 1
+    _log_changes(previous, database, changed)
+
+def _diff(previous, database):
+    # [(ai_id, removed)] for every AI that differs. Our own writes keep
+    # unchanged records as the same objects; a reload only has equal ones.
+    changed = [(ai_id, False) for ai_id, ai_info in database.items()
+               if previous.get(ai_id) is not ai_info and previous.get(ai_id) != ai_info]
+    changed += [(ai_id, True) for ai_id in previous if ai_id not in database]
+    return changed
+
+def _log_changes(previous, database, changed=None):
+    # Only for the JSON store; the SQLite store logs changes itself.
+    global _changes_from
+    if get_registry_store().versioned:
+        return
+    if previous is None:
+        _changes_from = _registry_version
+        return
+    for ai_id, removed in _diff(previous, database) if changed is None else changed:
+        if len(_changes) == _changes.maxlen:
+            _changes_from = _changes[0][0]
+        _changes.append((_registry_version, ai_id, removed))
+
+def _registry_epoch():
+    store = get_registry_store()
+    return f"{store.instance:x}" if store.versioned else _process_epoch
+
+def _registry_tag():
+    return f"{_registry_epoch()}-{_registry_version}"
+
+def get_registry_tag():
+    # Opaque token naming the registry state, for ETags and delta queries.
+    with _registry_lock:
+        load_ai_database()
+        return _registry_tag()
+
+def get_changes(since_tag):
+    # Returns (tag, [(ai_id, removed)]) for the changes after since_tag, or
+    # (tag, None) when they are not known here and a full listing is needed.
+    with _registry_lock:
+        load_ai_database()
+        epoch, _, version = since_tag.partition('-')
+        if epoch != _registry_epoch() or not version.isdigit():
+            return _registry_tag(), None
+        since = int(version)
+        if since > _registry_version:
+            # Tagged by a worker that has seen a newer version than we have.
+            load_ai_database(force=True)
+        store = get_registry_store()
+        if since > _registry_version:
+            log = None
+        elif store.versioned:
+            # The store's own log also covers changes made by other workers.
+            log = store.changes_since(since)
+        else:
+            log = list(_changes) if since >= _changes_from else None
+        if log is None:
+            return _registry_tag(), None
+        latest = {}
+        for change_version, ai_id, removed in log:
+            # Versions newer than our registry are left for the next query.
+            if since < change_version <= _registry_version:
+                latest.pop(ai_id, None)
+                latest[ai_id] = removed
+        return _registry_tag(), list(latest.items())
+
+def list_ais_page(cursor=None, limit=None, decrypt=False):
+    # Registration-order page starting after the AI id in cursor. Returns
+    # (tag, records, next_cursor); next_cursor is None on the last page.
+    global _registry_order
+    with _registry_lock:
+        database = load_ai_database()
+        tag = _registry_tag()
+        if _registry_order is None or _registry_order[0] is not database:
+            ids = list(database)
+            _registry_order = (database, ids, {ai_id: i for i, ai_id in enumerate(ids)})
+        _, ids, positions = _registry_order
+    if cursor is None:
+        start = 0
+    elif cursor in positions:
+        start = positions[cursor] + 1
+    else:
+        raise KeyError(cursor)
+    end = len(ids) if limit is None else start + limit
+    page = [{'id': ai_id, **_copy_record(database[ai_id], decrypt)} for ai_id in ids[start:end]]
+    return tag, page, ids[end - 1] if end < len(ids) and page else None
+
+def load_ai_database(force=False):
+    global _registry_checked_at
+    with _registry_lock:
+        now = time.monotonic()
+        if not force and _registry is not None and now - _registry_checked_at < REGISTRY_CHECK_INTERVAL:
+            return _registry
+        signature = get_registry_store().signature()
+        if _registry is None or signature != _registry_signature:
+            _reload_registry(signature)
+        else:
+            _registry_checked_at = now
+        return _registry
+
+def _reload_registry(signature):
+    # Catches up with writes made elsewhere. The SQLite store supplies just
+    # the records changed since our version; otherwise the whole registry is
+    # read and compared. Listeners hear add, update or remove for each AI
+    # that changed, and 'reload' only when that is not known (first load).
+    store = get_registry_store()
+    previous = _registry
+    delta = store.load_changes(_registry_version) if store.versioned and previous is not None else None
+    if delta is not None:
+        signature, records = delta
+        database = dict(previous)
+        for ai_id, ai_info in records:
+            if ai_info is None:
+                database.pop(ai_id, None)
+            else:
+                database[ai_id] = ai_info
+        changed = [(ai_id, ai_info is None) for ai_id, ai_info in records]
+    else:
+        database = store.load_all()
+        changed = None if previous is None else _diff(previous, database)
+    _set_registry(database, signature, changed)
+
+    if changed is None:
+        _prune_secrets(database)
+        _notify_listeners('reload')
+        return
+    for ai_id, _ in changed:
+        old, new = previous.get(ai_id), database.get(ai_id)
+        if old is not None and (new is None or new['details'].get('api_key') != old['details'].get('api_key')):
+            _forget_secrets([old])
+        if new is None:
+            if old is not None:
+                _notify_listeners('remove', ai_id, old)
+        elif old is None:
+            _notify_listeners('add', ai_id, new)
+        elif new != old:
+            _notify_listeners('update', ai_id, new)
 
 def save_ai_database(database):
-    database_copy = database.copy()
-    for ai_id, ai_info in database_copy.items():
-        if 'api_key' in ai_info['details']:
-            ai_info['details']['api_key'] = encrypt_sensitive_data(ai_info['details']['api_key'])
-    with open(AI_DATABASE_FILE, 'w') as f:
-        json.dump(database_copy, f, indent=2)
+    with _registry_lock:
+        _, signature = get_registry_store().replace_all(database)
+        _set_registry(database, signature)
+
+def _apply_write(before, after, change):
+    # Patch our own write into the cached registry, unless another writer got
+    # in first; then we catch up with the store, and listeners hear about our
+    # write along with theirs.
+    if _registry is not None and before == _registry_signature:
+        database = dict(_registry)
+        change(database)
+        _set_registry(database, after)
+        return True
+    _reload_registry(after)
+    return False
+
+def get_registry_version():
+    with _registry_lock:
+        load_ai_database()
+        return _registry_version
+
+def _copy_record(ai_info, decrypt=False):
+    details = dict(ai_info['details'])
+    if decrypt and 'api_key' in details:
+        details['api_key'] = decrypt_sensitive_data(details['api_key'])
+    return {**ai_info, 'details': details}
+
+def get_api_key(ai_info):
+    # Raises ValueError if the key cannot be decrypted.
+    encrypted_key = ai_info['details'].get('api_key')
+    if encrypted_key is None:
+        return None
+    return decrypt_sensitive_data(encrypted_key)
+
+def validate_details(details):
+    for key, kind in NUMERIC_DETAILS.items():
+        value = details.get(key)
+        if value is None:
+            continue
+        try:
+            number = kind(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"'{key}' must be {'an integer' if kind is int else 'a number'}, not {value!r}")
+        if number < 0:
+            raise ValueError(f"'{key}' must not be negative")
 
 def add_ai(name, ai_type, details):
-    database = load_ai_database()
+    validate_details(details)
     ai_id = str(uuid.uuid4())
-    database[ai_id] = {
-        'name': name,
-        'type': ai_type,
-        'details': details
-    }
-    save_ai_database(database)
+
+    def make_record():
+        record_details = dict(details)
+        if 'api_key' in record_details:
+            record_details['api_key'] = encrypt_sensitive_data(record_details['api_key'])
+        return {
+            'name': name,
+            'type': ai_type,
+            'details': record_details
+        }
+
+    with _registry_lock:
+        load_ai_database(force=True)
+        ai_info, before, after = get_registry_store().put(ai_id, make_record)
+        if _apply_write(before, after, lambda database: database.__setitem__(ai_id, ai_info)):
+            _notify_listeners('add', ai_id, ai_info)
     return ai_id
 
 def update_ai(ai_id, details):
-    database = load_ai_database()
-    if ai_id in database:
-        database[ai_id]['details'].update(details)
-        save_ai_database(database)
+    validate_details(details)
+
+    replaced = []
+
+    def merge(stored):
+        replaced.append(stored)
+        ai_info = _copy_record(stored)
+        new_details = dict(details)
+        if 'api_key' in new_details:
+            # Keep the stored ciphertext when the key itself did not change.
+            try:
+                unchanged = 'api_key' in ai_info['details'] and get_api_key(ai_info) == new_details['api_key']
+            except ValueError:
+                unchanged = False  # Unreadable with the current key; replace it.
+            if unchanged:
+                new_details['api_key'] = ai_info['details']['api_key']
+            else:
+                new_details['api_key'] = encrypt_sensitive_data(new_details['api_key'])
+        ai_info['details'].update(new_details)
+        return ai_info
+
+    with _registry_lock:
+        load_ai_database(force=True)
+        ai_info, before, after = get_registry_store().update(ai_id, merge)
+        if ai_info is None:
+            return False
+        if replaced[-1]['details'].get('api_key') != ai_info['details'].get('api_key'):
+            _forget_secrets(replaced[-1:])
+        if _apply_write(before, after, lambda database: database.__setitem__(ai_id, ai_info)):
+            _notify_listeners('update', ai_id, ai_info)
         return True
-    return False
 
 def remove_ai(ai_id):
-    database = load_ai_database()
-    if ai_id in database:
-        del database[ai_id]
-        save_ai_database(database)
+    with _registry_lock:
+        load_ai_database(force=True)
+        ai_info, before, after = get_registry_store().delete(ai_id)
+        if ai_info is None:
+            return False
+        _forget_secrets([ai_info])
+        if _apply_write(before, after, lambda database: database.pop(ai_id, None)):
+            _notify_listeners('remove', ai_id, ai_info)
         return True
-    return False
 
-def get_ai(ai_id):
+def get_ai(ai_id, decrypt=True):
     database = load_ai_database()
-    return database.get(ai_id)
+    ai_info = database.get(ai_id)
+    return _copy_record(ai_info, decrypt) if ai_info else None
 
-def list_ais():
+def list_ais(decrypt=True):
     database = load_ai_database()
-    return [{'id': k, **v} for k, v in database.items()]
\ No newline at end of file
+    return [{'id': k, **_copy_record(v, decrypt)} for k, v in database.items()]
@@ -1,19 +1,37 @@
-from flask import Flask, request, jsonify
-from input_analyzer import analyze_input
-from junction import select_and_process
-from output_handler import process_output
-from ai_manager import add_ai, update_ai, remove_ai, get_ai, list_ais
+from flask import Flask, request, jsonify, send_file, Response, stream_with_context, g
+from input_analyzer import analyze_input, analyze_many, get_analyzer
+from junction import (route_and_process, process_batch, get_response_cache, get_single_flight, select_ai,
+                      stream_with_ai, BackendError, BackendOverloaded, BackendUnavailable, get_routing_index,
+                      get_breakers, warm_plugin_pool)
+from output_handler import process_output, render_speech, get_speech, speech_worker
+from ai_manager import (add_ai, update_ai, remove_ai, get_ai, get_changes, get_registry_tag, list_ais_page,
+                        load_ai_database)
+from registry_store import SECRET_FIELDS
+import metrics
+import json
+import os
+import time
 import uuid
 from flask_cors import CORS
 from werkzeug.exceptions import BadRequest, NotFound
-import nltk
 
 app = Flask(__name__)
 CORS(app)
 
-nltk.download('punkt')
-nltk.download('stopwords')
 
+def warm_up():
+    # Loads everything the first request would otherwise pay for: NLTK and its
+    # resources, the registry, the routing index, pooled plugins and the
+    # speech engine.
+    get_analyzer()
+    load_ai_database()
+    get_routing_index()
+    warm_plugin_pool()
+    speech_worker.start()
+
+
+if os.getenv('WARM_UP_ON_IMPORT', '0') == '1':
+    warm_up()
 
 
 @app.errorhandler(BadRequest)
@@ -22,6 +40,41 @@ def handle_error(error):
     return jsonify({'error': str(error)}), error.code
 
 
+@app.errorhandler(BackendOverloaded)
+def handle_overloaded(error):
+    return jsonify({'error': str(error)}), 429, {'Retry-After': str(error.retry_after)}
+
+
+def _route_label():
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+
+@app.before_request
+def start_request_metrics():
+    if metrics.METRICS_ENABLED:
+        g.request_started = time.perf_counter()
+        metrics.http_in_flight.inc(route=_route_label())
+
+
+@app.teardown_request
+def finish_request_metrics(error=None):
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = _route_label()
+        metrics.http_in_flight.dec(route=route)
+        metrics.http_request_seconds.observe(time.perf_counter() - started, route=route)
+
+
+@app.after_request
+def count_response(response):
+    metrics.http_requests.inc(route=_route_label(), status=response.status_code)
+    return response
+
+
+def describe_ai(ai):
+    return {'id': ai['id'], 'name': ai['name']} if ai else None
+
+
 @app.route('/process', methods=['POST'])
 def process_request():
     try:
@@ -29,11 +82,149 @@ def process_request():
     except KeyError:
         raise BadRequest("Missing 'input' in request JSON")
 
+    fanout = request.json.get('fanout') or {}
+    try:
+        k = int(fanout.get('k', 1))
+        hedge_delay = fanout.get('hedge_delay')
+        hedge_delay = float(hedge_delay) if hedge_delay is not None else None
+        deadline = fanout.get('deadline')
+        deadline = float(deadline) if deadline is not None else None
+    except (TypeError, ValueError, AttributeError):
+        raise BadRequest("Invalid 'fanout' options in request JSON")
+
+    speech = request.json.get('speech', 'server')
+    if speech not in ('server', 'file', 'none'):
+        raise BadRequest("'speech' must be one of 'server', 'file' or 'none'")
+
+    timing = bool(request.json.get('timing'))
+    if timing:
+        metrics.start_timing()
+    try:
+        with metrics.stage('analyze'):
+            analyzed_input = analyze_input(user_input)
+        with metrics.stage('route'):
+            result = route_and_process(analyzed_input, k, hedge_delay, deadline)
+        with metrics.stage('output'):
+            final_output = process_output(result['output'], speak=speech == 'server')
+            speech_id = render_speech(final_output) if speech == 'file' else None
+    finally:
+        timings = metrics.finish_timing() if timing else None
+
+    response = {'output': final_output}
+    if result['ai']:
+        response['ai'] = describe_ai(result['ai'])
+    if speech_id:
+        response['speech_id'] = speech_id
+        response['speech_url'] = f"/speech/{speech_id}"
+    if not timing:
+        return jsonify(response)
+    response['timing'] = {name: round(seconds * 1000, 3) for name, seconds in timings.items()}
+    return jsonify(response), {'Server-Timing': metrics.server_timing(timings)}
+
+
+def server_sent_event(data, event=None):
+    message = f"event: {event}\n" if event else ''
+    return message + f"data: {json.dumps(data)}\n\n"
+
+
+@app.route('/process_stream', methods=['POST'])
+def process_stream_route():
+    try:
+        user_input = request.json['input']
+    except KeyError:
+        raise BadRequest("Missing 'input' in request JSON")
+
     analyzed_input = analyze_input(user_input)
-    raw_output = select_and_process(analyzed_input)
-    final_output = process_output(raw_output)
+    selected_ai = select_ai(analyzed_input)
+    stream = stream_error = None
+    if selected_ai:
+        # Admission and the breaker are checked before any response is sent:
+        # 429 when the AI is overloaded, 503 while its breaker is open.
+        try:
+            stream = stream_with_ai(selected_ai, analyzed_input)
+        except BackendUnavailable as e:
+            return jsonify({'error': str(e)}), 503
+        except BackendOverloaded:
+            raise
+        except BackendError as e:
+            stream_error = str(e)
+
+    def generate():
+        if not selected_ai:
+            output = "No suitable AI found to process the input."
+            yield server_sent_event({'chunk': output})
+            yield server_sent_event({'output': process_output(output)}, 'done')
+            return
+
+        yield server_sent_event(describe_ai(selected_ai), 'ai')
+        if stream_error is not None:
+            yield server_sent_event({'error': stream_error}, 'error')
+            return
+        chunks = []
+        try:
+            for chunk in stream:
+                chunks.append(str(chunk))
+                yield server_sent_event({'chunk': str(chunk)})
+        except BackendError as e:
+            yield server_sent_event({'error': str(e)}, 'error')
+            return
+        yield server_sent_event({'output': process_output(''.join(chunks))}, 'done')
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    if stream is not None:
+        # Frees the admission slot even if the body is never read.
+        response.call_on_close(stream.close)
+    return response
+
+
+@app.route('/speech/<speech_id>', methods=['GET'])
+def speech_route(speech_id):
+    speech = get_speech(speech_id)
+    if not speech:
+        raise NotFound('Speech not found')
+    if speech['status'] == 'ready':
+        return send_file(speech['path'], mimetype='audio/wav')
+    if speech['status'] == 'pending':
+        return jsonify({'status': 'pending'}), 202
+    return jsonify({'error': f"Speech rendering {speech['status']}"}), 410
+
+
+@app.route('/process_batch', methods=['POST'])
+def process_batch_route():
+    try:
+        inputs = request.json['inputs']
+    except KeyError:
+        raise BadRequest("Missing 'inputs' in request JSON")
+    if not isinstance(inputs, list) or not all(isinstance(user_input, str) for user_input in inputs):
+        raise BadRequest("'inputs' must be a list of strings")
+
+    analyzed_inputs = analyze_many(inputs)
+    results = []
+    for result in process_batch(analyzed_inputs):
+        item = {'ai': describe_ai(result['ai'])}
+        if 'error' in result:
+            item['error'] = result['error']
+        else:
+            item['output'] = process_output(result['output'], speak=False)
+        results.append(item)
+
+    return jsonify({'results': results})
+
 
-    return jsonify({'output': final_output})
+@app.route('/cache_stats', methods=['GET'])
+def cache_stats_route():
+    return jsonify({'cache': get_response_cache().stats(), 'coalescing': get_single_flight().stats()})
+
+
+@app.route('/breakers', methods=['GET'])
+def breakers_route():
+    return jsonify({'breakers': get_breakers().snapshot()})
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_route():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 
 @app.route('/add_ai', methods=['POST'])
@@ -44,6 +235,8 @@ def add_ai_route():
         return jsonify({'message': 'AI added successfully', 'id': ai_id})
     except KeyError as e:
         raise BadRequest(f"Missing key in request JSON: {str(e)}")
+    except ValueError as e:
+        raise BadRequest(str(e))
 
 
 @app.route('/update_ai', methods=['POST'])
@@ -57,6 +250,8 @@ def update_ai_route():
             raise NotFound('AI not found')
     except KeyError as e:
         raise BadRequest(f"Missing key in request JSON: {str(e)}")
+    except ValueError as e:
+        raise BadRequest(str(e))
 
 
 @app.route('/remove_ai', methods=['POST'])
@@ -84,11 +279,66 @@ def get_ai_route():
         raise NotFound('AI not found')
 
 
+LIST_FIELDS = ('id', 'name', 'type', 'details')
+# Largest page a client may ask for; without limit the whole list is returned.
+LIST_PAGE_LIMIT = int(os.getenv('LIST_PAGE_LIMIT', '1000'))
+
+
+def _list_entry(ai, fields):
+    # Listings never carry API keys, encrypted or not; /get_ai returns them.
+    if 'details' in fields:
+        ai['details'] = {key: value for key, value in ai['details'].items() if key not in SECRET_FIELDS}
+    return {field: ai[field] for field in fields}
+
+
 @app.route('/list_ais', methods=['GET'])
 def list_ais_route():
-    ais = list_ais()
-    return jsonify({'ais': ais})
+    # Optionally paged with limit/cursor (the last id of the previous page),
+    # projected with fields=id,name,... and tagged with the registry version:
+    # the tag is the ETag, and since=<tag> returns only what changed after it.
+    fields = request.args.get('fields')
+    fields = tuple(fields.split(',')) if fields else LIST_FIELDS
+    if 'id' not in fields or not set(fields) <= set(LIST_FIELDS):
+        raise BadRequest(f"'fields' must include 'id' and only name {', '.join(LIST_FIELDS)}")
+    limit = request.args.get('limit')
+    if limit is not None:
+        try:
+            limit = min(int(limit), LIST_PAGE_LIMIT)
+        except ValueError:
+            raise BadRequest("'limit' must be an integer")
+        if limit < 1:
+            raise BadRequest("'limit' must be at least 1")
+
+    tag = get_registry_tag()
+    if request.if_none_match.contains(tag):
+        return Response(status=304, headers={'ETag': f'"{tag}"'})
+
+    since = request.args.get('since')
+    if since:
+        tag, changes = get_changes(since)
+        if changes is None:
+            body = {'version': tag, 'reset': True}
+        else:
+            body = {'version': tag, 'changes': []}
+            for ai_id, removed in changes:
+                ai = None if removed else get_ai(ai_id, decrypt=False)
+                if ai is None:
+                    body['changes'].append({'id': ai_id, 'op': 'remove'})
+                else:
+                    ai = _list_entry({'id': ai_id, **ai}, fields)
+                    body['changes'].append({'id': ai_id, 'op': 'upsert', 'ai': ai})
+    else:
+        try:
+            tag, page, next_cursor = list_ais_page(request.args.get('cursor'), limit)
+        except KeyError:
+            raise BadRequest("Unknown 'cursor'; the AI it names was removed, list again from the start")
+        body = {'ais': [_list_entry(ai, fields) for ai in page], 'version': tag, 'next_cursor': next_cursor}
+
+    response = jsonify(body)
+    response.set_etag(tag)
+    return response
 
 
 if __name__ == '__main__':
+    warm_up()
     app.run(debug=True)
\ No newline at end of file
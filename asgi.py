@@ -0,0 +1,124 @@
+import asyncio
+import json
+import time
+
+from input_analyzer import analyze_input
+from async_junction import route_and_process_async, close_sessions
+from junction import BackendOverloaded
+from output_handler import process_output
+import metrics
+
+# Serve with an ASGI server, e.g. `uvicorn asgi:app`. Only the /process route
+# lives here; registry management stays on the Flask app in app.py.
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message, headers=()):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers
+
+
+async def _read_json(receive):
+    body = b''
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get('body', b'')
+        more_body = message.get('more_body', False)
+    try:
+        return json.loads(body or b'null')
+    except ValueError:
+        raise HTTPError(400, "Request body is not valid JSON")
+
+
+async def _send_json(send, status, payload, headers=()):
+    body = json.dumps(payload).encode()
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()),
+            (b'access-control-allow-origin', b'*'),
+            *headers,
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def process_request(receive):
+    data = await _read_json(receive)
+    try:
+        user_input = data['input']
+    except (KeyError, TypeError):
+        raise HTTPError(400, "Missing 'input' in request JSON")
+
+    fanout = data.get('fanout') or {}
+    try:
+        k = int(fanout.get('k', 1))
+        hedge_delay = fanout.get('hedge_delay')
+        hedge_delay = float(hedge_delay) if hedge_delay is not None else None
+        deadline = fanout.get('deadline')
+        deadline = float(deadline) if deadline is not None else None
+    except (TypeError, ValueError, AttributeError):
+        raise HTTPError(400, "Invalid 'fanout' options in request JSON")
+
+    loop = asyncio.get_running_loop()
+    with metrics.stage('analyze'):
+        analyzed_input = analyze_input(user_input)
+    with metrics.stage('route'):
+        try:
+            result = await route_and_process_async(analyzed_input, k, hedge_delay, deadline)
+        except BackendOverloaded as e:
+            raise HTTPError(429, str(e), [(b'retry-after', str(e.retry_after).encode())])
+    with metrics.stage('output'):
+        final_output = await loop.run_in_executor(None, process_output, result['output'])
+
+    response = {'output': final_output}
+    if result['ai']:
+        response['ai'] = {'id': result['ai']['id'], 'name': result['ai']['name']}
+    return response
+
+
+ROUTES = {
+    ('POST', '/process'): process_request,
+}
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await close_sessions()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    handler = ROUTES.get((scope['method'], scope['path']))
+    route = scope['path'] if handler is not None else 'unmatched'
+    metrics.http_in_flight.inc(route=route)
+    started = time.perf_counter()
+    try:
+        if handler is None:
+            raise HTTPError(404, "The requested URL was not found on the server.")
+        payload = await handler(receive)
+    except HTTPError as e:
+        status = e.status
+        await _send_json(send, status, {'error': str(e)}, e.headers)
+    else:
+        status = 200
+        await _send_json(send, status, payload)
+    finally:
+        metrics.http_in_flight.dec(route=route)
+        metrics.http_request_seconds.observe(time.perf_counter() - started, route=route)
+    metrics.http_requests.inc(route=route, status=status)
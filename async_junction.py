@@ -0,0 +1,293 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+
+from admission import get_limiter
+from ai_manager import add_registry_listener, list_ais
+from http_clients import client_config
+from junction import (BackendError, BackendTimeout, BackendOverloaded, COALESCE_REQUESTS, COALESCE_TIMEOUT,
+                      select_ai, process_with_bot, process_with_custom_ai, process_with_local_ai, api_key_for,
+                      admit_call_async, begin_call, end_call, abandon_call, get_response_cache, get_single_flight)
+from local_workers import DEFAULT_TIMEOUT, split_command
+from metrics import stage
+from response_cache import cache_key, is_cacheable, detail_flag
+
+ASYNC_PLUGIN_WORKERS = int(os.getenv('ASYNC_PLUGIN_WORKERS', '32'))
+
+_plugin_executor = ThreadPoolExecutor(max_workers=ASYNC_PLUGIN_WORKERS, thread_name_prefix='plugin')
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+# These mirror their namesakes in junction: the same admission limits,
+# breakers, metrics, response cache and coalescing apply to async calls.
+async def select_and_process_async(analyzed_input, k=1, hedge_delay=None, deadline=None, mode=None):
+    return (await route_and_process_async(analyzed_input, k, hedge_delay, deadline, mode))['output']
+
+
+async def route_and_process_async(analyzed_input, k=1, hedge_delay=None, deadline=None, mode=None):
+    if hedge_delay is not None:
+        k = max(k, 2)
+    candidates = select_ai(analyzed_input, mode=mode, top_k=max(k, 1))
+    if not candidates:
+        return {'output': "No suitable AI found to process the input.", 'ai': None}
+
+    if len(candidates) == 1 and deadline is None:
+        try:
+            output = await call_ai_cached_async(candidates[0], analyzed_input)
+        except BackendOverloaded:
+            raise
+        except BackendError as e:
+            output = str(e)
+        return {'output': output, 'ai': candidates[0]}
+    return await _dispatch_hedged_async(candidates, analyzed_input, hedge_delay, deadline)
+
+
+async def _dispatch_hedged_async(candidates, analyzed_input, hedge_delay, deadline):
+    now = time.monotonic()
+    end = now + deadline if deadline is not None else None
+    pending = {}
+    errors = []
+    overloaded = []
+    remaining = list(candidates)
+    next_hedge_at = now
+
+    try:
+        while True:
+            now = time.monotonic()
+            if remaining and (hedge_delay is None or not pending or now >= next_hedge_at):
+                ai = remaining.pop(0)
+                pending[asyncio.ensure_future(call_ai_cached_async(ai, analyzed_input, end))] = ai
+                next_hedge_at = now + (hedge_delay or 0)
+                continue
+            if not pending or (end is not None and now >= end):
+                break
+
+            timeout = next_hedge_at - now if remaining else None
+            if end is not None:
+                timeout = end - now if timeout is None else min(timeout, end - now)
+            done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                ai = pending.pop(task)
+                try:
+                    return {'output': task.result(), 'ai': ai}
+                except Exception as e:
+                    errors.append({'output': str(e), 'ai': ai})
+                    if isinstance(e, BackendOverloaded):
+                        overloaded.append(e)
+                    next_hedge_at = time.monotonic()
+    finally:
+        # Unlike the threaded version, calls still running are cancelled.
+        for task in pending:
+            task.cancel()
+
+    if overloaded and len(overloaded) == len(errors) and not pending:
+        raise overloaded[0]
+    if errors:
+        return errors[0]
+    return {'output': "Error: No AI answered within the deadline", 'ai': None}
+
+
+async def process_with_ai_async(ai_info, analyzed_input):
+    try:
+        return await call_ai_async(ai_info, analyzed_input)
+    except BackendError as e:
+        return str(e)
+
+
+async def call_ai_cached_async(ai_info, analyzed_input, end=None):
+    response_cache = get_response_cache()
+    use_cache = response_cache.enabled and is_cacheable(ai_info)
+    coalesce = detail_flag(ai_info, 'coalesce', COALESCE_REQUESTS)
+    if not use_cache and not coalesce:
+        return await call_ai_async(ai_info, analyzed_input)
+
+    key = cache_key(ai_info, analyzed_input)
+    if use_cache:
+        hit, output = response_cache.get(key)
+        if hit:
+            return output
+    if coalesce:
+        timeout = COALESCE_TIMEOUT if end is None else min(COALESCE_TIMEOUT, max(end - time.monotonic(), 0))
+        try:
+            return await get_single_flight().do_async(key, _call_and_store_async, ai_info, analyzed_input, key,
+                                                      use_cache, timeout=timeout)
+        except TimeoutError:
+            raise BackendTimeout(f"Error: {ai_info['name']} did not answer an identical request in time")
+    return await _call_and_store_async(ai_info, analyzed_input, key, use_cache)
+
+
+async def _call_and_store_async(ai_info, analyzed_input, key, use_cache):
+    output = await call_ai_async(ai_info, analyzed_input)
+    if use_cache:
+        get_response_cache().put(key, output)
+    return output
+
+
+async def call_ai_async(ai_info, analyzed_input):
+    labels = {'ai': ai_info['id'], 'type': ai_info['type']}
+    limiter = get_limiter(ai_info['id'], ai_info['details'])
+    if limiter is not None:
+        await admit_call_async(ai_info, limiter, labels)
+    try:
+        start = begin_call(ai_info, labels)
+        try:
+            with stage('backend'):
+                output = await _call_backend_async(ai_info, analyzed_input)
+        except asyncio.CancelledError:
+            # E.g. a losing hedge: it never finished, so it has no outcome.
+            abandon_call(ai_info, labels)
+            raise
+        except Exception as e:
+            end_call(ai_info, labels, start, e)
+            raise
+        end_call(ai_info, labels, start)
+        return output
+    finally:
+        if limiter is not None:
+            limiter.release()
+
+
+async def _call_backend_async(ai_info, analyzed_input):
+    if ai_info['type'] == 'API':
+        return await process_with_api_async(ai_info, analyzed_input)
+    elif ai_info['type'] == 'Bot':
+        return await _run_in_executor(process_with_bot, ai_info, analyzed_input)
+    elif ai_info['type'] == 'Local AI':
+        return await process_with_local_ai_async(ai_info, analyzed_input)
+    elif ai_info['type'] == 'Custom AI':
+        return await _run_in_executor(process_with_custom_ai, ai_info, analyzed_input)
+    else:
+        raise BackendError("Unsupported AI type")
+
+
+async def _run_in_executor(function, *args):
+    return await asyncio.get_running_loop().run_in_executor(_plugin_executor, function, *args)
+
+
+def _close_session(entry):
+    loop, config, session = entry
+    if loop.is_closed():
+        return
+    try:
+        running_loop = asyncio.get_running_loop()
+    except RuntimeError:
+        running_loop = None
+    if running_loop is loop:
+        loop.create_task(session.close())
+    else:
+        loop.call_soon_threadsafe(lambda: loop.create_task(session.close()))
+
+
+def _get_session(ai_id, details):
+    loop = asyncio.get_running_loop()
+    config = client_config(details)
+    with _sessions_lock:
+        entry = _sessions.get(ai_id)
+        if entry is not None and entry[0] is loop and entry[1] == config and not entry[2].closed:
+            return entry[2], config
+        pool_size, connect_timeout, read_timeout = config[:3]
+        session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=pool_size),
+            timeout=aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout))
+        _sessions[ai_id] = (loop, config, session)
+    if entry is not None:
+        _close_session(entry)
+    return session, config
+
+
+def _on_registry_change(event, ai_id, ai_info):
+    if event == 'remove':
+        stale = [ai_id]
+    elif event == 'reload':
+        ai_ids = {ai['id'] for ai in list_ais(decrypt=False)}
+        stale = [ai_id for ai_id in _sessions if ai_id not in ai_ids]
+    else:
+        return
+    with _sessions_lock:
+        entries = [_sessions.pop(ai_id) for ai_id in stale if ai_id in _sessions]
+    for entry in entries:
+        _close_session(entry)
+
+
+add_registry_listener(_on_registry_change)
+
+
+async def close_sessions():
+    with _sessions_lock:
+        entries = list(_sessions.values())
+        _sessions.clear()
+    for loop, config, session in entries:
+        if loop is asyncio.get_running_loop():
+            await session.close()
+        else:
+            _close_session((loop, config, session))
+
+
+async def _post_with_retries(session, config, endpoint, **kwargs):
+    retries, backoff_factor, idempotent = config[3:]
+    attempt = 0
+    while True:
+        try:
+            response = await session.post(endpoint, **kwargs)
+        except aiohttp.ClientConnectorError:
+            if attempt >= retries:
+                raise
+        else:
+            if not (idempotent and response.status in (429, 502, 503, 504) and attempt < retries):
+                return response
+            response.release()
+        await asyncio.sleep(backoff_factor * (2 ** attempt))
+        attempt += 1
+
+
+async def process_with_api_async(ai_info, analyzed_input):
+    api_key = api_key_for(ai_info)
+    endpoint = ai_info['details']['endpoint']
+    headers = {'Authorization': f'Bearer {api_key}'}
+    data = {'input': analyzed_input['original_input']}
+
+    try:
+        session, config = _get_session(ai_info['id'], ai_info['details'])
+        response = await _post_with_retries(session, config, endpoint, headers=headers, json=data)
+        async with response:
+            response.raise_for_status()
+            payload = await response.json(content_type=None)
+            return payload.get('output', 'No output from API')
+    except asyncio.TimeoutError as e:
+        # Includes aiohttp.ServerTimeoutError, which is also a ClientError.
+        raise BackendTimeout(f"Error from API: {str(e) or 'timed out'}")
+    except (aiohttp.ClientError, ValueError) as e:
+        raise BackendError(f"Error from API: {str(e)}")
+
+
+async def process_with_local_ai_async(ai_info, analyzed_input):
+    details = ai_info['details']
+    if details.get('mode') == 'persistent':
+        return await _run_in_executor(process_with_local_ai, ai_info, analyzed_input)
+
+    command = split_command(details['command']) + [analyzed_input['original_input']]
+    timeout = float(details.get('timeout', DEFAULT_TIMEOUT))
+
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    except OSError as e:
+        raise BackendError(f"Error running local AI: {str(e)}")
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+    except asyncio.TimeoutError:
+        raise BackendTimeout("Error: Local AI process timed out")
+    finally:
+        # Also when the call is cancelled (a losing hedge, a client that went
+        # away), so the process does not run on with nobody waiting for it.
+        if process.returncode is None:
+            process.kill()
+            await asyncio.shield(process.wait())
+    if process.returncode != 0:
+        raise BackendError(f"Error running local AI: {stderr.decode()}")
+    return stdout.decode()
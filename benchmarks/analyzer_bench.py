@@ -0,0 +1,59 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from input_analyzer import InputAnalyzer
+
+CORPUS = [
+    "What is the weather going to be like in Delhi tomorrow?",
+    "Please summarise this article about renewable energy in three sentences.",
+    "How do I reverse a linked list in Python?",
+    "Translate 'good morning, how are you' into French.",
+    "Can you write a short poem about the monsoon?",
+    "Who won the cricket world cup in 2011?",
+    "The meeting was moved to Thursday at 3pm.",
+    "Why does my Flask app return a 500 error when I post JSON?",
+    "Could you explain the difference between TCP and UDP?",
+    "Set a reminder to call mom at 7",
+    "Where can I find the nearest charging station for my car?",
+    "I don't understand how transformers use attention, can you help?",
+    "Generate a SQL query that lists the top 5 customers by revenue.",
+    "Would it rain this weekend in Bangalore?",
+    "Tell me a joke about programmers.",
+    "When was the Eiffel Tower built and how tall is it?",
+    "Convert 150 USD to INR.",
+    "These results are inconsistent with last week's report.",
+    "Draft an email asking for a deadline extension on the project.",
+    "Explain quantum entanglement like I'm five.",
+]
+
+
+def measure(analyzer, inputs, repeat):
+    analyzer.analyze_many(inputs)
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        analyzer.analyze_many(inputs)
+        best = min(best, time.perf_counter() - start)
+    return len(inputs) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare input analyzer tokenizer throughput.")
+    parser.add_argument('--size', type=int, default=10000, help="number of inputs per run")
+    parser.add_argument('--repeat', type=int, default=5, help="runs per tokenizer (best is reported)")
+    args = parser.parse_args()
+
+    inputs = [CORPUS[i % len(CORPUS)] for i in range(args.size)]
+    results = {}
+    for tokenizer in ('nltk', 'regex'):
+        results[tokenizer] = measure(InputAnalyzer(tokenizer), inputs, args.repeat)
+        print(f"{tokenizer:>6}: {results[tokenizer]:>12,.0f} inputs/s")
+    print(f"regex speedup: {results['regex'] / results['nltk']:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,252 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+AI_TYPES = ('API', 'Bot', 'Local AI', 'Custom AI')
+# Each stand-in is routed to by a word unique to its description.
+ROUTING_WORDS = {'API': 'benchapi', 'Bot': 'benchbot', 'Local AI': 'benchlocal', 'Custom AI': 'benchcustom'}
+
+PLUGIN_SOURCE = '''import time
+
+def process(text):
+    time.sleep({latency!r})
+    return {output!r}
+'''
+
+# Answers one-shot calls (input as the last argument) and, without arguments,
+# the persistent JSON-line worker protocol.
+LOCAL_AI_SOURCE = '''import json
+import sys
+import time
+
+def answer(text):
+    time.sleep({latency!r})
+    return {output!r}
+
+if len(sys.argv) > 1:
+    sys.stdout.write(answer(sys.argv[-1]))
+else:
+    for line in sys.stdin:
+        message = json.loads(line)
+        if message.get('ping'):
+            reply = {{'pong': True}}
+        else:
+            reply = {{'output': answer(message['input'])}}
+        sys.stdout.write(json.dumps(reply) + '\\n')
+        sys.stdout.flush()
+'''
+
+
+def start_stub_api(latency, payload):
+    body = json.dumps({'output': 'x' * payload}).encode()
+
+    class StubApiHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        wbufsize = -1
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            time.sleep(latency)
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubApiHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def write_stub(directory, name, source, latency, payload):
+    path = os.path.join(directory, name)
+    with open(path, 'w') as f:
+        f.write(source.format(latency=latency, output='x' * payload))
+    return path
+
+
+def register_stand_ins(workdir, api_url, args):
+    from ai_manager import add_ai
+
+    plugin = write_stub(workdir, 'stub_plugin.py', PLUGIN_SOURCE, args.latency, args.payload)
+    local_ai = write_stub(workdir, 'stub_local_ai.py', LOCAL_AI_SOURCE, args.latency, args.payload)
+    local_details = {'command': f'"{sys.executable}" "{local_ai}"', 'timeout': 30}
+    if args.local_mode == 'persistent':
+        local_details.update({'mode': 'persistent', 'pool_size': args.concurrency})
+
+    details = {
+        'API': {'endpoint': api_url, 'api_key': 'bench', 'pool_size': args.concurrency},
+        'Bot': {'file_path': plugin},
+        'Local AI': local_details,
+        'Custom AI': {'file_path': plugin},
+    }
+    for ai_type in AI_TYPES:
+        add_ai(f"bench {ai_type}", ai_type, {**details[ai_type], 'description': ROUTING_WORDS[ai_type]})
+
+
+class StageTimer:
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds):
+        with self._lock:
+            self.samples[name].append(seconds)
+
+    def wrap(self, module, attribute, label=None):
+        function = getattr(module, attribute)
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                name = label(*args) if label else attribute
+                self.record(name, time.perf_counter() - start)
+
+        setattr(module, attribute, timed)
+
+
+def instrument(timer):
+    # Times the /process stages by wrapping the functions the route calls.
+    import app
+    import junction
+
+    timer.wrap(app, 'analyze_input')
+    timer.wrap(junction, 'select_ai')
+    timer.wrap(junction, 'call_ai', lambda ai_info, analyzed_input: f"call_ai[{ai_info['type']}]")
+    timer.wrap(app, 'process_output')
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def report(title, samples, elapsed):
+    print(title)
+    print(f"  {'':<22}{'count':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, values in samples.items():
+        if not values:
+            continue
+        p50, p95, p99 = (percentile(values, q) * 1000 for q in (0.5, 0.95, 0.99))
+        print(f"  {name:<22}{len(values):>8}{len(values) / elapsed:>10.1f}{p50:>10.2f}{p95:>10.2f}{p99:>10.2f}")
+
+
+def run_load(base_url, args, count):
+    import requests
+
+    sessions = threading.local()
+    counter = iter(range(count))
+    counter_lock = threading.Lock()
+    totals = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+
+    def client():
+        session = getattr(sessions, 'session', None)
+        if session is None:
+            session = sessions.session = requests.Session()
+        while True:
+            with counter_lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            ai_type = args.types[i % len(args.types)]
+            # Unique inputs, so coalescing and the response cache do not hide backend cost.
+            payload = {'input': f"{ROUTING_WORDS[ai_type]} request {i}", 'speech': 'none'}
+            start = time.perf_counter()
+            try:
+                response = session.post(f"{base_url}/process", json=payload, timeout=60)
+                ok = response.ok
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                totals[ai_type].append(elapsed)
+                if not ok:
+                    errors[ai_type] += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as executor:
+        for _ in range(args.concurrency):
+            executor.submit(client)
+    return totals, errors, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test /process against local stand-ins for every AI type.")
+    parser.add_argument('--requests', type=int, default=400, help="total requests")
+    parser.add_argument('--warmup', type=int, default=40,
+                        help="requests sent first and left out of the results (spawns pools, opens connections)")
+    parser.add_argument('--concurrency', type=int, default=8, help="concurrent clients")
+    parser.add_argument('--latency', type=float, default=0.01, help="stand-in backend latency in seconds")
+    parser.add_argument('--payload', type=int, default=256, help="stand-in response size in characters")
+    parser.add_argument('--types', nargs='+', choices=AI_TYPES, default=list(AI_TYPES), help="AI types to drive")
+    parser.add_argument('--local-mode', choices=('oneshot', 'persistent'), default='persistent',
+                        help="how the Local AI stand-in is run")
+    args = parser.parse_args()
+
+    # The registry and key files are relative paths, so the run happens in a
+    # scratch directory and never touches the real registry.
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='central_ai_bench_') as workdir:
+        os.chdir(workdir)
+        try:
+            run(args, workdir)
+        finally:
+            os.chdir(cwd)
+
+
+def run(args, workdir):
+    api_server = start_stub_api(args.latency, args.payload)
+    register_stand_ins(workdir, f"http://127.0.0.1:{api_server.server_port}/", args)
+
+    import app
+    from local_workers import close_all_worker_pools
+    from plugin_pool import close_plugin_pool
+    from werkzeug.serving import make_server
+
+    timer = StageTimer()
+    instrument(timer)
+    app.warm_up()
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    run_load(base_url, args, args.warmup)
+    timer.samples.clear()
+
+    print(f"{args.requests} requests, {args.concurrency} clients, "
+          f"{args.latency * 1000:.0f} ms backend latency, {args.payload} byte payload")
+    totals, errors, elapsed = run_load(base_url, args, args.requests)
+    server.shutdown()
+    api_server.shutdown()
+    # Worker processes run from the scratch directory; stop them before it is removed.
+    close_plugin_pool()
+    close_all_worker_pools()
+
+    print(f"throughput: {sum(map(len, totals.values())) / elapsed:.1f} req/s over {elapsed:.2f} s")
+    report("per AI type (end to end)", {ai_type: totals[ai_type] for ai_type in args.types}, elapsed)
+    report("per stage (server side)", dict(timer.samples), elapsed)
+    for ai_type, count in errors.items():
+        print(f"  {ai_type}: {count} failed request(s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in a fresh interpreter per backend and size, inside a scratch directory
+# so the real registry and key file are never touched.
+CHILD = '''
+import json, sys, time
+sys.path.insert(0, ROOT)
+import ai_manager
+import junction
+
+SIZE, REPEAT = SIZE_VALUE, REPEAT_VALUE
+WORDS = ['weather', 'translate', 'code', 'summarise', 'math', 'music', 'news', 'travel', 'sports', 'finance']
+
+database = {}
+for i in range(SIZE):
+    details = {'description': f"{WORDS[i % len(WORDS)]} assistant number{i}"}
+    if i % 4 == 0:
+        details.update({'endpoint': 'http://127.0.0.1:9/', 'api_key': ai_manager.encrypt_sensitive_data(f"key{i}")})
+    database[f"seed-{i}"] = {'name': f"AI {i}", 'type': 'API' if i % 4 == 0 else 'Bot', 'details': details}
+ai_manager.save_ai_database(database)
+
+def best(function):
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def select():
+    junction.select_ai({'original_input': 'weather today', 'tokens': ['weather', 'today'], 'intent': 'question'})
+
+results = {
+    'store load_all': best(lambda: ai_manager.get_registry_store().load_all()),
+    'list_ais': best(lambda: ai_manager.list_ais(decrypt=False)),
+    'list_ais (decrypt)': best(ai_manager.list_ais),
+    'index rebuild': best(lambda: junction.get_routing_index().rebuild(ai_manager.list_ais(decrypt=False))),
+    'select_ai': best(select),
+}
+ai_manager.load_ai_database(force=True)
+results['add_ai'] = best(lambda: ai_manager.add_ai('bench', 'Bot', {'description': 'benchmark'}))
+ids = iter([ai['id'] for ai in ai_manager.list_ais(decrypt=False) if ai['name'] == 'bench'])
+results['update_ai'] = best(lambda: ai_manager.update_ai(next(ids), {'description': 'benchmark updated'}))
+print(json.dumps(results))
+'''
+
+
+def run_child(backend, size, repeat):
+    child = CHILD.replace('ROOT', repr(ROOT)).replace('SIZE_VALUE', str(size)).replace('REPEAT_VALUE', str(repeat))
+    with tempfile.TemporaryDirectory(prefix='central_ai_registry_bench_') as workdir:
+        result = subprocess.run(
+            [sys.executable, '-c', child], cwd=workdir, capture_output=True, text=True, check=True,
+            env={**os.environ, 'AI_REGISTRY_BACKEND': backend})
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure registry operations and routing as the number of AIs grows.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 1000, 10000])
+    parser.add_argument('--backends', nargs='+', choices=('json', 'sqlite'), default=['json', 'sqlite'])
+    parser.add_argument('--repeat', type=int, default=5, help="runs per operation (best is reported)")
+    args = parser.parse_args()
+
+    for backend in args.backends:
+        print(f"{backend} backend:")
+        rows = {size: run_child(backend, size, args.repeat) for size in args.sizes}
+        operations = list(rows[args.sizes[0]])
+        print(f"  {'':<20}" + ''.join(f"{f'{size} AIs':>14}" for size in args.sizes))
+        for operation in operations:
+            print(f"  {operation:<20}" + ''.join(f"{rows[size][operation] * 1000:>11.3f} ms" for size in args.sizes))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in a fresh interpreter so imports are measured cold.
+CHILD = '''
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+if WARM_UP:
+    app.warm_up()
+warmed = time.perf_counter()
+client = app.app.test_client()
+response = client.post('/process', json={'input': 'hello there', 'speech': 'none'})
+served = time.perf_counter()
+print(json.dumps({
+    'status': response.status_code,
+    'import': imported - start,
+    'warm_up': warmed - imported,
+    'first_request': served - warmed,
+    'total': served - start,
+}))
+'''
+
+
+def run_once(warm_up):
+    result = subprocess.run(
+        [sys.executable, '-c', CHILD.replace('WARM_UP', str(warm_up))],
+        cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure time from importing app.py to the first served request.")
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    for warm_up in (False, True):
+        runs = [run_once(warm_up) for _ in range(args.runs)]
+        label = 'with warm_up()' if warm_up else 'lazy'
+        print(f"{label}:")
+        for stage in ('import', 'warm_up', 'first_request', 'total'):
+            print(f"  {stage:>13}: {statistics.median(run[stage] for run in runs) * 1000:8.1f} ms (median)")
+        statuses = {run['status'] for run in runs}
+        if statuses != {200}:
+            print(f"  first request returned status {sorted(statuses)}")
+
+
+if __name__ == '__main__':
+    main()
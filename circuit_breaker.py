@@ -0,0 +1,157 @@
+import os
+import threading
+import time
+from collections import deque
+
+BREAKER_ENABLED = os.getenv('BREAKER_ENABLED', '1') == '1'
+# Calls kept per AI for error rate and latency.
+BREAKER_WINDOW = int(os.getenv('BREAKER_WINDOW', '20'))
+BREAKER_MIN_CALLS = int(os.getenv('BREAKER_MIN_CALLS', '5'))
+BREAKER_ERROR_RATE = float(os.getenv('BREAKER_ERROR_RATE', '0.5'))
+# Calls slower than this count as failures.
+BREAKER_SLOW_CALL = float(os.getenv('BREAKER_SLOW_CALL', '10.0'))
+# How long an open breaker fast-fails before letting one probe call through.
+BREAKER_OPEN_SECONDS = float(os.getenv('BREAKER_OPEN_SECONDS', '30.0'))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    def __init__(self, window=BREAKER_WINDOW, min_calls=BREAKER_MIN_CALLS, error_rate=BREAKER_ERROR_RATE,
+                 slow_call=BREAKER_SLOW_CALL, open_seconds=BREAKER_OPEN_SECONDS):
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call = slow_call
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self.opened_at = None
+        self.times_opened = 0
+        self.rejected = 0
+        # (latency, failed) for the most recent calls.
+        self._calls = deque(maxlen=window)
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def available(self):
+        # Whether a call would be let through right now, without claiming the probe.
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                return time.monotonic() - self.opened_at >= self.open_seconds
+            return not self._probing
+
+    def allow(self):
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.open_seconds:
+                self.state = HALF_OPEN
+                self._probing = False
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record(self, latency, failed=False):
+        failed = failed or latency >= self.slow_call
+        with self._lock:
+            self._calls.append((latency, failed))
+            if self.state == HALF_OPEN:
+                self._probing = False
+                if failed:
+                    self._open()
+                else:
+                    self.state = CLOSED
+                    self._calls.clear()
+                    self._calls.append((latency, failed))
+            elif self.state == CLOSED and len(self._calls) >= self.min_calls:
+                failures = sum(1 for _, call_failed in self._calls if call_failed)
+                if failures / len(self._calls) >= self.error_rate:
+                    self._open()
+
+    def abandon(self):
+        # For a call that ended without an outcome (cancelled, or abandoned by
+        # its client): records nothing, but frees the half-open probe.
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probing = False
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+
+    def latency(self):
+        # Mean latency of recent successful calls; 0.0 until one has been seen,
+        # so AIs without history are tried before slower known ones.
+        with self._lock:
+            latencies = [latency for latency, failed in self._calls if not failed]
+        return sum(latencies) / len(latencies) if latencies else 0.0
+
+    def snapshot(self):
+        with self._lock:
+            calls = list(self._calls)
+            state = self.state
+            opened_for = time.monotonic() - self.opened_at if state != CLOSED else None
+        failures = sum(1 for _, failed in calls if failed)
+        latencies = [latency for latency, failed in calls if not failed]
+        return {
+            'state': state,
+            'calls': len(calls),
+            'error_rate': failures / len(calls) if calls else 0.0,
+            'mean_latency': sum(latencies) / len(latencies) if latencies else None,
+            'opened_for': opened_for,
+            'times_opened': self.times_opened,
+            'rejected': self.rejected,
+        }
+
+
+class BreakerRegistry:
+    def __init__(self, enabled=BREAKER_ENABLED):
+        self.enabled = enabled
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, ai_id):
+        breaker = self._breakers.get(ai_id)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(ai_id, CircuitBreaker())
+        return breaker
+
+    def allow(self, ai_id):
+        return not self.enabled or self.get(ai_id).allow()
+
+    def record(self, ai_id, latency, failed=False):
+        if self.enabled:
+            self.get(ai_id).record(latency, failed)
+
+    def abandon(self, ai_id):
+        if self.enabled:
+            self.get(ai_id).abandon()
+
+    def order(self, ranking):
+        # Stable re-ordering of (ai_id, score) pairs: AIs whose breaker would
+        # reject the call go last, and equal scores are ordered by latency.
+        if not self.enabled:
+            return ranking
+        return sorted(ranking, key=lambda item: (not self.get(item[0]).available(), -item[1],
+                                                 self.get(item[0]).latency()))
+
+    def reset(self, ai_id):
+        with self._lock:
+            self._breakers.pop(ai_id, None)
+
+    def retain(self, ai_ids):
+        with self._lock:
+            for ai_id in [ai_id for ai_id in self._breakers if ai_id not in ai_ids]:
+                del self._breakers[ai_id]
+
+    def snapshot(self):
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {ai_id: breaker.snapshot() for ai_id, breaker in breakers.items()}
@@ -0,0 +1,81 @@
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_POOL_SIZE = int(os.getenv('API_POOL_SIZE', '10'))
+DEFAULT_CONNECT_TIMEOUT = float(os.getenv('API_CONNECT_TIMEOUT', '5'))
+DEFAULT_READ_TIMEOUT = float(os.getenv('API_READ_TIMEOUT', '30'))
+DEFAULT_RETRIES = int(os.getenv('API_RETRIES', '2'))
+DEFAULT_BACKOFF_FACTOR = float(os.getenv('API_BACKOFF_FACTOR', '0.3'))
+RETRY_STATUSES = (429, 502, 503, 504)
+
+
+class ApiClient:
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout=DEFAULT_READ_TIMEOUT, retries=DEFAULT_RETRIES,
+                 backoff_factor=DEFAULT_BACKOFF_FACTOR, idempotent=False):
+        self.timeout = (connect_timeout, read_timeout)
+        # Failed connections are always safe to retry; read errors and retryable
+        # statuses only when the backend declares its POSTs idempotent.
+        allowed_methods = Retry.DEFAULT_ALLOWED_METHODS
+        if idempotent:
+            allowed_methods = allowed_methods | {'POST'}
+        retry = Retry(total=retries, connect=retries, read=retries, status=retries,
+                      backoff_factor=backoff_factor, status_forcelist=RETRY_STATUSES,
+                      allowed_methods=allowed_methods, raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def post(self, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.post(url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+def client_config(details):
+    return (
+        int(details.get('pool_size', DEFAULT_POOL_SIZE)),
+        float(details.get('connect_timeout', DEFAULT_CONNECT_TIMEOUT)),
+        float(details.get('timeout', DEFAULT_READ_TIMEOUT)),
+        int(details.get('retries', DEFAULT_RETRIES)),
+        float(details.get('backoff_factor', DEFAULT_BACKOFF_FACTOR)),
+        bool(details.get('idempotent', False)),
+    )
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_api_client(ai_id, details):
+    config = client_config(details)
+    with _clients_lock:
+        entry = _clients.get(ai_id)
+        if entry is not None and entry[0] == config:
+            return entry[1]
+        client = ApiClient(*config)
+        _clients[ai_id] = (config, client)
+    if entry is not None:
+        entry[1].close()
+    return client
+
+
+def close_api_client(ai_id):
+    with _clients_lock:
+        entry = _clients.pop(ai_id, None)
+    if entry is not None:
+        entry[1].close()
+
+
+def retain_api_clients(ai_ids):
+    with _clients_lock:
+        stale = [ai_id for ai_id in _clients if ai_id not in ai_ids]
+    for ai_id in stale:
+        close_api_client(ai_id)
@@ -1,31 +1,114 @@
-import nltk
-from nltk.tokenize import word_tokenize
-from nltk.corpus import stopwords
+import os
+import re
+import threading
 
-nltk.download('punkt', quiet=True)
-nltk.download('stopwords', quiet=True)
+INPUT_TOKENIZER = os.getenv('INPUT_TOKENIZER', 'nltk')
+# Resources found here (e.g. shipped with the deployment) are used before the
+# user's NLTK data directories; anything missing is downloaded once, if allowed.
+NLTK_DATA_DIR = os.getenv('NLTK_DATA_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'nltk_data'))
+NLTK_AUTO_DOWNLOAD = os.getenv('NLTK_AUTO_DOWNLOAD', '1') == '1'
+
+INTENTS = {
+    'question': ['what', 'why', 'how', 'when', 'where', 'who'],
+    'command': ['do', 'please', 'can', 'could', 'would'],
+    'statement': ['is', 'are', 'was', 'were']
+}
+
+# Words (keeping in-word apostrophes) and single punctuation marks. Unlike the
+# NLTK tokenizer it does not split contractions ("don't" stays one token).
+REGEX_TOKEN_PATTERN = re.compile(r"\w+(?:'\w+)*|[^\w\s]")
+
+
+def _find_nltk_resource(nltk, *paths):
+    for path in paths:
+        try:
+            nltk.data.find(path)
+            return True
+        except LookupError:
+            pass
+    return False
+
+
+def load_nltk(tokenizer=INPUT_TOKENIZER):
+    import nltk
+
+    if os.path.isdir(NLTK_DATA_DIR) and NLTK_DATA_DIR not in nltk.data.path:
+        nltk.data.path.insert(0, NLTK_DATA_DIR)
+
+    required = [('stopwords', ['corpora/stopwords'])]
+    if tokenizer == 'nltk':
+        # NLTK >= 3.8.2 tokenizes with punkt_tab; older releases use punkt.
+        required.append(('punkt_tab', ['tokenizers/punkt_tab', 'tokenizers/punkt']))
+    for name, paths in required:
+        if _find_nltk_resource(nltk, *paths):
+            continue
+        if not NLTK_AUTO_DOWNLOAD:
+            raise LookupError(f"NLTK resource '{name}' is not installed and NLTK_AUTO_DOWNLOAD is disabled")
+        nltk.download(name, quiet=True)
+        if name == 'punkt_tab' and not _find_nltk_resource(nltk, *paths):
+            nltk.download('punkt', quiet=True)
+    return nltk
+
+
+class InputAnalyzer:
+    def __init__(self, tokenizer=INPUT_TOKENIZER, intents=INTENTS):
+        if tokenizer not in ('nltk', 'regex'):
+            raise ValueError(f"Unknown tokenizer: {tokenizer}")
+        self.tokenizer = tokenizer
+        nltk = load_nltk(tokenizer)
+        self.stop_words = frozenset(nltk.corpus.stopwords.words('english'))
+        self._word_tokenize = nltk.tokenize.word_tokenize
+        # Earlier intents win, so each keyword maps to (priority, intent).
+        self.keyword_intents = {}
+        for priority, (intent, keywords) in enumerate(intents.items()):
+            for keyword in keywords:
+                self.keyword_intents.setdefault(keyword, (priority, intent))
+
+    def tokenize(self, text):
+        if self.tokenizer == 'regex':
+            return REGEX_TOKEN_PATTERN.findall(text)
+        return self._word_tokenize(text)
+
+    def analyze(self, user_input):
+        tokens = self.tokenize(user_input.lower())
+
+        stop_words = self.stop_words
+        filtered_tokens = [word for word in tokens if word not in stop_words]
+
+        best_match = None
+        for word in filtered_tokens:
+            match = self.keyword_intents.get(word)
+            if match is not None and (best_match is None or match[0] < best_match[0]):
+                best_match = match
+                if match[0] == 0:
+                    break
+
+        return {
+            'original_input': user_input,
+            'tokens': filtered_tokens,
+            'intent': best_match[1] if best_match else 'unknown'
+        }
+
+    def analyze_many(self, inputs):
+        return [self.analyze(user_input) for user_input in inputs]
+
+
+_analyzer = None
+_analyzer_lock = threading.Lock()
+
+
+def get_analyzer():
+    global _analyzer
+    if _analyzer is None:
+        with _analyzer_lock:
+            if _analyzer is None:
+                _analyzer = InputAnalyzer()
+    return _analyzer
 
 
 def analyze_input(user_input):
-    tokens = word_tokenize(user_input.lower())
-
-    stop_words = set(stopwords.words('english'))
-    filtered_tokens = [word for word in tokens if word not in stop_words]
-
-    intents = {
-        'question': ['what', 'why', 'how', 'when', 'where', 'who'],
-        'command': ['do', 'please', 'can', 'could', 'would'],
-        'statement': ['is', 'are', 'was', 'were']
-    }
-
-    detected_intent = 'unknown'
-    for intent, keywords in intents.items():
-        if any(word in filtered_tokens for word in keywords):
-            detected_intent = intent
-            break
-
-    return {
-        'original_input': user_input,
-        'tokens': filtered_tokens,
-        'intent': detected_intent
-    }
\ No newline at end of file
+    return get_analyzer().analyze(user_input)
+
+
+def analyze_many(inputs):
+    return get_analyzer().analyze_many(inputs)
@@ -1,28 +1,510 @@
-from ai_manager import get_ai, list_ais
-import importlib
+from ai_manager import get_ai, list_ais, get_api_key, load_ai_database, add_registry_listener
+from router import InvertedIndex, TfidfIndex
+from plugin_loader import PluginCache
+from plugin_pool import (PLUGIN_EXECUTION, PluginWorkerError, PluginTimeout, PluginMissingProcess, get_plugin_pool,
+                         plugin_config)
+from response_cache import ResponseCache, cache_key, is_cacheable, detail_flag
+from singleflight import SingleFlight
+from circuit_breaker import BreakerRegistry
+from admission import Overloaded, get_limiter, remove_limiter, retain_limiters, limiter_stats
+from http_clients import get_api_client, close_api_client, retain_api_clients
+from metrics import registry as metrics_registry, snapshot, stage, ai_request_seconds, ai_errors, ai_in_flight
+from local_workers import (LocalWorkerError, LocalWorkerTimeout, DEFAULT_TIMEOUT, get_worker_pool,
+                           close_worker_pool, retain_worker_pools, split_command)
+import json
+import os
 import requests
 import subprocess
+import tempfile
+import threading
+import time
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
+ROUTING_MODE = os.getenv('ROUTING_MODE', 'index')
+FANOUT_WORKERS = int(os.getenv('FANOUT_WORKERS', '32'))
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', '16'))
+# Coalescing hands one backend answer to every identical request in flight,
+# so it is opt-in per AI (details['coalesce']); this sets the default.
+COALESCE_REQUESTS = os.getenv('COALESCE_REQUESTS', '0') == '1'
+# Longest a coalesced request waits on the call it joined.
+COALESCE_TIMEOUT = float(os.getenv('COALESCE_TIMEOUT', '30'))
+# Extra candidates ranked beyond the ones asked for, so AIs with an open
+# breaker can be skipped and ties can be broken by observed latency.
+ROUTING_CANDIDATES = int(os.getenv('ROUTING_CANDIDATES', '3'))
+ROUTING_INDEXES = {
+    'index': InvertedIndex,
+    'tfidf': TfidfIndex,
+}
 
-def select_and_process(analyzed_input):
-    selected_ai = select_ai(analyzed_input)
+_routing_indexes = {}
+# Guards _routing_indexes, _stale_indexes and _index_backlogs; held only
+# briefly, never while an index is built.
+_index_lock = threading.Lock()
+# One index build at a time.
+_index_build_lock = threading.Lock()
+# Modes whose index missed a 'reload' and is rebuilt on next use.
+_stale_indexes = set()
+# Registry changes made while a mode's index is being built, replayed onto it
+# before it is swapped in.
+_index_backlogs = {}
+_plugin_cache = PluginCache()
+_response_cache = ResponseCache()
+_single_flight = SingleFlight()
+_breakers = BreakerRegistry()
+_fanout_executor = ThreadPoolExecutor(max_workers=FANOUT_WORKERS, thread_name_prefix='fanout')
+_batch_executor = ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY, thread_name_prefix='batch')
+
+
+class BackendError(Exception):
+    pass
+
+
+class BackendTimeout(BackendError):
+    pass
+
+
+class BackendUnavailable(BackendError):
+    pass
+
+
+class BackendOverloaded(BackendError):
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def select_and_process(analyzed_input, k=1, hedge_delay=None, deadline=None, mode=None):
+    return route_and_process(analyzed_input, k, hedge_delay, deadline, mode)['output']
 
-    if selected_ai:
-        return process_with_ai(selected_ai, analyzed_input)
-    else:
-        return "No suitable AI found to process the input."
 
+def route_and_process(analyzed_input, k=1, hedge_delay=None, deadline=None, mode=None):
+    if hedge_delay is not None:
+        k = max(k, 2)
+    candidates = select_ai(analyzed_input, mode=mode, top_k=max(k, 1))
+    if not candidates:
+        return {'output': "No suitable AI found to process the input.", 'ai': None}
 
-def select_ai(analyzed_input):
-    ais = list_ais()
-    # This is a simple selection method. You may want to implement a more sophisticated one.
-    for ai in ais:
-        if any(token in ai['details'].get('description', '').lower() for token in analyzed_input['tokens']):
-            return ai
+    if len(candidates) == 1 and deadline is None:
+        try:
+            output = call_ai_cached(candidates[0], analyzed_input)
+        except BackendOverloaded:
+            raise
+        except BackendError as e:
+            output = str(e)
+        return {'output': output, 'ai': candidates[0]}
+    return _dispatch_hedged(candidates, analyzed_input, hedge_delay, deadline)
+
+
+def _dispatch_hedged(candidates, analyzed_input, hedge_delay, deadline):
+    # Without a hedge delay every candidate starts at once; with one, the next
+    # candidate starts whenever the delay passes or a running call fails.
+    now = time.monotonic()
+    end = now + deadline if deadline is not None else None
+    pending = {}
+    errors = []
+    overloaded = []
+    remaining = list(candidates)
+    next_hedge_at = now
+
+    try:
+        while True:
+            now = time.monotonic()
+            if remaining and (hedge_delay is None or not pending or now >= next_hedge_at):
+                ai = remaining.pop(0)
+                pending[_fanout_executor.submit(call_ai_cached, ai, analyzed_input, end)] = ai
+                next_hedge_at = now + (hedge_delay or 0)
+                continue
+            if not pending or (end is not None and now >= end):
+                break
+
+            timeout = next_hedge_at - now if remaining else None
+            if end is not None:
+                timeout = end - now if timeout is None else min(timeout, end - now)
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                ai = pending.pop(future)
+                try:
+                    return {'output': future.result(), 'ai': ai}
+                except Exception as e:
+                    errors.append({'output': str(e), 'ai': ai})
+                    if isinstance(e, BackendOverloaded):
+                        overloaded.append(e)
+                    next_hedge_at = time.monotonic()
+    finally:
+        # Calls that already started cannot be interrupted; their results are dropped.
+        for future in pending:
+            future.cancel()
+
+    if overloaded and len(overloaded) == len(errors) and not pending:
+        raise overloaded[0]
+    if errors:
+        return errors[0]
+    return {'output': "Error: No AI answered within the deadline", 'ai': None}
+
+
+def process_batch(analyzed_inputs, mode=None):
+    results = [{'error': "No suitable AI found to process the input.", 'ai': None} for _ in analyzed_inputs]
+    groups = {}
+    for i, ranked in enumerate(rank_ais_batch(analyzed_inputs, 1, mode)):
+        if ranked:
+            groups.setdefault(ranked[0]['id'], (ranked[0], []))[1].append(i)
+
+    # Every task is submitted from here so no worker ever waits on another one.
+    futures = {}
+    for ai, indices in groups.values():
+        batch_call = _batch_call(ai)
+        if batch_call is not None and len(indices) > 1:
+            originals = [analyzed_inputs[i]['original_input'] for i in indices]
+            futures[_batch_executor.submit(_call_guarded, ai, batch_call, originals)] = (ai, indices)
+        else:
+            for i in indices:
+                futures[_batch_executor.submit(call_ai_cached, ai, analyzed_inputs[i])] = (ai, [i])
+
+    for future, (ai, indices) in futures.items():
+        try:
+            outputs = future.result()
+            if len(indices) == 1 and not isinstance(outputs, list):
+                outputs = [outputs]
+            if not isinstance(outputs, list) or len(outputs) != len(indices):
+                raise BackendError("Error: batch call returned a different number of outputs than inputs")
+            for i, output in zip(indices, outputs):
+                results[i] = {'output': output, 'ai': ai}
+        except Exception as e:
+            for i in indices:
+                results[i] = {'error': str(e), 'ai': ai}
+    return results
+
+
+def _batch_call(ai_info):
+    details = ai_info['details']
+    if ai_info['type'] == 'API' and details.get('batch_endpoint'):
+        return lambda inputs: _process_api_batch(ai_info, inputs)
+    if ai_info['type'] in ('Bot', 'Custom AI') and not _runs_in_pool(ai_info):
+        try:
+            module = _plugin_cache.load(ai_info['id'], details['file_path'])
+        except Exception:
+            return None
+        if hasattr(module, 'process_batch'):
+            label = 'bot' if ai_info['type'] == 'Bot' else 'custom AI'
+            return lambda inputs: _run_plugin_batch(module, inputs, label)
     return None
 
 
+def _run_plugin_batch(module, inputs, label):
+    try:
+        return module.process_batch(inputs)
+    except Exception as e:
+        raise BackendError(f"Error processing with {label}: {str(e)}")
+
+
+def _process_api_batch(ai_info, inputs):
+    api_key = api_key_for(ai_info)
+    endpoint = ai_info['details']['batch_endpoint']
+    headers = {'Authorization': f'Bearer {api_key}'}
+
+    try:
+        response = get_api_client(ai_info['id'], ai_info['details']).post(
+            endpoint, headers=headers, json={'inputs': inputs})
+        response.raise_for_status()
+        return response.json()['outputs']
+    except (requests.RequestException, ValueError, KeyError) as e:
+        raise BackendError(f"Error from API: {str(e)}")
+
+
+def get_response_cache():
+    return _response_cache
+
+
+def get_single_flight():
+    return _single_flight
+
+
+def get_breakers():
+    return _breakers
+
+
+def _on_registry_change(event, ai_id, ai_info):
+    if event in ('update', 'remove'):
+        _response_cache.invalidate_ai(ai_id)
+        _breakers.reset(ai_id)
+    if event == 'remove':
+        remove_limiter(ai_id)
+
+    if event == 'update':
+        _plugin_cache.evict(ai_id, keep_path=ai_info['details'].get('file_path'))
+        if ai_info['details'].get('mode') != 'persistent':
+            close_worker_pool(ai_id)
+    elif event == 'remove':
+        _plugin_cache.evict(ai_id)
+        close_worker_pool(ai_id)
+        close_api_client(ai_id)
+        for metric in (ai_request_seconds, ai_errors, ai_in_flight):
+            metric.remove(ai=ai_id)
+    elif event == 'reload':
+        ai_ids = {ai['id'] for ai in list_ais(decrypt=False)}
+        _plugin_cache.retain(ai_ids)
+        _response_cache.retain(ai_ids)
+        _breakers.retain(ai_ids)
+        retain_limiters(ai_ids)
+        retain_worker_pools(ai_ids)
+        retain_api_clients(ai_ids)
+
+    # Runs under the registry lock, so a 'reload' only marks the indexes
+    # stale; get_routing_index rebuilds them outside it.
+    with _index_lock:
+        if event == 'reload':
+            _stale_indexes.update(_routing_indexes)
+        else:
+            for index in _routing_indexes.values():
+                _apply_index_change(index, event, ai_id, ai_info)
+        for backlog in _index_backlogs.values():
+            backlog.append((event, ai_id, ai_info))
+
+
+def _apply_index_change(index, event, ai_id, ai_info):
+    if event in ('add', 'update'):
+        index.add(ai_id, ai_info['details'].get('description', ''))
+    elif event == 'remove':
+        index.remove(ai_id)
+
+
+add_registry_listener(_on_registry_change)
+
+
+def _collect_metrics():
+    cache = _response_cache.stats()
+    coalescing = _single_flight.stats()
+    breakers = _breakers.snapshot()
+    limiters = limiter_stats()
+    return [
+        snapshot('response_cache_lookups_total', 'counter', "Response cache lookups by result.",
+                 [({'result': 'hit'}, cache['hits']), ({'result': 'miss'}, cache['misses'])]),
+        snapshot('response_cache_entries', 'gauge', "Entries in the response cache.", [({}, cache['entries'])]),
+        snapshot('response_cache_bytes', 'gauge', "Bytes held by the response cache.", [({}, cache['bytes'])]),
+        snapshot('coalesced_calls_total', 'counter', "Backend calls by whether they joined an identical in-flight call.",
+                 [({'result': 'led'}, coalescing['calls']),
+                  ({'result': 'collapsed'}, coalescing['collapsed']),
+                  ({'result': 'timed_out'}, coalescing['timed_out'])]),
+        snapshot('coalesced_calls_in_flight', 'gauge', "Distinct backend calls in flight.",
+                 [({}, coalescing['in_flight'])]),
+        snapshot('circuit_breaker_open', 'gauge', "1 while an AI's circuit breaker is open or half-open.",
+                 [({'ai': ai_id}, int(breaker['state'] != 'closed')) for ai_id, breaker in breakers.items()]),
+        snapshot('admission_queue_depth', 'gauge', "Calls waiting for admission per AI.",
+                 [({'ai': ai_id}, stats['waiting']) for ai_id, stats in limiters.items()]),
+        snapshot('admission_active', 'gauge', "Admitted calls in progress per AI.",
+                 [({'ai': ai_id}, stats['active']) for ai_id, stats in limiters.items()]),
+        snapshot('admission_rejected_total', 'counter', "Calls turned away per AI, by reason.",
+                 [({'ai': ai_id, 'reason': reason}, stats[key]) for ai_id, stats in limiters.items()
+                  for reason, key in (('queue_full', 'rejected'), ('queue_timeout', 'timed_out'))]),
+    ]
+
+
+metrics_registry.add_collector(_collect_metrics)
+
+
+def get_routing_index(mode=None):
+    mode = mode or ROUTING_MODE
+    if mode not in ROUTING_INDEXES:
+        raise ValueError(f"Unknown routing mode: {mode}")
+    index = _routing_indexes.get(mode)
+    if index is not None and mode not in _stale_indexes:
+        return index
+    if index is None:
+        _index_build_lock.acquire()
+    elif not _index_build_lock.acquire(blocking=False):
+        return index  # the stale index serves until its replacement is in
+    try:
+        return _build_routing_index(mode)
+    finally:
+        _index_build_lock.release()
+
+
+def _build_routing_index(mode):
+    # Builds from a registry snapshot without holding any lock, then replays
+    # the changes made meanwhile and swaps the new index in.
+    load_ai_database()
+    with _index_lock:
+        index = _routing_indexes.get(mode)
+        if index is not None and mode not in _stale_indexes:
+            return index
+        backlog = _index_backlogs[mode] = []
+    try:
+        while True:
+            index = ROUTING_INDEXES[mode]()
+            index.rebuild(list_ais(decrypt=False))
+            with _index_lock:
+                changes, backlog[:] = list(backlog), []
+                if all(event != 'reload' for event, _, _ in changes):
+                    for change in changes:
+                        _apply_index_change(index, *change)
+                    _routing_indexes[mode] = index
+                    _stale_indexes.discard(mode)
+                    return index
+    finally:
+        with _index_lock:
+            del _index_backlogs[mode]
+
+
+def _resolve_ranking(ranking):
+    ranked = []
+    for ai_id, score in ranking:
+        ai = get_ai(ai_id, decrypt=False)
+        if ai:
+            ranked.append({'id': ai_id, **ai})
+    return ranked
+
+
+def rank_ais(analyzed_input, top_k=1, mode=None):
+    # Picks up changes written by other processes before consulting the index.
+    with stage('registry'):
+        load_ai_database()
+    with stage('select'):
+        index = get_routing_index(mode)
+        ranking = index.search(analyzed_input['tokens'], _candidate_count(top_k))
+        return _resolve_ranking(_breakers.order(ranking)[:top_k])
+
+
+def rank_ais_batch(analyzed_inputs, top_k=1, mode=None):
+    load_ai_database()
+    index = get_routing_index(mode)
+    token_lists = [analyzed_input['tokens'] for analyzed_input in analyzed_inputs]
+    candidates = _candidate_count(top_k)
+    if hasattr(index, 'search_many'):
+        rankings = index.search_many(token_lists, candidates)
+    else:
+        rankings = [index.search(tokens, candidates) for tokens in token_lists]
+    return [_resolve_ranking(_breakers.order(ranking)[:top_k]) for ranking in rankings]
+
+
+def _candidate_count(top_k):
+    return top_k + ROUTING_CANDIDATES if _breakers.enabled else top_k
+
+
+def select_ai(analyzed_input, mode=None, top_k=None):
+    ranked = rank_ais(analyzed_input, top_k or 1, mode)
+    if top_k is not None:
+        return ranked
+    return ranked[0] if ranked else None
+
+
 def process_with_ai(ai_info, analyzed_input):
+    try:
+        return call_ai(ai_info, analyzed_input)
+    except BackendError as e:
+        return str(e)
+
+
+def call_ai_cached(ai_info, analyzed_input, end=None):
+    # end is the caller's deadline (time.monotonic()), if it has one.
+    use_cache = _response_cache.enabled and is_cacheable(ai_info)
+    coalesce = detail_flag(ai_info, 'coalesce', COALESCE_REQUESTS)
+    if not use_cache and not coalesce:
+        return call_ai(ai_info, analyzed_input)
+
+    key = cache_key(ai_info, analyzed_input)
+    if use_cache:
+        hit, output = _response_cache.get(key)
+        if hit:
+            return output
+    if coalesce:
+        # Identical requests already in flight share that call's result.
+        timeout = COALESCE_TIMEOUT if end is None else min(COALESCE_TIMEOUT, max(end - time.monotonic(), 0))
+        try:
+            return _single_flight.do(key, _call_and_store, ai_info, analyzed_input, key, use_cache,
+                                     timeout=timeout)
+        except TimeoutError:
+            raise BackendTimeout(f"Error: {ai_info['name']} did not answer an identical request in time")
+    return _call_and_store(ai_info, analyzed_input, key, use_cache)
+
+
+def _call_and_store(ai_info, analyzed_input, key, use_cache):
+    output = call_ai(ai_info, analyzed_input)
+    if use_cache:
+        _response_cache.put(key, output)
+    return output
+
+
+def call_ai(ai_info, analyzed_input):
+    return _call_guarded(ai_info, _call_backend, ai_info, analyzed_input)
+
+
+def _call_guarded(ai_info, call, *args):
+    # Runs call(*args) as one call to ai_info's backend; a whole batch counts
+    # as one call too.
+    labels = {'ai': ai_info['id'], 'type': ai_info['type']}
+    limiter = get_limiter(ai_info['id'], ai_info['details'])
+    if limiter is None:
+        return _call_admitted(ai_info, labels, call, *args)
+    admit_call(ai_info, limiter, labels)
+    try:
+        return _call_admitted(ai_info, labels, call, *args)
+    finally:
+        limiter.release()
+
+
+# admit_call (or admit_call_async), begin_call and end_call wrap every backend
+# call, sync, async, streamed or batched: admission, then the breaker, then
+# metrics and the breaker's record.
+def admit_call(ai_info, limiter, labels):
+    try:
+        limiter.acquire()
+    except Overloaded as e:
+        ai_errors.inc(kind='overloaded', **labels)
+        raise BackendOverloaded(f"Error: {ai_info['name']} is overloaded: {str(e)}", e.retry_after)
+
+
+async def admit_call_async(ai_info, limiter, labels):
+    try:
+        await limiter.acquire_async()
+    except Overloaded as e:
+        ai_errors.inc(kind='overloaded', **labels)
+        raise BackendOverloaded(f"Error: {ai_info['name']} is overloaded: {str(e)}", e.retry_after)
+
+
+def begin_call(ai_info, labels):
+    # Returns the call's start time, or raises if the breaker rejects it.
+    if not _breakers.allow(ai_info['id']):
+        ai_errors.inc(kind='rejected', **labels)
+        raise BackendUnavailable(f"Error: {ai_info['name']} is temporarily unavailable")
+    ai_in_flight.inc(**labels)
+    return time.perf_counter()
+
+
+def end_call(ai_info, labels, start, error=None, latency=None):
+    # latency is what the breaker judges the call by; the whole call by default.
+    elapsed = time.perf_counter() - start
+    if isinstance(error, BackendTimeout):
+        ai_errors.inc(kind='timeout', **labels)
+    elif isinstance(error, BackendError):
+        ai_errors.inc(kind='error', **labels)
+    ai_in_flight.dec(**labels)
+    ai_request_seconds.observe(elapsed, **labels)
+    _breakers.record(ai_info['id'], elapsed if latency is None else latency, error is not None)
+
+
+def abandon_call(ai_info, labels):
+    # In place of end_call for a call that never finished: its time says
+    # nothing about the backend, so neither the breaker nor the latency
+    # metric sees it.
+    ai_in_flight.dec(**labels)
+    _breakers.abandon(ai_info['id'])
+
+
+def _call_admitted(ai_info, labels, call, *args):
+    start = begin_call(ai_info, labels)
+    error = None
+    try:
+        with stage('backend'):
+            return call(*args)
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        end_call(ai_info, labels, start, error)
+
+
+def _call_backend(ai_info, analyzed_input):
     if ai_info['type'] == 'API':
         return process_with_api(ai_info, analyzed_input)
     elif ai_info['type'] == 'Bot':
@@ -32,61 +514,310 @@ def process_with_ai(ai_info, analyzed_input):
     elif ai_info['type'] == 'Custom AI':
         return process_with_custom_ai(ai_info, analyzed_input)
     else:
-        return "Unsupported AI type"
+        raise BackendError("Unsupported AI type")
+
+
+def api_key_for(ai_info):
+    try:
+        return get_api_key(ai_info)
+    except ValueError as e:
+        raise BackendError(f"Error from API: {str(e)}")
 
 
 def process_with_api(ai_info, analyzed_input):
-    api_key = ai_info['details']['api_key']
+    api_key = api_key_for(ai_info)
     endpoint = ai_info['details']['endpoint']
     headers = {'Authorization': f'Bearer {api_key}'}
     data = {'input': analyzed_input['original_input']}
 
     try:
-        response = requests.post(endpoint, headers=headers, json=data, timeout=30)
+        response = get_api_client(ai_info['id'], ai_info['details']).post(endpoint, headers=headers, json=data)
         response.raise_for_status()
         return response.json().get('output', 'No output from API')
-    except requests.RequestException as e:
-        return f"Error from API: {str(e)}"
+    except requests.Timeout as e:
+        raise BackendTimeout(f"Error from API: {str(e)}")
+    except (requests.RequestException, ValueError) as e:
+        raise BackendError(f"Error from API: {str(e)}")
 
 
 def process_with_bot(ai_info, analyzed_input):
-    bot_file = ai_info['details']['file_path']
-    try:
-        spec = importlib.util.spec_from_file_location("bot_module", bot_file)
-        bot_module = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(bot_module)
-
-        if hasattr(bot_module, 'process'):
-            return bot_module.process(analyzed_input['original_input'])
-        else:
-            return "Error: Bot file does not have a 'process' function"
-    except Exception as e:
-        return f"Error processing with bot: {str(e)}"
+    return _run_plugin(ai_info, analyzed_input, 'bot', 'Bot')
 
 
 def process_with_local_ai(ai_info, analyzed_input):
-    command = ai_info['details']['command']
-    full_command = f"{command} '{analyzed_input['original_input']}'"
+    details = ai_info['details']
+    if details.get('mode') == 'persistent':
+        try:
+            return get_worker_pool(ai_info['id'], details).call(analyzed_input['original_input'])
+        except LocalWorkerTimeout:
+            raise BackendTimeout("Error: Local AI process timed out")
+        except (LocalWorkerError, OSError) as e:
+            raise BackendError(f"Error running local AI: {str(e)}")
+
+    command = split_command(details['command']) + [analyzed_input['original_input']]
+    timeout = float(details.get('timeout', DEFAULT_TIMEOUT))
 
     try:
-        result = subprocess.run(full_command, shell=True, check=True, capture_output=True, text=True, timeout=30)
+        result = subprocess.run(command, check=True, capture_output=True, text=True, timeout=timeout)
         return result.stdout
     except subprocess.CalledProcessError as e:
-        return f"Error running local AI: {e.stderr}"
+        raise BackendError(f"Error running local AI: {e.stderr}")
     except subprocess.TimeoutExpired:
-        return "Error: Local AI process timed out"
+        raise BackendTimeout("Error: Local AI process timed out")
+    except OSError as e:
+        raise BackendError(f"Error running local AI: {str(e)}")
 
 
 def process_with_custom_ai(ai_info, analyzed_input):
-    custom_ai_file = ai_info['details']['file_path']
+    return _run_plugin(ai_info, analyzed_input, 'custom AI', 'Custom AI')
+
+
+def _runs_in_pool(ai_info):
+    return ai_info['details'].get('execution', PLUGIN_EXECUTION) == 'process'
+
+
+def _pooled_plugins():
+    plugins = []
+    for ai in list_ais(decrypt=False):
+        if ai['type'] in ('Bot', 'Custom AI') and _runs_in_pool(ai) and 'file_path' in ai['details']:
+            try:
+                affinity = plugin_config(ai['details'])[1]
+            except (TypeError, ValueError):
+                continue  # Its calls report the bad setting.
+            plugins.append((ai['id'], ai['details']['file_path'], affinity))
+    return plugins
+
+
+def warm_plugin_pool():
+    # Starts the worker processes (which pre-import their plugins) if anything uses them.
+    if PLUGIN_EXECUTION == 'process' or _pooled_plugins():
+        get_plugin_pool(_pooled_plugins)
+
+
+def _run_plugin(ai_info, analyzed_input, label, kind):
+    details = ai_info['details']
+    if _runs_in_pool(ai_info):
+        try:
+            timeout, affinity = plugin_config(details)
+        except (TypeError, ValueError) as e:
+            raise BackendError(f"Error: invalid {kind} settings: {str(e)}")
+        try:
+            return get_plugin_pool(_pooled_plugins).call(
+                ai_info['id'], details['file_path'], analyzed_input['original_input'],
+                timeout=timeout, affinity=affinity)
+        except PluginTimeout:
+            raise BackendTimeout(f"Error: {kind} process timed out")
+        except PluginMissingProcess:
+            raise BackendError(f"Error: {kind} file does not have a 'process' function")
+        except PluginWorkerError as e:
+            raise BackendError(f"Error processing with {label}: {str(e)}")
+
+    try:
+        module = _plugin_cache.load(ai_info['id'], details['file_path'])
+    except Exception as e:
+        raise BackendError(f"Error processing with {label}: {str(e)}")
+
+    if not hasattr(module, 'process'):
+        raise BackendError(f"Error: {kind} file does not have a 'process' function")
     try:
-        spec = importlib.util.spec_from_file_location("custom_ai_module", custom_ai_file)
-        custom_ai_module = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(custom_ai_module)
+        return _collect(module.process(analyzed_input['original_input']))
+    except Exception as e:
+        raise BackendError(f"Error processing with {label}: {str(e)}")
+
+
+def _collect(output):
+    # Plugins may return a generator of chunks; non-streaming callers get it joined.
+    if isinstance(output, Iterator):
+        return ''.join(str(chunk) for chunk in output)
+    return output
 
-        if hasattr(custom_ai_module, 'process'):
-            return custom_ai_module.process(analyzed_input['original_input'])
+
+def stream_with_ai(ai_info, analyzed_input):
+    # Admission and the breaker are checked here, before anything is sent, so
+    # callers can still answer 429/503; the returned iterator holds the slot
+    # until it is exhausted or closed and records the outcome.
+    labels = {'ai': ai_info['id'], 'type': ai_info['type']}
+    limiter = get_limiter(ai_info['id'], ai_info['details'])
+    if limiter is not None:
+        admit_call(ai_info, limiter, labels)
+    try:
+        start = begin_call(ai_info, labels)
+    except BackendUnavailable:
+        if limiter is not None:
+            limiter.release()
+        raise
+    return BackendStream(ai_info, analyzed_input, limiter, labels, start)
+
+
+class BackendStream:
+    # The breaker sees the time to the first chunk, since a long answer is
+    # not a slow backend; the latency metric covers the whole stream.
+    def __init__(self, ai_info, analyzed_input, limiter, labels, start):
+        self.ai_info = ai_info
+        self._limiter = limiter
+        self._labels = labels
+        self._start = start
+        self._first_chunk = None
+        self._finished = False
+        try:
+            self._chunks = iter(_stream_backend(ai_info, analyzed_input))
+        except Exception as e:
+            self._chunks = iter(())
+            self._finish(e)
+            raise
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            chunk = next(self._chunks)
+        except StopIteration:
+            self._finish()
+            raise
+        except Exception as e:
+            self._finish(e)
+            raise
+        if self._first_chunk is None:
+            self._first_chunk = time.perf_counter() - self._start
+        return chunk
+
+    def close(self):
+        # Closed early (e.g. the client went away): the stream has no outcome.
+        if not self._finished:
+            if hasattr(self._chunks, 'close'):
+                self._chunks.close()
+            self._finish(abandoned=True)
+
+    def _finish(self, error=None, abandoned=False):
+        if self._finished:
+            return
+        self._finished = True
+        if abandoned:
+            abandon_call(self.ai_info, self._labels)
+        else:
+            end_call(self.ai_info, self._labels, self._start, error, self._first_chunk)
+        if self._limiter is not None:
+            self._limiter.release()
+
+
+def _stream_backend(ai_info, analyzed_input):
+    if ai_info['type'] == 'API':
+        return stream_with_api(ai_info, analyzed_input)
+    elif ai_info['type'] == 'Bot':
+        return _stream_plugin(ai_info, analyzed_input, 'bot', 'Bot')
+    elif ai_info['type'] == 'Local AI':
+        return stream_with_local_ai(ai_info, analyzed_input)
+    elif ai_info['type'] == 'Custom AI':
+        return _stream_plugin(ai_info, analyzed_input, 'custom AI', 'Custom AI')
+    else:
+        raise BackendError("Unsupported AI type")
+
+
+def stream_with_api(ai_info, analyzed_input):
+    api_key = api_key_for(ai_info)
+    endpoint = ai_info['details']['endpoint']
+    headers = {'Authorization': f'Bearer {api_key}', 'Accept': 'text/event-stream, application/json, text/plain'}
+    data = {'input': analyzed_input['original_input'], 'stream': True}
+
+    try:
+        response = get_api_client(ai_info['id'], ai_info['details']).post(
+            endpoint, headers=headers, json=data, stream=True)
+        response.raise_for_status()
+    except requests.RequestException as e:
+        raise BackendError(f"Error from API: {str(e)}")
+
+    try:
+        content_type = response.headers.get('Content-Type', '')
+        if content_type.startswith('application/json'):
+            yield response.json().get('output', 'No output from API')
+        elif content_type.startswith('text/event-stream'):
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith('data:'):
+                    continue
+                chunk = line[5:].strip()
+                try:
+                    payload = json.loads(chunk)
+                except ValueError:
+                    yield chunk
+                    continue
+                if isinstance(payload, dict):
+                    chunk = payload.get('chunk', payload.get('output'))
+                    if chunk is not None:
+                        yield chunk
+                else:
+                    yield str(payload)
+        else:
+            response.encoding = response.encoding or 'utf-8'
+            for chunk in response.iter_content(chunk_size=None, decode_unicode=True):
+                if chunk:
+                    yield chunk
+    except (requests.RequestException, ValueError) as e:
+        raise BackendError(f"Error from API: {str(e)}")
+    finally:
+        response.close()
+
+
+def stream_with_local_ai(ai_info, analyzed_input):
+    details = ai_info['details']
+    if details.get('mode') == 'persistent':
+        # The worker protocol answers with one message, so it arrives as one chunk.
+        yield process_with_local_ai(ai_info, analyzed_input)
+        return
+
+    command = split_command(details['command']) + [analyzed_input['original_input']]
+    timeout = float(details.get('timeout', DEFAULT_TIMEOUT))
+
+    with tempfile.TemporaryFile() as stderr:
+        try:
+            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr, text=True, bufsize=1)
+        except OSError as e:
+            raise BackendError(f"Error running local AI: {str(e)}")
+        timed_out = threading.Event()
+
+        def kill():
+            timed_out.set()
+            process.kill()
+
+        timer = threading.Timer(timeout, kill)
+        timer.start()
+        try:
+            for line in process.stdout:
+                yield line
+            process.wait()
+        finally:
+            timer.cancel()
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            process.stdout.close()
+
+        if timed_out.is_set():
+            raise BackendTimeout("Error: Local AI process timed out")
+        if process.returncode != 0:
+            stderr.seek(0)
+            raise BackendError(f"Error running local AI: {stderr.read().decode(errors='replace')}")
+
+
+def _stream_plugin(ai_info, analyzed_input, label, kind):
+    if _runs_in_pool(ai_info):
+        # Pooled plugins return their whole output at once.
+        yield _run_plugin(ai_info, analyzed_input, label, kind)
+        return
+
+    try:
+        module = _plugin_cache.load(ai_info['id'], ai_info['details']['file_path'])
+    except Exception as e:
+        raise BackendError(f"Error processing with {label}: {str(e)}")
+
+    if not hasattr(module, 'process'):
+        raise BackendError(f"Error: {kind} file does not have a 'process' function")
+    try:
+        output = module.process(analyzed_input['original_input'])
+        if isinstance(output, Iterator):
+            for chunk in output:
+                yield str(chunk)
         else:
-            return "Error: Custom AI file does not have a 'process' function"
+            yield output
     except Exception as e:
-        return f"Error processing with custom AI: {str(e)}"
\ No newline at end of file
+        raise BackendError(f"Error processing with {label}: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,213 @@
+import atexit
+import json
+import os
+import queue
+import shlex
+import subprocess
+import threading
+import time
+
+DEFAULT_POOL_SIZE = int(os.getenv('LOCAL_AI_POOL_SIZE', '1'))
+DEFAULT_TIMEOUT = float(os.getenv('LOCAL_AI_TIMEOUT', '30'))
+HEALTH_CHECK_INTERVAL = float(os.getenv('LOCAL_AI_HEALTH_CHECK_INTERVAL', '30'))
+HEALTH_CHECK_TIMEOUT = float(os.getenv('LOCAL_AI_HEALTH_CHECK_TIMEOUT', '5'))
+
+
+class LocalWorkerError(Exception):
+    pass
+
+
+class LocalWorkerTimeout(LocalWorkerError):
+    pass
+
+
+def split_command(command):
+    return shlex.split(command, posix=os.name != 'nt')
+
+
+class LocalWorker:
+    # Speaks one JSON object per line: {"input": ...} or {"ping": true} on stdin,
+    # {"output": ...}, {"error": ...} or {"pong": true} on stdout.
+    def __init__(self, argv):
+        self.process = subprocess.Popen(
+            argv, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, bufsize=1)
+        self.last_used = time.monotonic()
+        self._lines = queue.Queue()
+        threading.Thread(target=self._read_stdout, daemon=True).start()
+
+    def _read_stdout(self):
+        for line in self.process.stdout:
+            self._lines.put(line)
+        self._lines.put(None)
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def request(self, message, timeout):
+        try:
+            self.process.stdin.write(json.dumps(message) + '\n')
+            self.process.stdin.flush()
+        except OSError as e:
+            raise LocalWorkerError(f"Local AI worker is not accepting input: {e}")
+
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                line = self._lines.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                raise LocalWorkerTimeout("Local AI worker timed out")
+            if line is None:
+                raise LocalWorkerError(f"Local AI worker exited with code {self.process.wait()}")
+            try:
+                reply = json.loads(line)
+            except ValueError:
+                # Anything that is not a protocol message is treated as log output.
+                continue
+            if isinstance(reply, dict):
+                self.last_used = time.monotonic()
+                return reply
+
+    def ping(self):
+        try:
+            return self.request({'ping': True}, HEALTH_CHECK_TIMEOUT).get('pong', False)
+        except LocalWorkerError:
+            return False
+
+    def close(self, kill=False):
+        if kill and self.alive():
+            self.process.kill()
+            self.process.wait()
+        elif self.alive():
+            try:
+                self.process.stdin.close()
+                self.process.wait(timeout=1)
+            except (OSError, subprocess.TimeoutExpired):
+                self.process.kill()
+                self.process.wait()
+
+
+class LocalWorkerPool:
+    def __init__(self, argv, size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT):
+        self.argv = argv
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._workers = set()
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _spawn(self):
+        worker = LocalWorker(self.argv)
+        with self._lock:
+            if not self._closed:
+                self._workers.add(worker)
+                return worker
+        worker.close(kill=True)
+        raise LocalWorkerError("Local AI worker pool is closed")
+
+    def _release(self, worker):
+        # A worker that finishes after close() (or a config change) replaced
+        # the pool is shut down instead of going back to the idle queue.
+        with self._lock:
+            if not self._closed:
+                self._idle.put(worker)
+                return
+            self._workers.discard(worker)
+        worker.close()
+
+    def _discard(self, worker, kill=False):
+        with self._lock:
+            self._workers.discard(worker)
+        worker.close(kill)
+
+    def _checkout(self):
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                return self._spawn()
+            if not worker.alive():
+                self._discard(worker)
+                continue
+            if time.monotonic() - worker.last_used > HEALTH_CHECK_INTERVAL and not worker.ping():
+                self._discard(worker, kill=True)
+                continue
+            return worker
+
+    def call(self, text):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise LocalWorkerTimeout("Timed out waiting for a free Local AI worker")
+        try:
+            if self._closed:
+                raise LocalWorkerError("Local AI worker pool is closed")
+            worker = self._checkout()
+            try:
+                reply = worker.request({'input': text}, self.timeout)
+            except LocalWorkerError:
+                # Replace the broken worker right away so the next call finds it loaded.
+                self._discard(worker, kill=True)
+                if not self._closed:
+                    try:
+                        self._release(self._spawn())
+                    except LocalWorkerError:
+                        pass  # Closed meanwhile.
+                raise
+            self._release(worker)
+        finally:
+            self._slots.release()
+
+        if 'error' in reply:
+            raise LocalWorkerError(reply['error'])
+        return reply.get('output', '')
+
+    def close(self):
+        # Workers busy with a call are closed by _release when it finishes.
+        with self._lock:
+            self._closed = True
+            workers = list(self._workers)
+            self._workers.clear()
+        for worker in workers:
+            worker.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_worker_pool(ai_id, details):
+    config = (
+        details['command'],
+        int(details.get('pool_size', DEFAULT_POOL_SIZE)),
+        float(details.get('timeout', DEFAULT_TIMEOUT)),
+    )
+    with _pools_lock:
+        entry = _pools.get(ai_id)
+        if entry is not None and entry[0] == config:
+            return entry[1]
+        pool = LocalWorkerPool(split_command(config[0]), size=config[1], timeout=config[2])
+        _pools[ai_id] = (config, pool)
+    if entry is not None:
+        entry[1].close()
+    return pool
+
+
+def close_worker_pool(ai_id):
+    with _pools_lock:
+        entry = _pools.pop(ai_id, None)
+    if entry is not None:
+        entry[1].close()
+
+
+def retain_worker_pools(ai_ids):
+    with _pools_lock:
+        stale = [ai_id for ai_id in _pools if ai_id not in ai_ids]
+    for ai_id in stale:
+        close_worker_pool(ai_id)
+
+
+def close_all_worker_pools():
+    retain_worker_pools(set())
+
+
+atexit.register(close_all_worker_pools)
@@ -2,13 +2,117 @@ import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import requests
 import json
-import threading
-import speech_recognition as sr
+import queue
 import os
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from voice_input import VoicePipeline, RecognizerUnavailable, create_recognizer, create_source
 
 load_dotenv()
 
+REQUEST_TIMEOUT = 10
+# Connect and between-chunk read timeouts for streamed /process calls.
+STREAM_TIMEOUT = (5, 60)
+CLIENT_WORKERS = int(os.getenv("CLIENT_WORKERS", "4"))
+UI_POLL_MS = 50
+# AIs fetched per /list_ais page in the manager window.
+LIST_PAGE_SIZE = 50
+
+
+def error_message(error):
+    # Prefers the backend's own {"error": ...} message over the HTTP status line.
+    response = getattr(error, 'response', None)
+    if response is not None:
+        try:
+            message = response.json().get('error')
+        except ValueError:
+            message = None
+        if message:
+            retry_after = response.headers.get('Retry-After')
+            return f"{message} (retry after {retry_after}s)" if retry_after else message
+    return str(error)
+
+
+def iter_sse(response):
+    event, data = None, []
+    for line in response.iter_lines(decode_unicode=True):
+        if not line:
+            if data:
+                yield event or 'message', json.loads('\n'.join(data))
+            event, data = None, []
+        elif line.startswith('event:'):
+            event = line[6:].strip()
+        elif line.startswith('data:'):
+            data.append(line[5:].strip())
+
+
+class BackendClient:
+    # Runs backend calls on worker threads over one keep-alive session. Their
+    # callbacks are queued and run on the Tk thread by a poll loop, so widgets
+    # are only ever touched from the main thread.
+    def __init__(self, root, base_url, workers=CLIENT_WORKERS):
+        self.root = root
+        self.base_url = base_url
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='backend')
+        self._callbacks = queue.Queue()
+        self.root.after(UI_POLL_MS, self._drain)
+
+    def call_in_ui(self, callback, *args):
+        # Safe from any thread.
+        self._callbacks.put((callback, args))
+
+    def _drain(self):
+        while True:
+            try:
+                callback, args = self._callbacks.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                callback(*args)
+            except tk.TclError:
+                pass  # The window the callback was for has been closed.
+        self.root.after(UI_POLL_MS, self._drain)
+
+    def request(self, method, path, on_success, on_error, **kwargs):
+        def run():
+            try:
+                response = self.session.request(method, f"{self.base_url}{path}", timeout=REQUEST_TIMEOUT, **kwargs)
+                response.raise_for_status()
+                # 304 Not Modified: what the caller already has is current.
+                result = None if response.status_code == 304 else response.json()
+            except (requests.RequestException, ValueError) as e:
+                self.call_in_ui(on_error, error_message(e))
+            else:
+                self.call_in_ui(on_success, result)
+        return self._executor.submit(run)
+
+    def get(self, path, on_success, on_error, **kwargs):
+        return self.request('GET', path, on_success, on_error, **kwargs)
+
+    def post(self, path, on_success, on_error, **kwargs):
+        return self.request('POST', path, on_success, on_error, **kwargs)
+
+    def stream(self, path, on_event, on_error, **kwargs):
+        # on_event(event, data) runs once per server-sent event.
+        def run():
+            try:
+                with self.session.post(f"{self.base_url}{path}", stream=True, timeout=STREAM_TIMEOUT,
+                                       **kwargs) as response:
+                    response.raise_for_status()
+                    for event, data in iter_sse(response):
+                        self.call_in_ui(on_event, event, data)
+            except (requests.RequestException, ValueError) as e:
+                self.call_in_ui(on_error, error_message(e))
+        return self._executor.submit(run)
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
+
 
 class MainApplication(tk.Tk):
     def __init__(self):
@@ -16,8 +120,11 @@ class MainApplication(tk.Tk):
         self.title("AI Integration Platform")
         self.geometry("800x600")
         self.create_widgets()
-        self.is_listening = False
+        self.voice_pipeline = None
         self.backend_url = os.getenv("BACKEND_URL", "http://localhost:5000")
+        self.client = BackendClient(self, self.backend_url)
+        self.request_count = 0
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
 
     def create_widgets(self):
         # Input frame
@@ -50,44 +157,65 @@ class MainApplication(tk.Tk):
         ai_manager_button = ttk.Button(button_frame, text="AI Manager", command=self.open_ai_manager)
         ai_manager_button.pack(side=tk.LEFT, padx=5)
 
-    def process_input(self):
-        user_input = self.input_entry.get()
-        if user_input:
-            try:
-                response = requests.post(f"{self.backend_url}/process", json={"input": user_input}, timeout=10)
-                response.raise_for_status()
-                output = response.json()['output']
-                self.output_text.insert(tk.END, f"Input: {user_input}\nOutput: {output}\n\n")
-            except requests.RequestException as e:
-                messagebox.showerror("Error", f"Failed to process input: {str(e)}")
-            finally:
-                self.input_entry.delete(0, tk.END)
+    def process_input(self, user_input=None):
+        if user_input is None:
+            user_input = self.input_entry.get()
+            self.input_entry.delete(0, tk.END)
+        if not user_input:
+            return
+
+        # Each request gets its own span in the output pane, between two marks,
+        # which shows its status and is filled in as the answer streams back.
+        self.request_count += 1
+        span = f"request-{self.request_count}"
+        self.output_text.insert(tk.END, f"Input: {user_input}\nOutput: \n\n")
+        self.output_text.mark_set(f"{span}.start", "end-3c")
+        self.output_text.mark_gravity(f"{span}.start", tk.LEFT)
+        self.output_text.mark_set(f"{span}.end", "end-3c")
+        self.output_text.mark_gravity(f"{span}.end", tk.RIGHT)
+        self.set_request_text(span, "(waiting for backend...)")
+        self.output_text.see(tk.END)
+        state = {'chunks': []}
+
+        def on_event(event, data):
+            if event == 'ai':
+                self.set_request_text(span, f"({data['name']} is answering...)")
+            elif event == 'message':
+                state['chunks'].append(data.get('chunk', ''))
+                self.set_request_text(span, ''.join(state['chunks']))
+            elif event == 'done':
+                self.set_request_text(span, data['output'])
+            elif event == 'error':
+                self.set_request_text(span, f"Error: {data['error']}")
+
+        def on_error(message):
+            self.set_request_text(span, f"Failed to process input: {message}")
+
+        self.client.stream('/process_stream', on_event, on_error, json={"input": user_input})
+
+    def set_request_text(self, span, text):
+        self.output_text.delete(f"{span}.start", f"{span}.end")
+        self.output_text.insert(f"{span}.start", text)
 
     def toggle_voice_input(self):
-        if self.is_listening:
-            self.is_listening = False
+        if self.voice_pipeline:
+            self.voice_pipeline.stop()
+            print(f"Voice input stats: {self.voice_pipeline.stats()}")
+            self.voice_pipeline = None
             self.voice_button.config(text="Start Voice Input")
-        else:
-            self.is_listening = True
-            self.voice_button.config(text="Stop Voice Input")
-            threading.Thread(target=self.voice_input_thread, daemon=True).start()
-
-    def voice_input_thread(self):
-        r = sr.Recognizer()
-        with sr.Microphone() as source:
-            while self.is_listening:
-                try:
-                    audio = r.listen(source, timeout=1, phrase_time_limit=5)
-                    text = r.recognize_google(audio)
-                    self.input_entry.delete(0, tk.END)
-                    self.input_entry.insert(0, text)
-                    self.process_input()
-                except sr.WaitTimeoutError:
-                    continue
-                except sr.UnknownValueError:
-                    print("Could not understand audio")
-                except sr.RequestError as e:
-                    print(f"Could not request results; {e}")
+            return
+        try:
+            recognizer = create_recognizer()
+        except RecognizerUnavailable as e:
+            messagebox.showerror("Error", f"Voice input is unavailable: {e}")
+            return
+        self.voice_pipeline = VoicePipeline(create_source(), recognizer, self.on_voice_text)
+        self.voice_pipeline.start()
+        self.voice_button.config(text="Stop Voice Input")
+
+    def on_voice_text(self, text, record):
+        # Called on the recognition thread.
+        self.client.call_in_ui(self.process_input, text)
 
     def open_add_ai_window(self):
         AddAIWindow(self)
@@ -95,6 +223,12 @@ class MainApplication(tk.Tk):
     def open_ai_manager(self):
         AIManagerWindow(self)
 
+    def on_close(self):
+        if self.voice_pipeline:
+            self.voice_pipeline.stop()
+        self.client.close()
+        self.destroy()
+
 class AddAIWindow(tk.Toplevel):
     def __init__(self, master):
         super().__init__(master)
@@ -183,68 +317,143 @@ class AddAIWindow(tk.Toplevel):
         elif ai_type == "Custom AI":
             details["file_path"] = self.custom_ai_file_entry.get()
 
-        try:
-            response = requests.post(f"{self.master.backend_url}/add_ai", json={
-                "name": name,
-                "type": ai_type,
-                "details": details
-            }, timeout=10)
-            response.raise_for_status()
-            messagebox.showinfo("Success", f"AI added successfully: {response.json()['message']}")
+        def on_success(result):
+            messagebox.showinfo("Success", f"AI added successfully: {result['message']}")
             self.destroy()
-        except requests.RequestException as e:
-            messagebox.showerror("Error", f"Failed to add AI: {str(e)}")
+
+        def on_error(message):
+            messagebox.showerror("Error", f"Failed to add AI: {message}")
+
+        self.master.client.post("/add_ai", on_success, on_error,
+                                json={"name": name, "type": ai_type, "details": details})
 
 class AIManagerWindow(tk.Toplevel):
+    # Loads the list a page at a time as it is scrolled, and refreshes it by
+    # applying the changes since the version it has.
     def __init__(self, master):
         super().__init__(master)
         self.title("AI Manager")
         self.geometry("600x400")
+        self.ai_ids = []
+        self.version = None
+        self.next_cursor = None
+        self.loading = False
         self.create_widgets()
         self.load_ais()
 
     def create_widgets(self):
-        self.ai_listbox = tk.Listbox(self, width=50)
-        self.ai_listbox.pack(pady=10, padx=10, fill=tk.BOTH, expand=True)
+        list_frame = ttk.Frame(self)
+        list_frame.pack(pady=10, padx=10, fill=tk.BOTH, expand=True)
+        self.scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.ai_listbox = tk.Listbox(list_frame, width=50, yscrollcommand=self.on_scroll)
+        self.ai_listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.scrollbar.config(command=self.ai_listbox.yview)
 
         button_frame = ttk.Frame(self)
         button_frame.pack(pady=10)
 
         ttk.Button(button_frame, text="Update", command=self.update_ai).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="Remove", command=self.remove_ai).pack(side=tk.LEFT, padx=5)
-        ttk.Button(button_frame, text="Refresh", command=self.load_ais).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Refresh", command=self.refresh).pack(side=tk.LEFT, padx=5)
+
+    def on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        if float(last) > 0.9 and self.next_cursor and not self.loading:
+            self.load_page()
+
+    def format_ai(self, ai):
+        return f"{ai['name']} ({ai['type']}) - {ai['id']}"
 
     def load_ais(self):
-        try:
-            response = requests.get(f"{self.master.backend_url}/list_ais", timeout=10)
-            response.raise_for_status()
-            ais = response.json()['ais']
-            self.ai_listbox.delete(0, tk.END)
-            for ai in ais:
-                self.ai_listbox.insert(tk.END, f"{ai['name']} ({ai['type']}) - {ai['id']}")
-        except requests.RequestException as e:
-            messagebox.showerror("Error", f"Failed to load AIs: {str(e)}")
+        self.ai_listbox.delete(0, tk.END)
+        self.ai_ids = []
+        self.version = None
+        self.next_cursor = None
+        self.load_page()
+
+    def load_page(self):
+        def on_success(result):
+            self.loading = False
+            # Changes made while paging are picked up by the next refresh,
+            # which asks for everything since the first page.
+            if self.version is None:
+                self.version = result['version']
+            self.next_cursor = result['next_cursor']
+            for ai in result['ais']:
+                self.ai_ids.append(ai['id'])
+                self.ai_listbox.insert(tk.END, self.format_ai(ai))
+
+        def on_error(message):
+            self.loading = False
+            self.next_cursor = None
+            self.version = None  # The next refresh starts over.
+            messagebox.showerror("Error", f"Failed to load AIs: {message}")
+
+        params = {"fields": "id,name,type", "limit": LIST_PAGE_SIZE}
+        if self.next_cursor:
+            params["cursor"] = self.next_cursor
+        self.loading = True
+        self.master.client.get("/list_ais", on_success, on_error, params=params)
+
+    def refresh(self):
+        if self.version is None:
+            self.load_ais()
+            return
+
+        def on_success(result):
+            if result is None:
+                return  # Not modified.
+            if result.get('reset'):
+                self.load_ais()
+                return
+            for change in result['changes']:
+                self.apply_change(change)
+            self.version = result['version']
+
+        def on_error(message):
+            messagebox.showerror("Error", f"Failed to refresh AIs: {message}")
+
+        self.master.client.get("/list_ais", on_success, on_error,
+                               params={"fields": "id,name,type", "since": self.version},
+                               headers={"If-None-Match": f'"{self.version}"'})
+
+    def apply_change(self, change):
+        if change['id'] in self.ai_ids:
+            index = self.ai_ids.index(change['id'])
+            selected = index in self.ai_listbox.curselection()
+            self.ai_listbox.delete(index)
+            if change['op'] == 'remove':
+                del self.ai_ids[index]
+                return
+            self.ai_listbox.insert(index, self.format_ai(change['ai']))
+            if selected:
+                self.ai_listbox.selection_set(index)
+        elif change['op'] == 'upsert' and self.next_cursor is None and not self.loading:
+            # New AIs come last; until the last page is loaded they arrive with it.
+            self.ai_ids.append(change['id'])
+            self.ai_listbox.insert(tk.END, self.format_ai(change['ai']))
 
     def update_ai(self):
         selected = self.ai_listbox.curselection()
         if selected:
-            ai_id = self.ai_listbox.get(selected[0]).split(" - ")[-1]
-            UpdateAIWindow(self, ai_id)
+            UpdateAIWindow(self, self.ai_ids[selected[0]])
         else:
             messagebox.showwarning("Warning", "Please select an AI to update.")
 
     def remove_ai(self):
         selected = self.ai_listbox.curselection()
         if selected:
-            ai_id = self.ai_listbox.get(selected[0]).split(" - ")[-1]
+            ai_id = self.ai_ids[selected[0]]
             if messagebox.askyesno("Confirm", "Are you sure you want to remove this AI?"):
-                try:
-                    response = requests.post(f"{self.master.backend_url}/remove_ai", json={"id": ai_id}, timeout=10)
-                    response.raise_for_status()
-                    messagebox.showinfo("Success", f"AI removed successfully: {response.json()['message']}")
-                    self.load_ais()
-                except requests.RequestException as e:
-                    messagebox.showerror("Error", f"Failed to remove AI: {str(e)}")
+                def on_success(result):
+                    messagebox.showinfo("Success", f"AI removed successfully: {result['message']}")
+                    self.refresh()
+
+                def on_error(message):
+                    messagebox.showerror("Error", f"Failed to remove AI: {message}")
+
+                self.master.client.post("/remove_ai", on_success, on_error, json={"id": ai_id})
         else:
             messagebox.showwarning("Warning", "Please select an AI to remove.")
 
@@ -269,14 +478,15 @@ class UpdateAIWindow(tk.Toplevel):
         submit_button.pack(pady=10)
 
     def load_ai_details(self):
-        try:
-            response = requests.get(f"{self.master.master.backend_url}/get_ai", params={"id": self.ai_id}, timeout=10)
-            response.raise_for_status()
-            ai_details = response.json()['ai']
+        def on_success(result):
+            ai_details = result['ai']
             self.description_text.insert(tk.END, ai_details['details'].get('description', ''))
             self.create_detail_fields(ai_details['type'], ai_details['details'])
-        except requests.RequestException as e:
-            messagebox.showerror("Error", f"Failed to load AI details: {str(e)}")
+
+        def on_error(message):
+            messagebox.showerror("Error", f"Failed to load AI details: {message}")
+
+        self.master.master.client.get("/get_ai", on_success, on_error, params={"id": self.ai_id})
 
     def create_detail_fields(self, ai_type, details):
         if ai_type == "API":
@@ -332,17 +542,16 @@ class UpdateAIWindow(tk.Toplevel):
         elif hasattr(self, 'custom_ai_file_entry'):
             details["file_path"] = self.custom_ai_file_entry.get()
 
-        try:
-            response = requests.post(f"{self.master.master.backend_url}/update_ai", json={
-                "id": self.ai_id,
-                "details": details
-            }, timeout=10)
-            response.raise_for_status()
-            messagebox.showinfo("Success", f"AI updated successfully: {response.json()['message']}")
-            self.master.load_ais()
+        def on_success(result):
+            messagebox.showinfo("Success", f"AI updated successfully: {result['message']}")
+            self.master.refresh()
             self.destroy()
-        except requests.RequestException as e:
-            messagebox.showerror("Error", f"Failed to update AI: {str(e)}")
+
+        def on_error(message):
+            messagebox.showerror("Error", f"Failed to update AI: {message}")
+
+        self.master.master.client.post("/update_ai", on_success, on_error,
+                                       json={"id": self.ai_id, "details": details})
 
 if __name__ == "__main__":
     app = MainApplication()
@@ -0,0 +1,227 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') == '1'
+METRICS_PREFIX = 'central_ai_'
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation):
+        self.name = METRICS_PREFIX + name
+        self.documentation = documentation
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def remove(self, **labels):
+        # Drops every series whose labels include the given ones.
+        wanted = set(labels.items())
+        with self._lock:
+            for key in [key for key in self._values if wanted <= set(key)]:
+                del self._values[key]
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[tuple(sorted(labels.items()))] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = tuple(sorted(labels.items()))
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                # Per-bucket counts (the last one is +Inf), then sum and count.
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self._lock:
+            series = [(key, list(counts), total, count) for key, (counts, total, count) in self._values.items()]
+        samples = []
+        for key, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                samples.append((f"{self.name}_bucket", key + (('le', le),), cumulative))
+            samples.append((f"{self.name}_sum", key, total))
+            samples.append((f"{self.name}_count", key, count))
+        return samples
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation):
+        return self._register(Counter(name, documentation))
+
+    def gauge(self, name, documentation):
+        return self._register(Gauge(name, documentation))
+
+    def histogram(self, name, documentation, buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, buckets))
+
+    def add_collector(self, collector):
+        # Collectors are called at scrape time and return metrics built from
+        # stats kept elsewhere (caches, worker queues).
+        self._collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            for metric in collector():
+                lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+stage_seconds = registry.histogram('stage_seconds', "Time spent in each /process stage.")
+http_requests = registry.counter('http_requests_total', "HTTP requests by route and status.")
+http_request_seconds = registry.histogram('http_request_seconds', "HTTP request latency by route.")
+http_in_flight = registry.gauge('http_requests_in_flight', "HTTP requests being handled, by route.")
+ai_request_seconds = registry.histogram('ai_request_seconds', "Backend call latency per AI.")
+ai_errors = registry.counter('ai_errors_total',
+                             "Failed backend calls per AI, by kind (error, timeout or rejected by the breaker).")
+ai_in_flight = registry.gauge('ai_requests_in_flight', "Backend calls in progress per AI.")
+
+
+def snapshot(name, kind, documentation, values):
+    # Builds a metric from already-aggregated values, for collectors.
+    metric = Gauge(name, documentation) if kind == 'gauge' else Counter(name, documentation)
+    metric._values = {tuple(sorted(labels.items())): value for labels, value in values}
+    return metric
+
+
+_local = threading.local()
+
+
+class _Stage:
+    __slots__ = ('name', 'timings', 'start')
+
+    def __init__(self, name, timings):
+        self.name = name
+        self.timings = timings
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        stage_seconds.observe(elapsed, stage=self.name)
+        if self.timings is not None:
+            self.timings[self.name] = self.timings.get(self.name, 0.0) + elapsed
+
+
+class _NoStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NO_STAGE = _NoStage()
+
+
+def stage(name):
+    timings = getattr(_local, 'timings', None)
+    if not METRICS_ENABLED and timings is None:
+        return _NO_STAGE
+    return _Stage(name, timings)
+
+
+def start_timing():
+    # Collects this thread's stage times for the current request. Stages run
+    # on other threads (e.g. hedged backend calls) are not included.
+    _local.timings = {}
+
+
+def finish_timing():
+    timings = getattr(_local, 'timings', None)
+    _local.timings = None
+    return timings or {}
+
+
+def server_timing(timings):
+    return ', '.join(f"{name};dur={seconds * 1000:.3f}" for name, seconds in timings.items())
+
+
+def render():
+    return registry.render()
@@ -1,15 +1,163 @@
-import pyttsx3
+import os
+import queue
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+from metrics import registry as metrics_registry, snapshot
 
+TTS_QUEUE_SIZE = int(os.getenv('TTS_QUEUE_SIZE', '8'))
+# 'drop_oldest', 'drop_newest' or 'coalesce' (keep only the newest utterance).
+TTS_OVERFLOW_POLICY = os.getenv('TTS_OVERFLOW_POLICY', 'drop_oldest')
+SPEECH_DIR = os.getenv('SPEECH_DIR', os.path.join(tempfile.gettempdir(), 'central_ai_speech'))
+SPEECH_RENDER_LIMIT = int(os.getenv('SPEECH_RENDER_LIMIT', '64'))
 
-def process_output(raw_output):
+
+class SpeechWorker:
+    # Owns the only TTS engine and feeds it from a bounded queue, so callers
+    # never wait for speech to finish.
+    def __init__(self, queue_size=TTS_QUEUE_SIZE, overflow_policy=TTS_OVERFLOW_POLICY):
+        self.overflow_policy = overflow_policy
+        self._queue = queue.Queue(queue_size)
+        self._renders = OrderedDict()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.spoken = 0
+        self.rendered = 0
+        self.dropped = 0
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='tts', daemon=True)
+                self._thread.start()
+
+    def say(self, text):
+        self._submit(('say', text, None))
+
+    def render(self, text):
+        speech_id = str(uuid.uuid4())
+        path = os.path.join(SPEECH_DIR, f"{speech_id}.wav")
+        with self._lock:
+            self._renders[speech_id] = {'status': 'pending', 'path': path}
+            while len(self._renders) > SPEECH_RENDER_LIMIT:
+                _, old = self._renders.popitem(last=False)
+                if os.path.exists(old['path']):
+                    os.remove(old['path'])
+        self._submit(('render', text, speech_id))
+        return speech_id
+
+    def get_render(self, speech_id):
+        with self._lock:
+            render = self._renders.get(speech_id)
+            return dict(render) if render else None
+
+    def _submit(self, job):
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(job)
+            return
+        except queue.Full:
+            pass
+
+        if self.overflow_policy == 'drop_newest':
+            self._drop(job)
+            return
+        while True:
+            try:
+                dropped = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            self._drop(dropped)
+            if self.overflow_policy != 'coalesce':
+                break
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            self._drop(job)
+
+    def _drop(self, job):
+        with self._lock:
+            self.dropped += 1
+            if job[0] == 'render' and job[2] in self._renders:
+                self._renders[job[2]]['status'] = 'dropped'
+
+    def _set_render_status(self, speech_id, status):
+        with self._lock:
+            if speech_id in self._renders:
+                self._renders[speech_id]['status'] = status
+
+    def start(self):
+        self._ensure_started()
+
+    def _run(self):
+        try:
+            import pyttsx3
+            engine = pyttsx3.init()
+        except Exception as e:
+            print(f"Error in text-to-speech conversion: {str(e)}")
+            engine = None
+
+        while True:
+            kind, text, speech_id = self._queue.get()
+            if engine is None:
+                if kind == 'render':
+                    self._set_render_status(speech_id, 'failed')
+                continue
+            try:
+                if kind == 'say':
+                    engine.say(text)
+                    engine.runAndWait()
+                    self.spoken += 1
+                else:
+                    os.makedirs(SPEECH_DIR, exist_ok=True)
+                    engine.save_to_file(text, self.get_render(speech_id)['path'])
+                    engine.runAndWait()
+                    self.rendered += 1
+                    self._set_render_status(speech_id, 'ready')
+            except Exception as e:
+                print(f"Error in text-to-speech conversion: {str(e)}")
+                if kind == 'render':
+                    self._set_render_status(speech_id, 'failed')
+
+    def stats(self):
+        return {
+            'queued': self._queue.qsize(),
+            'spoken': self.spoken,
+            'rendered': self.rendered,
+            'dropped': self.dropped,
+        }
+
+
+speech_worker = SpeechWorker()
+
+
+def _collect_metrics():
+    stats = speech_worker.stats()
+    return [
+        snapshot('speech_queue_depth', 'gauge', "Speech jobs waiting for the TTS engine.", [({}, stats['queued'])]),
+        snapshot('speech_jobs_total', 'counter', "Speech jobs by outcome.",
+                 [({'outcome': outcome}, stats[outcome]) for outcome in ('spoken', 'rendered', 'dropped')]),
+    ]
+
+
+metrics_registry.add_collector(_collect_metrics)
+
+
+def process_output(raw_output, speak=True):
     processed_output = f"Processed: {raw_output}"
+    if not speak:
+        return processed_output
+
+    # Text-to-speech conversion happens on the speech worker.
+    speech_worker.say(processed_output)
+
+    return processed_output
+
+
+def render_speech(processed_output):
+    return speech_worker.render(processed_output)
 
-    # Text-to-speech conversion
-    try:
-        engine = pyttsx3.init()
-        engine.say(processed_output)
-        engine.runAndWait()
-    except Exception as e:
-        print(f"Error in text-to-speech conversion: {str(e)}")
 
-    return processed_output
\ No newline at end of file
+def get_speech(speech_id):
+    return speech_worker.get_render(speech_id)
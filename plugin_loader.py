@@ -0,0 +1,76 @@
+import hashlib
+import importlib.util
+import os
+import threading
+from collections import OrderedDict
+
+PLUGIN_CACHE_SIZE = int(os.getenv('PLUGIN_CACHE_SIZE', '32'))
+
+
+def import_plugin(module_name, file_path):
+    spec = importlib.util.spec_from_file_location(module_name, file_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class PluginCache:
+    def __init__(self, max_size=PLUGIN_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._import_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def load(self, ai_id, file_path):
+        key = (ai_id, os.path.abspath(file_path))
+        stat = os.stat(file_path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        module = self._lookup(key, signature)
+        if module is not None:
+            return module
+
+        with self._import_lock:
+            module = self._lookup(key, signature)
+            if module is not None:
+                return module
+            with open(file_path, 'rb') as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+            with self._lock:
+                entry = self._entries.get(key)
+            # A touched but unchanged file keeps its already initialised module.
+            if entry is not None and entry['digest'] == digest:
+                entry['signature'] = signature
+                return entry['module']
+            module = import_plugin(f"plugin_{ai_id}".replace('-', '_'), file_path)
+            with self._lock:
+                self._entries[key] = {'module': module, 'signature': signature, 'digest': digest}
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+            return module
+
+    def _lookup(self, key, signature):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry['signature'] != signature:
+                return None
+            self._entries.move_to_end(key)
+            return entry['module']
+
+    def evict(self, ai_id, keep_path=None):
+        keep_path = os.path.abspath(keep_path) if keep_path else None
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == ai_id and key[1] != keep_path]:
+                del self._entries[key]
+
+    def retain(self, ai_ids):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] not in ai_ids]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
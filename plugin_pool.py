@@ -0,0 +1,243 @@
+import atexit
+import multiprocessing
+import os
+import threading
+import zlib
+from collections.abc import Iterator
+
+from plugin_loader import PluginCache
+
+# 'inline' runs Bot and Custom AI plugins in the web worker thread; 'process'
+# sends them to the plugin pool. An AI can override it with details['execution'].
+PLUGIN_EXECUTION = os.getenv('PLUGIN_EXECUTION', 'inline')
+PLUGIN_POOL_SIZE = int(os.getenv('PLUGIN_POOL_SIZE', str(os.cpu_count() or 1)))
+PLUGIN_TIMEOUT = float(os.getenv('PLUGIN_TIMEOUT', '30'))
+# Calls a worker serves before it is replaced, bounding leaks in plugin code (0 = never).
+PLUGIN_MAX_CALLS = int(os.getenv('PLUGIN_MAX_CALLS', '1000'))
+
+
+class PluginWorkerError(Exception):
+    pass
+
+
+class PluginTimeout(PluginWorkerError):
+    pass
+
+
+class PluginMissingProcess(PluginWorkerError):
+    pass
+
+
+def plugin_config(details):
+    # (timeout, affinity) from an AI's details; raises ValueError if malformed.
+    timeout = details.get('timeout')
+    affinity = details.get('affinity')
+    return (
+        float(timeout) if timeout is not None else None,
+        int(affinity) if affinity else None,
+    )
+
+
+def _serve(connection, preload):
+    # Runs in the worker process: imports its plugins up front, then answers
+    # (ai_id, file_path, text) requests until the pipe closes.
+    cache = PluginCache()
+    for ai_id, file_path in preload:
+        try:
+            cache.load(ai_id, file_path)
+        except Exception:
+            pass  # Reported by the first call instead.
+
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            return
+        if message is None:
+            return
+        ai_id, file_path, text = message
+        try:
+            module = cache.load(ai_id, file_path)
+            if not hasattr(module, 'process'):
+                reply = ('missing', None)
+            else:
+                output = module.process(text)
+                if isinstance(output, Iterator):
+                    output = ''.join(str(chunk) for chunk in output)
+                reply = ('ok', output)
+        except Exception as e:
+            reply = ('error', str(e))
+        try:
+            connection.send(reply)
+        except Exception as e:
+            connection.send(('error', f"Plugin output could not be returned: {e}"))
+
+
+class PluginWorker:
+    def __init__(self, context, preload):
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(target=_serve, args=(child_connection, preload), daemon=True)
+        self.process.start()
+        child_connection.close()
+        self.calls = 0
+
+    def call(self, ai_id, file_path, text, timeout):
+        self.calls += 1
+        try:
+            self.connection.send((ai_id, file_path, text))
+        except (OSError, ValueError) as e:
+            raise PluginWorkerError(f"Plugin worker is not accepting input: {e}")
+        if not self.connection.poll(timeout):
+            raise PluginTimeout("Plugin call timed out")
+        try:
+            status, value = self.connection.recv()
+        except (EOFError, OSError):
+            self.process.join(1)
+            raise PluginWorkerError(f"Plugin worker exited with code {self.process.exitcode}")
+
+        if status == 'missing':
+            raise PluginMissingProcess("Plugin file does not have a 'process' function")
+        if status == 'error':
+            raise PluginWorkerError(value)
+        return value
+
+    def close(self, kill=False):
+        if not kill:
+            try:
+                self.connection.send(None)
+                self.process.join(1)
+            except (OSError, ValueError):
+                pass
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.connection.close()
+
+
+class PluginPool:
+    # A fixed set of worker slots. An AI pinned to n workers (its affinity)
+    # only uses, and only pre-imports into, the same n slots every time.
+    def __init__(self, plugins=lambda: [], size=PLUGIN_POOL_SIZE, timeout=PLUGIN_TIMEOUT,
+                 max_calls=PLUGIN_MAX_CALLS):
+        self.plugins = plugins
+        self.size = size
+        self.timeout = timeout
+        self.max_calls = max_calls
+        self._context = multiprocessing.get_context('spawn')
+        self._workers = [None] * size
+        self._idle = set(range(size))
+        self._condition = threading.Condition()
+        self._closed = False
+        self.recycled = 0
+        self.timeouts = 0
+        for slot in range(size):
+            self._workers[slot] = self._spawn(slot)
+
+    def slots_for(self, ai_id, affinity=None):
+        if not affinity or affinity >= self.size:
+            return range(self.size)
+        start = zlib.crc32(ai_id.encode()) % self.size
+        return [(start + i) % self.size for i in range(affinity)]
+
+    def _spawn(self, slot):
+        preload = [(ai_id, file_path) for ai_id, file_path, affinity in self.plugins()
+                   if slot in self.slots_for(ai_id, affinity)]
+        return PluginWorker(self._context, preload)
+
+    def _acquire(self, slots, timeout):
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._closed or self._idle.intersection(slots), timeout):
+                raise PluginTimeout("Timed out waiting for a free plugin worker")
+            if self._closed:
+                raise PluginWorkerError("Plugin pool is closed")
+            slot = next(slot for slot in slots if slot in self._idle)
+            self._idle.discard(slot)
+            return slot
+
+    def _release(self, slot, replace=False, kill=False):
+        if replace:
+            # Stopping the old process and starting its replacement happen in
+            # the background; the slot is free again once the new one is up.
+            threading.Thread(target=self._replace, args=(slot, kill), daemon=True).start()
+            return
+        with self._condition:
+            self._idle.add(slot)
+            self._condition.notify_all()
+
+    def _replace(self, slot, kill):
+        try:
+            self._workers[slot].close(kill)
+            # Left empty if spawning fails; call() starts one on demand then.
+            self._workers[slot] = None
+            if not self._closed:
+                worker = self._workers[slot] = self._spawn(slot)
+                if self._closed:
+                    worker.close()
+        finally:
+            with self._condition:
+                self._idle.add(slot)
+                self._condition.notify_all()
+
+    def call(self, ai_id, file_path, text, timeout=None, affinity=None):
+        timeout = self.timeout if timeout is None else timeout
+        slot = self._acquire(self.slots_for(ai_id, affinity), timeout)
+        worker = self._workers[slot]
+        if worker is None:
+            try:
+                worker = self._workers[slot] = self._spawn(slot)
+            except Exception as e:
+                self._release(slot)
+                raise PluginWorkerError(f"Could not start a plugin worker: {e}")
+        try:
+            output = worker.call(ai_id, file_path, text, timeout)
+        except PluginTimeout:
+            # The plugin may be stuck; only killing its process stops it.
+            self.timeouts += 1
+            self._release(slot, replace=True, kill=True)
+            raise
+        except PluginWorkerError:
+            # A plugin exception leaves its worker usable; a dead worker is replaced.
+            self._release(slot, replace=not worker.process.is_alive(), kill=True)
+            raise
+        recycle = self.max_calls and worker.calls >= self.max_calls
+        if recycle:
+            self.recycled += 1
+        self._release(slot, replace=recycle)
+        return output
+
+    def stats(self):
+        with self._condition:
+            busy = self.size - len(self._idle)
+        return {'size': self.size, 'busy': busy, 'recycled': self.recycled, 'timeouts': self.timeouts}
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        # Slots being replaced close their own worker.
+        for worker in list(self._workers):
+            if worker is not None:
+                worker.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_plugin_pool(plugins=lambda: []):
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = PluginPool(plugins)
+        return _pool
+
+
+def close_plugin_pool():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.close()
+
+
+atexit.register(close_plugin_pool)
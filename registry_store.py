@@ -0,0 +1,294 @@
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+
+# Details fields that hold secrets. They are stored encrypted and, in SQLite,
+# kept out of the plain details column.
+SECRET_FIELDS = ('api_key',)
+
+
+class JsonRegistryStore:
+    # Not versioned: signatures only say whether the file changed.
+    versioned = False
+    instance = None
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def signature(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def load_all(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _write(self, database):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.ai_database.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(database, f, indent=2)
+            os.replace(temp_path, self.path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    def _modify(self, change):
+        with self._lock:
+            before = self.signature()
+            database = self.load_all()
+            result, changed = change(database)
+            if changed:
+                self._write(database)
+            return result, before, self.signature()
+
+    def put(self, ai_id, make_record):
+        # make_record() runs while the store is locked for the write.
+        def change(database):
+            record = database[ai_id] = make_record()
+            return record, True
+        return self._modify(change)
+
+    def update(self, ai_id, mutate):
+        def change(database):
+            if ai_id not in database:
+                return None, False
+            database[ai_id] = mutate(database[ai_id])
+            return database[ai_id], True
+        return self._modify(change)
+
+    def delete(self, ai_id):
+        def change(database):
+            record = database.pop(ai_id, None)
+            return record, record is not None
+        return self._modify(change)
+
+    def update_each(self, mutate):
+        # mutate(ai_id, record) returns the new record, or None to leave it.
+        def change(database):
+            changed = []
+            for ai_id, record in database.items():
+                record = mutate(ai_id, record)
+                if record is not None:
+                    database[ai_id] = record
+                    changed.append(ai_id)
+            return changed, bool(changed)
+        return self._modify(change)
+
+    def replace_all(self, database):
+        with self._lock:
+            before = self.signature()
+            self._write(database)
+            return before, self.signature()
+
+
+class SqliteRegistryStore:
+    versioned = True
+
+    def __init__(self, path, change_log_versions=1000):
+        self.path = path
+        self.change_log_versions = change_log_versions
+        self._local = threading.local()
+        connection = self._connection()
+        connection.execute('PRAGMA journal_mode=WAL')
+        with connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS ais ('
+                'id TEXT PRIMARY KEY, seq INTEGER NOT NULL, name TEXT NOT NULL, type TEXT NOT NULL, '
+                'details TEXT NOT NULL, secrets TEXT NOT NULL)')
+            connection.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+            # Ids changed by each version, so any worker can answer "what
+            # changed since version N" for the last change_log_versions versions.
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS changes (version INTEGER NOT NULL, id TEXT NOT NULL, '
+                'removed INTEGER NOT NULL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS changes_version ON changes (version)')
+            connection.execute("INSERT OR IGNORE INTO meta VALUES ('version', 0)")
+            connection.execute("INSERT OR IGNORE INTO meta VALUES ('seq', 0)")
+            # Names this database, so versions from a recreated file are not
+            # mistaken for versions of this one.
+            connection.execute("INSERT OR IGNORE INTO meta VALUES ('instance', ?)", (random.getrandbits(62),))
+            # The oldest version changes_since() can answer for.
+            connection.execute(
+                "INSERT OR IGNORE INTO meta SELECT 'changes_from', value FROM meta WHERE key = 'version'")
+        self.instance = connection.execute("SELECT value FROM meta WHERE key = 'instance'").fetchone()[0]
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    def signature(self):
+        return self._connection().execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+    @staticmethod
+    def _row_to_record(row):
+        name, ai_type, details, secrets = row
+        details = json.loads(details)
+        details.update(json.loads(secrets))
+        return {'name': name, 'type': ai_type, 'details': details}
+
+    @staticmethod
+    def _record_to_columns(record):
+        details = dict(record['details'])
+        secrets = {field: details.pop(field) for field in SECRET_FIELDS if field in details}
+        return record['name'], record['type'], json.dumps(details), json.dumps(secrets)
+
+    def load_all(self):
+        rows = self._connection().execute('SELECT id, name, type, details, secrets FROM ais ORDER BY seq')
+        return {row[0]: self._row_to_record(row[1:]) for row in rows}
+
+    def changes_since(self, version):
+        # [(version, id, removed)] after version, oldest first, or None if the
+        # log no longer reaches back that far.
+        connection = self._connection()
+        connection.execute('BEGIN')
+        try:
+            changes_from = connection.execute("SELECT value FROM meta WHERE key = 'changes_from'").fetchone()[0]
+            if version < changes_from:
+                return None
+            rows = connection.execute(
+                'SELECT version, id, removed FROM changes WHERE version > ? ORDER BY version', (version,))
+            return [(row[0], row[1], bool(row[2])) for row in rows]
+        finally:
+            connection.execute('COMMIT')
+
+    def load_changes(self, version):
+        # (signature, [(id, record, or None if removed)]) for the AIs changed
+        # after version, in the order they first changed, read as one
+        # snapshot; None if the log no longer reaches back that far.
+        connection = self._connection()
+        connection.execute('BEGIN')
+        try:
+            signature = self.signature()
+            changes_from = connection.execute("SELECT value FROM meta WHERE key = 'changes_from'").fetchone()[0]
+            if not changes_from <= version <= signature:
+                return None
+            ids = [row[0] for row in connection.execute(
+                'SELECT id FROM changes WHERE version > ? GROUP BY id ORDER BY min(rowid)', (version,))]
+            records = []
+            for ai_id in ids:
+                row = connection.execute(
+                    'SELECT name, type, details, secrets FROM ais WHERE id = ?', (ai_id,)).fetchone()
+                records.append((ai_id, self._row_to_record(row) if row else None))
+            return signature, records
+        finally:
+            connection.execute('COMMIT')
+
+    def _transaction(self, change):
+        # BEGIN IMMEDIATE takes the write lock up front, so the read inside
+        # the change and the version bump cannot interleave with another writer.
+        # change() returns (result, [(id, removed)] for the AIs it changed).
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            before = self.signature()
+            result, changed = change(connection)
+            if changed:
+                connection.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+                version = before + 1
+                connection.executemany('INSERT INTO changes VALUES (?, ?, ?)',
+                                       [(version, ai_id, int(removed)) for ai_id, removed in changed])
+                cutoff = version - self.change_log_versions
+                if cutoff > 0:
+                    connection.execute('DELETE FROM changes WHERE version <= ?', (cutoff,))
+                    connection.execute(
+                        "UPDATE meta SET value = max(value, ?) WHERE key = 'changes_from'", (cutoff,))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return result, before, self.signature()
+
+    def _upsert(self, connection, ai_id, record):
+        columns = self._record_to_columns(record)
+        updated = connection.execute(
+            'UPDATE ais SET name = ?, type = ?, details = ?, secrets = ? WHERE id = ?', (*columns, ai_id))
+        if updated.rowcount == 0:
+            connection.execute("UPDATE meta SET value = value + 1 WHERE key = 'seq'")
+            seq = connection.execute("SELECT value FROM meta WHERE key = 'seq'").fetchone()[0]
+            connection.execute('INSERT INTO ais VALUES (?, ?, ?, ?, ?, ?)', (ai_id, seq, *columns))
+
+    def put(self, ai_id, make_record):
+        # make_record() runs inside the write transaction.
+        def change(connection):
+            record = make_record()
+            self._upsert(connection, ai_id, record)
+            return record, [(ai_id, False)]
+        return self._transaction(change)
+
+    def update(self, ai_id, mutate):
+        def change(connection):
+            row = connection.execute(
+                'SELECT name, type, details, secrets FROM ais WHERE id = ?', (ai_id,)).fetchone()
+            if row is None:
+                return None, []
+            record = mutate(self._row_to_record(row))
+            self._upsert(connection, ai_id, record)
+            return record, [(ai_id, False)]
+        return self._transaction(change)
+
+    def delete(self, ai_id):
+        def change(connection):
+            row = connection.execute(
+                'SELECT name, type, details, secrets FROM ais WHERE id = ?', (ai_id,)).fetchone()
+            if row is None:
+                return None, []
+            connection.execute('DELETE FROM ais WHERE id = ?', (ai_id,))
+            return self._row_to_record(row), [(ai_id, True)]
+        return self._transaction(change)
+
+    def update_each(self, mutate):
+        # mutate(ai_id, record) returns the new record, or None to leave it.
+        # Runs in one write transaction, so no other writer's change is lost.
+        def change(connection):
+            rows = connection.execute('SELECT id, name, type, details, secrets FROM ais ORDER BY seq').fetchall()
+            changed = []
+            for row in rows:
+                record = mutate(row[0], self._row_to_record(row[1:]))
+                if record is not None:
+                    self._upsert(connection, row[0], record)
+                    changed.append(row[0])
+            return changed, [(ai_id, False) for ai_id in changed]
+        return self._transaction(change)
+
+    def replace_all(self, database):
+        def change(connection):
+            removed = [row[0] for row in connection.execute('SELECT id FROM ais') if row[0] not in database]
+            connection.executemany('DELETE FROM ais WHERE id = ?', [(ai_id,) for ai_id in removed])
+            for ai_id, record in database.items():
+                self._upsert(connection, ai_id, record)
+            return None, [(ai_id, True) for ai_id in removed] + [(ai_id, False) for ai_id in database]
+        return self._transaction(change)[1:]
+
+
+def migrate_json_to_sqlite(json_path, db_path):
+    source = JsonRegistryStore(json_path)
+    target = SqliteRegistryStore(db_path)
+    database = source.load_all()
+    # Secrets are copied as ciphertext; the encryption key stays the same.
+    target.replace_all(database)
+    return len(database)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 4 or sys.argv[1] != 'migrate':
+        print(f"usage: {sys.argv[0]} migrate <ai_database.json> <ai_registry.db>")
+        sys.exit(2)
+    count = migrate_json_to_sqlite(sys.argv[2], sys.argv[3])
+    print(f"Migrated {count} AI(s) from {sys.argv[2]} to {sys.argv[3]}")
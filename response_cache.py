@@ -0,0 +1,166 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', '0') == '1'
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '1024'))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv('RESPONSE_CACHE_MAX_BYTES', str(16 * 1024 * 1024)))
+RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', '300'))
+RESPONSE_CACHE_DB = os.getenv('RESPONSE_CACHE_DB')
+
+
+def normalize_input(user_input):
+    return ' '.join(user_input.lower().split())
+
+
+def config_version(ai_info):
+    record = {'name': ai_info['name'], 'type': ai_info['type'], 'details': ai_info['details']}
+    return hashlib.sha1(json.dumps(record, sort_keys=True).encode()).hexdigest()
+
+
+def cache_key(ai_info, analyzed_input):
+    return (ai_info['id'], config_version(ai_info), normalize_input(analyzed_input['original_input']))
+
+
+def detail_flag(ai_info, name, default=True):
+    return ai_info['details'].get(name, default) not in (False, 'false', '0', 0)
+
+
+def is_cacheable(ai_info):
+    return detail_flag(ai_info, 'cacheable')
+
+
+class DiskTier:
+    def __init__(self, path):
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'ai_id TEXT, version TEXT, input TEXT, output TEXT, expires_at REAL, '
+            'PRIMARY KEY (ai_id, version, input))')
+        self._connection.commit()
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def get(self, key):
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT output, expires_at FROM responses WHERE ai_id = ? AND version = ? AND input = ?',
+                key).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return json.loads(row[0]), row[1]
+
+    def put(self, key, output, expires_at):
+        try:
+            value = json.dumps(output)
+        except (TypeError, ValueError):
+            return
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)', (*key, value, expires_at))
+            self._writes += 1
+            if self._writes % 100 == 0:
+                self._connection.execute('DELETE FROM responses WHERE expires_at < ?', (time.time(),))
+            self._connection.commit()
+
+    def invalidate_ai(self, ai_id):
+        with self._lock:
+            self._connection.execute('DELETE FROM responses WHERE ai_id = ?', (ai_id,))
+            self._connection.commit()
+
+    def retain(self, ai_ids):
+        with self._lock:
+            stored = [row[0] for row in self._connection.execute('SELECT DISTINCT ai_id FROM responses')]
+            for ai_id in stored:
+                if ai_id not in ai_ids:
+                    self._connection.execute('DELETE FROM responses WHERE ai_id = ?', (ai_id,))
+            self._connection.commit()
+
+
+class ResponseCache:
+    def __init__(self, enabled=RESPONSE_CACHE_ENABLED, max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+                 max_bytes=RESPONSE_CACHE_MAX_BYTES, ttl=RESPONSE_CACHE_TTL, db_path=RESPONSE_CACHE_DB):
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._disk = DiskTier(db_path) if enabled and db_path else None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] >= now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[0]
+            if entry is not None:
+                self._pop(key)
+        if self._disk is not None:
+            stored = self._disk.get(key)
+            if stored is not None:
+                with self._lock:
+                    self.hits += 1
+                    self._store(key, stored[0], stored[1])
+                return True, stored[0]
+        with self._lock:
+            self.misses += 1
+        return False, None
+
+    def put(self, key, output):
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._store(key, output, expires_at)
+        if self._disk is not None:
+            self._disk.put(key, output, expires_at)
+
+    def _store(self, key, output, expires_at):
+        size = len(str(output)) + len(key[2])
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._pop(key)
+        self._entries[key] = (output, expires_at, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._pop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _pop(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry[2]
+
+    def invalidate_ai(self, ai_id):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == ai_id]:
+                self._pop(key)
+        if self._disk is not None:
+            self._disk.invalidate_ai(ai_id)
+
+    def retain(self, ai_ids):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] not in ai_ids]:
+                self._pop(key)
+        if self._disk is not None:
+            self._disk.retain(ai_ids)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+            }
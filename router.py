@@ -0,0 +1,261 @@
+import heapq
+import math
+import re
+import threading
+from collections import Counter
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize_text(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def query_terms(tokens):
+    terms = []
+    for token in tokens:
+        terms.extend(tokenize_text(token))
+    return terms
+
+
+class InvertedIndex:
+    def __init__(self):
+        self._postings = {}
+        self._documents = {}
+        self._next_order = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._documents)
+
+    def add(self, ai_id, description):
+        with self._lock:
+            order = self._remove(ai_id)
+            if order is None:
+                order = self._next_order
+                self._next_order += 1
+            term_counts = Counter(tokenize_text(description))
+            for term, count in term_counts.items():
+                self._postings.setdefault(term, {})[ai_id] = count
+            self._documents[ai_id] = (order, term_counts)
+
+    def remove(self, ai_id):
+        with self._lock:
+            self._remove(ai_id)
+
+    def _remove(self, ai_id):
+        document = self._documents.pop(ai_id, None)
+        if document is None:
+            return None
+        order, term_counts = document
+        for term in term_counts:
+            postings = self._postings[term]
+            del postings[ai_id]
+            if not postings:
+                del self._postings[term]
+        return order
+
+    def rebuild(self, ais):
+        with self._lock:
+            self._postings = {}
+            self._documents = {}
+            self._next_order = 0
+            for ai in ais:
+                self.add(ai['id'], ai['details'].get('description', ''))
+
+    def search(self, tokens, top_k=1):
+        with self._lock:
+            document_count = len(self._documents)
+            scores = {}
+            for term in set(query_terms(tokens)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                # Rare terms outweigh ones that appear in most descriptions.
+                idf = math.log(1 + document_count / len(postings))
+                for ai_id, count in postings.items():
+                    scores[ai_id] = scores.get(ai_id, 0.0) + count * idf
+            best = heapq.nsmallest(
+                top_k, scores.items(), key=lambda item: (-item[1], self._documents[item[0]][0]))
+        return best
+
+
+np = None
+
+
+def _load_numpy():
+    # Only the TF-IDF mode needs NumPy, so it is not imported at startup.
+    global np
+    if np is None:
+        import numpy
+        np = numpy
+    return np
+
+
+class TfidfIndex:
+    # Sparse: each term keeps the rows (AIs) that use it and their weights, so
+    # memory grows with the total description length and a query only reads
+    # the postings of its own terms. Rows and columns freed by removals are
+    # reused.
+    def __init__(self):
+        _load_numpy()
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self._vocabulary = {}
+        self._terms = []
+        self._free_columns = []
+        self._postings = {}
+        self._posting_arrays = {}
+        self._df = np.zeros(0, dtype=np.float32)
+        self._rows = {}
+        self._row_ids = []
+        self._row_terms = []
+        self._free_rows = []
+        self._order = np.zeros(0, dtype=np.int64)
+        self._next_order = 0
+        self._row_norms = None
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _column(self, term):
+        column = self._vocabulary.get(term)
+        if column is not None:
+            return column
+        if self._free_columns:
+            column = self._free_columns.pop()
+            self._terms[column] = term
+        else:
+            column = len(self._terms)
+            self._terms.append(term)
+            if column >= len(self._df):
+                self._df = np.concatenate([self._df, np.zeros(max(column + 1, len(self._df)), dtype=np.float32)])
+        self._vocabulary[term] = column
+        self._postings[column] = {}
+        return column
+
+    def add(self, ai_id, description):
+        with self._lock:
+            order = self._remove(ai_id)
+            if order is None:
+                order = self._next_order
+                self._next_order += 1
+            if self._free_rows:
+                row = self._free_rows.pop()
+                self._row_ids[row] = ai_id
+            else:
+                row = len(self._row_ids)
+                self._row_ids.append(ai_id)
+                self._row_terms.append(None)
+                if row >= len(self._order):
+                    self._order = np.concatenate([self._order, np.zeros(max(row + 1, len(self._order)), dtype=np.int64)])
+
+            term_counts = Counter(tokenize_text(description))
+            columns = np.fromiter((self._column(term) for term in term_counts), dtype=np.int64, count=len(term_counts))
+            weights = 1 + np.log(np.fromiter(term_counts.values(), dtype=np.float32, count=len(term_counts)))
+            for column, weight in zip(columns.tolist(), weights.tolist()):
+                self._postings[column][row] = weight
+                self._posting_arrays.pop(column, None)
+            self._df[columns] += 1
+            self._row_terms[row] = (columns, weights)
+            self._order[row] = order
+            self._rows[ai_id] = row
+            self._row_norms = None
+
+    def remove(self, ai_id):
+        with self._lock:
+            self._remove(ai_id)
+
+    def _remove(self, ai_id):
+        row = self._rows.pop(ai_id, None)
+        if row is None:
+            return None
+        columns, _ = self._row_terms[row]
+        self._df[columns] -= 1
+        for column in columns.tolist():
+            del self._postings[column][row]
+            self._posting_arrays.pop(column, None)
+            if not self._postings[column]:
+                # No description uses the term any more; free its column.
+                del self._postings[column]
+                del self._vocabulary[self._terms[column]]
+                self._terms[column] = None
+                self._free_columns.append(column)
+        self._row_ids[row] = None
+        self._row_terms[row] = None
+        self._free_rows.append(row)
+        self._row_norms = None
+        return int(self._order[row])
+
+    def rebuild(self, ais):
+        with self._lock:
+            self._reset()
+            for ai in ais:
+                self.add(ai['id'], ai['details'].get('description', ''))
+
+    def _posting_array(self, column):
+        arrays = self._posting_arrays.get(column)
+        if arrays is None:
+            postings = self._postings[column]
+            arrays = self._posting_arrays[column] = (
+                np.fromiter(postings.keys(), dtype=np.int64, count=len(postings)),
+                np.fromiter(postings.values(), dtype=np.float32, count=len(postings)))
+        return arrays
+
+    def _idf(self):
+        return np.log((1 + len(self._rows)) / (1 + self._df)) + 1
+
+    def _norms(self, idf):
+        # The idf of every term shifts whenever an AI is added or removed, so
+        # the norms are recomputed lazily, in one pass over all postings.
+        if self._row_norms is None:
+            rows, columns, weights = [], [], []
+            for row, terms in enumerate(self._row_terms):
+                if terms is not None:
+                    rows.append(np.full(len(terms[0]), row, dtype=np.int64))
+                    columns.append(terms[0])
+                    weights.append(terms[1])
+            if rows:
+                weighted = np.concatenate(weights) * idf[np.concatenate(columns)]
+                squares = np.bincount(np.concatenate(rows), weights=weighted * weighted, minlength=len(self._row_ids))
+            else:
+                squares = np.zeros(len(self._row_ids))
+            self._row_norms = np.sqrt(squares)
+        return self._row_norms
+
+    def search(self, tokens, top_k=1):
+        return self.search_many([tokens], top_k)[0]
+
+    def search_many(self, token_lists, top_k=1):
+        with self._lock:
+            if not self._rows:
+                return [[] for _ in token_lists]
+            idf = self._idf()
+            row_norms = self._norms(idf)
+            return [self._search(tokens, top_k, idf, row_norms) for tokens in token_lists]
+
+    def _search(self, tokens, top_k, idf, row_norms):
+        columns, query_weights = [], []
+        for term, count in Counter(query_terms(tokens)).items():
+            column = self._vocabulary.get(term)
+            if column is not None:
+                columns.append(column)
+                query_weights.append(1 + math.log(count))
+        if not columns:
+            return []
+        idf_squared = idf[columns] ** 2
+        query_norm = math.sqrt(float(np.dot(np.square(query_weights), idf_squared)))
+
+        # Cosine similarity, accumulated over the query's own terms only.
+        posting_rows, posting_scores = [], []
+        for column, query_weight, term_idf_squared in zip(columns, query_weights, idf_squared.tolist()):
+            rows, weights = self._posting_array(column)
+            posting_rows.append(rows)
+            posting_scores.append(weights * (query_weight * term_idf_squared))
+        candidates, positions = np.unique(np.concatenate(posting_rows), return_inverse=True)
+        scores = np.bincount(positions, weights=np.concatenate(posting_scores)) / (row_norms[candidates] * query_norm)
+
+        ranked = np.lexsort((self._order[candidates], -scores))[:top_k]
+        return [(self._row_ids[candidates[i]], float(scores[i])) for i in ranked]
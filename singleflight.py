@@ -0,0 +1,111 @@
+import asyncio
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        # (loop, future) per async follower, woken when the call finishes.
+        self.waiters = []
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class SingleFlight:
+    # Threads (do) and coroutines (do_async) share the same calls in flight.
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.collapsed = 0
+        self.timed_out = 0
+
+    def _join(self, key, loop=None):
+        # Returns (call, leader, waiter); waiter is only made for async followers.
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+                return call, True, None
+            self.collapsed += 1
+            waiter = None
+            if loop is not None:
+                waiter = loop.create_future()
+                call.waiters.append((loop, waiter))
+            return call, False, waiter
+
+    def _finish(self, key, call):
+        with self._lock:
+            del self._calls[key]
+            call.done.set()
+            waiters = call.waiters
+        for loop, waiter in waiters:
+            try:
+                loop.call_soon_threadsafe(_wake, waiter)
+            except RuntimeError:
+                pass  # the follower's loop has closed
+
+    def _timed_out(self):
+        with self._lock:
+            self.timed_out += 1
+        return TimeoutError("Timed out waiting for an identical call in flight")
+
+    def do(self, key, function, *args, timeout=None):
+        # Followers wait at most timeout seconds for the leader's result and
+        # then raise TimeoutError; the leader itself is never interrupted.
+        call, leader, _ = self._join(key)
+        if not leader:
+            if not call.done.wait(timeout):
+                raise self._timed_out()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function(*args)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            self._finish(key, call)
+        return call.result
+
+    async def do_async(self, key, function, *args, timeout=None):
+        # As do(), for a coroutine function; followers wait without blocking
+        # the event loop.
+        call, leader, waiter = self._join(key, asyncio.get_running_loop())
+        if not leader:
+            try:
+                await asyncio.wait_for(waiter, timeout)
+            except asyncio.TimeoutError:
+                raise self._timed_out()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = await function(*args)
+        except asyncio.CancelledError:
+            call.error = TimeoutError("The identical call in flight was cancelled")
+            raise
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            self._finish(key, call)
+        return call.result
+
+    def stats(self):
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'collapsed': self.collapsed,
+                'timed_out': self.timed_out,
+                'in_flight': len(self._calls),
+            }
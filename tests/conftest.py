@@ -0,0 +1,60 @@
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# Settings are read when the modules are imported, so they are set first.
+os.environ.setdefault('INPUT_TOKENIZER', 'regex')
+os.environ.setdefault('NLTK_AUTO_DOWNLOAD', '0')
+
+_workdir = None
+
+
+def pytest_configure(config):
+    # The registry and key files live in the working directory; keep them
+    # out of the checkout.
+    global _workdir
+    _workdir = tempfile.mkdtemp(prefix='central-ai-tests-')
+    os.chdir(_workdir)
+
+
+def pytest_unconfigure(config):
+    os.chdir(ROOT)
+    shutil.rmtree(_workdir, ignore_errors=True)
+
+
+@pytest.fixture
+def registry():
+    # Every AI a test registers is removed afterwards, which also drops its
+    # limiter, breaker and pooled clients.
+    from ai_manager import list_ais, remove_ai
+    yield
+    for ai in list_ais(decrypt=False):
+        remove_ai(ai['id'])
+
+
+@pytest.fixture
+def client(registry, monkeypatch):
+    import app
+    monkeypatch.setattr(app, 'analyze_input',
+                        lambda text: {'original_input': text, 'tokens': text.split(), 'intent': 'query'})
+    monkeypatch.setattr(app, 'process_output', lambda output, **kwargs: output)
+    return app.app.test_client()
+
+
+@pytest.fixture
+def local_ai(tmp_path):
+    # Registers a Local AI running a small Python script; returns its record.
+    from ai_manager import add_ai, get_ai
+
+    def register(name, description, source, **details):
+        script = tmp_path / f'{name}.py'
+        script.write_text(source)
+        ai_id = add_ai(name, 'Local AI', {'description': description,
+                                         'command': f'"{sys.executable}" "{script}"', **details})
+        return dict(get_ai(ai_id, decrypt=False), id=ai_id)
+    return register
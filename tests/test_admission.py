@@ -0,0 +1,184 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+from admission import AdmissionLimiter, Overloaded, get_limiter
+
+SLOW_ECHO = "import sys, time\ntime.sleep(0.5)\nprint(sys.argv[1])\n"
+
+
+def test_full_queue_is_rejected_with_retry_after():
+    limiter = AdmissionLimiter(max_concurrency=1, max_queue=0, queue_timeout=2)
+    limiter.acquire()
+    with pytest.raises(Overloaded) as excinfo:
+        limiter.acquire()
+    assert excinfo.value.retry_after == 2
+    assert not limiter.try_acquire()
+    limiter.release()
+    assert limiter.try_acquire()
+    assert limiter.stats()['rejected'] == 1
+
+
+def test_queued_call_gives_up_at_its_deadline():
+    limiter = AdmissionLimiter(max_concurrency=1, max_queue=1, queue_timeout=0.1)
+    limiter.acquire()
+    start = time.monotonic()
+    with pytest.raises(Overloaded):
+        limiter.acquire()
+    assert time.monotonic() - start < 1
+    assert limiter.stats()['timed_out'] == 1
+
+
+def test_queued_call_is_admitted_on_release():
+    limiter = AdmissionLimiter(max_concurrency=1, max_queue=1, queue_timeout=5)
+    limiter.acquire()
+    threading.Timer(0.1, limiter.release).start()
+    limiter.acquire()
+    assert limiter.stats()['active'] == 1
+
+
+def test_rate_limit_spaces_out_calls():
+    limiter = AdmissionLimiter(rate_limit=20, burst=1, queue_timeout=5)
+    start = time.monotonic()
+    for _ in range(3):
+        limiter.acquire()
+        limiter.release()
+    assert time.monotonic() - start >= 0.09
+
+
+def test_process_answers_429_when_overloaded(client, local_ai):
+    import app
+
+    local_ai('Slow', 'slow echo', SLOW_ECHO, max_concurrency=1, max_queue=0)
+    responses = []
+
+    def post():
+        responses.append(app.app.test_client().post('/process', json={'input': 'slow echo'}))
+
+    threads = [threading.Thread(target=post) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(response.status_code for response in responses) == [200, 429, 429]
+    for response in responses:
+        if response.status_code == 429:
+            assert int(response.headers['Retry-After']) >= 1
+            assert 'overloaded' in response.json['error']
+
+
+def test_asgi_process_answers_429_when_overloaded(registry, local_ai, monkeypatch):
+    import asgi
+    from admission import get_limiter
+
+    monkeypatch.setattr(asgi, 'analyze_input',
+                        lambda text: {'original_input': text, 'tokens': text.split(), 'intent': 'query'})
+    monkeypatch.setattr(asgi, 'process_output', lambda output, **kwargs: output)
+    ai = local_ai('Slow', 'slow echo', SLOW_ECHO, max_concurrency=1, max_queue=0)
+
+    async def post():
+        messages = [{'type': 'http.request', 'body': json.dumps({'input': 'slow echo'}).encode()}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+        await asgi.app({'type': 'http', 'method': 'POST', 'path': '/process'}, receive, send)
+        return sent[0]['status'], dict(sent[0]['headers'])
+
+    async def post_all():
+        return await asyncio.gather(*[post() for _ in range(3)])
+
+    results = asyncio.run(post_all())
+    assert sorted(status for status, _ in results) == [200, 429, 429]
+    assert all(b'retry-after' in headers for status, headers in results if status == 429)
+    assert get_limiter(ai['id'], ai['details']).stats()['active'] == 0
+
+
+def test_async_waiters_share_the_queue_and_its_deadline():
+    limiter = AdmissionLimiter(max_concurrency=1, max_queue=32, queue_timeout=0.5)
+
+    async def call():
+        try:
+            await limiter.acquire_async()
+        except Overloaded:
+            return False
+        try:
+            await asyncio.sleep(0.2)
+        finally:
+            limiter.release()
+        return True
+
+    async def call_all():
+        return await asyncio.gather(*[call() for _ in range(40)])
+
+    start = time.monotonic()
+    admitted = asyncio.run(call_all()).count(True)
+    # One runs, 32 queue and 7 are turned away; queued calls give up at 0.5 s.
+    assert time.monotonic() - start < 1.5
+    assert 2 <= admitted <= 4
+    stats = limiter.stats()
+    assert stats['rejected'] == 7
+    assert stats['timed_out'] == 40 - 7 - admitted
+    assert stats['active'] == stats['waiting'] == 0
+
+
+def test_cancelled_async_waiter_leaves_the_queue():
+    limiter = AdmissionLimiter(max_concurrency=1, max_queue=1, queue_timeout=5)
+    limiter.acquire()
+
+    async def cancel_waiter():
+        waiter = asyncio.ensure_future(limiter.acquire_async())
+        await asyncio.sleep(0.05)
+        assert limiter.stats()['waiting'] == 1
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+    asyncio.run(cancel_waiter())
+    limiter.release()
+    assert limiter.stats() == {'active': 0, 'waiting': 0, 'admitted': 1, 'rejected': 0, 'timed_out': 0}
+
+
+def test_threads_and_coroutines_share_slots():
+    limiter = AdmissionLimiter(max_concurrency=1, max_queue=1, queue_timeout=5)
+    limiter.acquire()
+    threading.Timer(0.1, limiter.release).start()
+
+    async def wait_for_slot():
+        await limiter.acquire_async()
+
+    start = time.monotonic()
+    asyncio.run(wait_for_slot())
+    assert 0.05 < time.monotonic() - start < 1
+    assert limiter.stats()['active'] == 1
+
+
+def test_batch_call_is_admitted_and_recorded(registry, tmp_path):
+    from ai_manager import add_ai
+    from junction import get_breakers, process_batch
+
+    plugin = tmp_path / 'batcher.py'
+    plugin.write_text("def process(text):\n    return text\n\n"
+                      "def process_batch(texts):\n    return [text.upper() for text in texts]\n")
+    ai_id = add_ai('Batcher', 'Custom AI', {'description': 'shout', 'file_path': str(plugin),
+                                            'max_concurrency': 1, 'max_queue': 0})
+    inputs = [{'original_input': text, 'tokens': ['shout', text]} for text in ('a', 'b')]
+
+    assert [result['output'] for result in process_batch(inputs)] == ['A', 'B']
+    assert get_breakers().snapshot()[ai_id]['calls'] == 1
+
+    limiter = get_limiter(ai_id, {'max_concurrency': 1, 'max_queue': 0})
+    limiter.acquire()
+    try:
+        results = process_batch(inputs)
+    finally:
+        limiter.release()
+    assert all('overloaded' in result['error'] for result in results)
+    assert limiter.stats()['rejected'] == 1
@@ -0,0 +1,72 @@
+import asyncio
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from ai_manager import add_ai, get_ai
+from async_junction import call_ai_async, close_sessions, route_and_process_async
+from junction import BackendTimeout, get_breakers
+from metrics import ai_errors
+
+
+def test_losing_hedge_is_not_recorded(registry, local_ai):
+    slow = local_ai('Slow', 'race', "import time\ntime.sleep(3)\nprint('slow')\n")
+    fast = local_ai('Fast', 'race', "import time\ntime.sleep(0.2)\nprint('fast')\n")
+    result = asyncio.run(route_and_process_async({'original_input': 'race', 'tokens': ['race']}, k=2))
+    assert result['ai']['name'] == 'Fast'
+    breakers = get_breakers().snapshot()
+    assert breakers[fast['id']]['calls'] == 1
+    assert breakers[slow['id']]['calls'] == 0
+
+
+def test_cancelled_local_ai_process_is_killed(registry, local_ai, tmp_path):
+    marker = tmp_path / 'finished'
+    ai = local_ai('Slow', 'slow', f"import time\ntime.sleep(1)\nopen({str(marker)!r}, 'w').close()\n")
+
+    async def cancel_call():
+        task = asyncio.ensure_future(call_ai_async(ai, {'original_input': 'x'}))
+        await asyncio.sleep(0.3)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(cancel_call())
+    time.sleep(1.5)
+    assert not marker.exists()
+
+
+def test_api_timeout_counts_as_a_timeout(registry):
+    class SlowHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            time.sleep(1)
+            self.send_response(200)
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), SlowHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        ai_id = add_ai('Slow API', 'API', {'endpoint': f'http://127.0.0.1:{server.server_address[1]}/',
+                                           'api_key': 'k', 'timeout': 0.2, 'retries': 0})
+        ai = dict(get_ai(ai_id, decrypt=False), id=ai_id)
+        labels = {'ai': ai_id, 'type': 'API', 'kind': 'timeout'}
+
+        async def call():
+            try:
+                await call_ai_async(ai, {'original_input': 'x'})
+            finally:
+                await close_sessions()
+
+        with pytest.raises(BackendTimeout):
+            asyncio.run(call())
+        assert ai_errors._values[tuple(sorted(labels.items()))] == 1
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,84 @@
+import time
+
+import pytest
+
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, BreakerRegistry, CircuitBreaker
+
+
+def open_breaker(**settings):
+    breaker = CircuitBreaker(window=4, min_calls=4, error_rate=0.5, open_seconds=0.1, **settings)
+    for failed in (False, True, False, True):
+        breaker.record(0.01, failed)
+    return breaker
+
+
+def test_opens_at_the_error_rate():
+    breaker = CircuitBreaker(window=4, min_calls=4, error_rate=0.5, open_seconds=0.1)
+    for failed in (False, True, False):
+        breaker.record(0.01, failed)
+    assert breaker.state == CLOSED
+    breaker.record(0.01, True)
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.snapshot()['rejected'] == 1
+
+
+def test_slow_calls_count_as_failures():
+    breaker = CircuitBreaker(window=4, min_calls=4, error_rate=0.5, slow_call=0.5)
+    for latency in (0.01, 1.0, 0.01, 1.0):
+        breaker.record(latency)
+    assert breaker.state == OPEN
+
+
+def test_half_open_lets_one_probe_through():
+    breaker = open_breaker()
+    time.sleep(0.1)
+    assert breaker.available()
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()
+    breaker.record(0.01)
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+def test_failed_probe_opens_it_again():
+    breaker = open_breaker()
+    time.sleep(0.1)
+    assert breaker.allow()
+    breaker.record(0.01, failed=True)
+    assert breaker.state == OPEN
+    assert breaker.snapshot()['times_opened'] == 2
+
+
+def test_abandoned_probe_records_nothing():
+    breaker = open_breaker()
+    time.sleep(0.1)
+    assert breaker.allow()
+    calls = breaker.snapshot()['calls']
+    breaker.abandon()
+    assert breaker.state == HALF_OPEN
+    assert breaker.snapshot()['calls'] == calls
+    # The next call becomes the probe.
+    assert breaker.allow()
+    assert not breaker.allow()
+
+
+def test_open_breakers_are_ranked_last():
+    breakers = BreakerRegistry()
+    breakers._breakers['a'] = open_breaker(slow_call=10)
+    assert breakers.order([('a', 2.0), ('b', 1.0)]) == [('b', 1.0), ('a', 2.0)]
+
+
+def test_failing_ai_is_cut_off(registry, local_ai):
+    from circuit_breaker import BREAKER_MIN_CALLS
+    from junction import BackendError, BackendUnavailable, call_ai, get_breakers
+
+    ai = local_ai('Broken', 'broken', "import sys\nsys.exit('broken')\n")
+    for _ in range(BREAKER_MIN_CALLS):
+        with pytest.raises(BackendError) as excinfo:
+            call_ai(ai, {'original_input': 'x'})
+        assert not isinstance(excinfo.value, BackendUnavailable)
+    with pytest.raises(BackendUnavailable):
+        call_ai(ai, {'original_input': 'x'})
+    assert get_breakers().snapshot()[ai['id']]['state'] == OPEN
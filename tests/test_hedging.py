@@ -0,0 +1,97 @@
+import threading
+import time
+
+import pytest
+
+import junction
+from junction import BackendError, BackendOverloaded, route_and_process
+
+INPUT = {'original_input': 'hello', 'tokens': ['hello']}
+
+
+@pytest.fixture
+def backends(monkeypatch):
+    # backends(name=(delay, error)) fakes one AI per name; the names of the
+    # AIs actually called are collected in .started, in order.
+    release = threading.Event()
+
+    def define(**behaviour):
+        started = []
+
+        def call(ai, analyzed_input, end=None):
+            started.append(ai['name'])
+            delay, error = behaviour[ai['name']]
+            release.wait(delay)
+            if error is not None:
+                raise error
+            return f"{ai['name']} says hi"
+        monkeypatch.setattr(junction, 'call_ai_cached', call)
+        define.started = started
+        return [{'id': name, 'name': name} for name in behaviour]
+    yield define
+    release.set()
+
+
+def timed(function, *args):
+    start = time.monotonic()
+    result = function(*args)
+    return result, time.monotonic() - start
+
+
+def test_without_a_hedge_delay_the_fastest_answer_wins(backends):
+    candidates = backends(slow=(0.5, None), fast=(0, None))
+    result, elapsed = timed(junction._dispatch_hedged, candidates, INPUT, None, None)
+    assert result == {'output': 'fast says hi', 'ai': candidates[1]}
+    assert backends.started == ['slow', 'fast']
+    assert elapsed < 0.4
+
+
+def test_hedge_starts_only_when_the_first_call_is_slow(backends):
+    candidates = backends(first=(0, None), second=(0, None))
+    result = junction._dispatch_hedged(candidates, INPUT, 0.5, None)
+    assert result['ai'] == candidates[0]
+    assert backends.started == ['first']
+
+    candidates = backends(first=(0.5, None), second=(0, None))
+    result, elapsed = timed(junction._dispatch_hedged, candidates, INPUT, 0.1, None)
+    assert result['ai'] == candidates[1]
+    assert backends.started == ['first', 'second']
+    assert 0.1 <= elapsed < 0.4
+
+
+def test_failed_call_starts_the_next_candidate_at_once(backends):
+    candidates = backends(broken=(0, BackendError("Error: broken")), working=(0, None))
+    result, elapsed = timed(junction._dispatch_hedged, candidates, INPUT, 5, None)
+    assert result == {'output': 'working says hi', 'ai': candidates[1]}
+    assert elapsed < 1
+
+
+def test_deadline_bounds_the_wait(backends):
+    candidates = backends(a=(0.5, None), b=(0.5, None))
+    result, elapsed = timed(junction._dispatch_hedged, candidates, INPUT, None, 0.1)
+    assert result == {'output': "Error: No AI answered within the deadline", 'ai': None}
+    assert elapsed < 0.4
+
+
+def test_errors_are_reported_once_every_candidate_failed(backends):
+    candidates = backends(a=(0, BackendError("Error: a failed")), b=(0, BackendError("Error: b failed")))
+    result = junction._dispatch_hedged(candidates, INPUT, None, None)
+    assert result['output'] in ("Error: a failed", "Error: b failed")
+
+    candidates = backends(a=(0, BackendOverloaded("Error: a is overloaded", 3)),
+                          b=(0, BackendOverloaded("Error: b is overloaded", 3)))
+    with pytest.raises(BackendOverloaded):
+        junction._dispatch_hedged(candidates, INPUT, None, None)
+
+
+def test_hedge_delay_asks_for_a_second_candidate(backends, monkeypatch):
+    candidates = backends(first=(0.5, None), second=(0, None))
+    asked = []
+
+    def select_ai(analyzed_input, mode=None, top_k=1):
+        asked.append(top_k)
+        return candidates[:top_k]
+    monkeypatch.setattr(junction, 'select_ai', select_ai)
+
+    assert route_and_process(INPUT, hedge_delay=0.05)['ai'] == candidates[1]
+    assert asked == [2]
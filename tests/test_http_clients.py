@@ -0,0 +1,133 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import http_clients
+from http_clients import ApiClient
+
+# Stands in for the TCP and TLS handshakes a real backend costs per connection.
+HANDSHAKE_DELAY = 0.02
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; without this, Nagle and
+    # delayed ACKs stall every reused connection by ~40 ms.
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        with self.server.lock:
+            self.server.requests += 1
+            status = self.server.statuses.pop(0) if self.server.statuses else 200
+        payload = json.dumps({'output': body['input']}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StubHandler)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+        self.statuses = []
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}/process'
+
+    def finish_request(self, request, client_address):
+        with self.lock:
+            self.connections += 1
+        time.sleep(HANDSHAKE_DELAY)
+        super().finish_request(request, client_address)
+
+
+@pytest.fixture
+def stub_server():
+    server = StubServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_pooled_client_reuses_one_connection(stub_server):
+    client = ApiClient()
+    try:
+        outputs = [client.post(stub_server.url, json={'input': str(i)}).json()['output'] for i in range(10)]
+    finally:
+        client.close()
+    assert outputs == [str(i) for i in range(10)]
+    assert stub_server.connections == 1
+
+
+def test_keep_alive_cuts_per_call_latency(stub_server):
+    calls = 10
+    start = time.perf_counter()
+    for i in range(calls):
+        requests.post(stub_server.url, json={'input': str(i)}).raise_for_status()
+    unpooled = time.perf_counter() - start
+    assert stub_server.connections == calls
+
+    client = ApiClient()
+    try:
+        start = time.perf_counter()
+        for i in range(calls):
+            client.post(stub_server.url, json={'input': str(i)}).raise_for_status()
+        pooled = time.perf_counter() - start
+    finally:
+        client.close()
+    assert stub_server.connections == calls + 1
+    # Only the first pooled call pays for a handshake.
+    assert unpooled >= calls * HANDSHAKE_DELAY
+    assert pooled < unpooled / 2
+
+
+def test_idempotent_posts_are_retried(stub_server):
+    stub_server.statuses = [503, 503]
+    client = ApiClient(retries=2, backoff_factor=0, idempotent=True)
+    try:
+        assert client.post(stub_server.url, json={'input': 'x'}).status_code == 200
+    finally:
+        client.close()
+    assert stub_server.requests == 3
+
+
+def test_other_posts_are_not_retried(stub_server):
+    stub_server.statuses = [503]
+    client = ApiClient(retries=2, backoff_factor=0)
+    try:
+        assert client.post(stub_server.url, json={'input': 'x'}).status_code == 503
+    finally:
+        client.close()
+    assert stub_server.requests == 1
+
+
+def test_api_ai_keeps_its_client_until_removed(stub_server, registry):
+    from ai_manager import add_ai, get_ai, remove_ai
+    from junction import call_ai
+
+    ai_id = add_ai('Stub', 'API', {'description': 'stub', 'endpoint': stub_server.url, 'api_key': 'secret'})
+    ai_info = dict(get_ai(ai_id, decrypt=False), id=ai_id)
+    assert [call_ai(ai_info, {'original_input': text}) for text in ('a', 'b', 'c')] == ['a', 'b', 'c']
+    assert stub_server.connections == 1
+
+    client = http_clients._clients[ai_id][1]
+    remove_ai(ai_id)
+    assert ai_id not in http_clients._clients
+    assert not client.session.adapters['http://'].poolmanager.pools
@@ -0,0 +1,96 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from conftest import ROOT
+
+READ_KEYS = """
+import json
+from ai_manager import list_ais
+print(json.dumps({ai['name']: ai['details']['api_key'] for ai in list_ais()}))
+"""
+
+
+@pytest.fixture(params=['json', 'sqlite'])
+def worker(request, tmp_path):
+    # Each worker is its own process sharing tmp_path's registry and key file.
+    env = dict(os.environ, PYTHONPATH=ROOT, AI_REGISTRY_BACKEND=request.param)
+
+    def start(code):
+        return subprocess.Popen([sys.executable, '-c', code], cwd=tmp_path, env=env,
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+
+    def run(code):
+        process = start(code)
+        stdout, stderr = process.communicate(timeout=60)
+        assert process.returncode == 0, stderr
+        return stdout
+    run.start = start
+    run.backend = request.param
+    run.path = tmp_path
+    return run
+
+
+def wait_for(path):
+    deadline = time.monotonic() + 30
+    while not path.exists():
+        assert time.monotonic() < deadline, f"{path.name} never appeared"
+        time.sleep(0.01)
+
+
+def test_rotation_keeps_existing_secrets(worker):
+    worker("from ai_manager import add_ai\n"
+           "for i in range(3): add_ai(f'AI{i}', 'API', {'endpoint': 'http://x', 'api_key': f'key{i}'})")
+    worker("from ai_manager import rotate_encryption_key; rotate_encryption_key()")
+    assert json.loads(worker(READ_KEYS)) == {'AI0': 'key0', 'AI1': 'key1', 'AI2': 'key2'}
+    assert len((worker.path / 'encryption_key.key').read_bytes().split()) == 1
+
+
+def test_worker_with_a_cached_key_encrypts_with_the_new_one(worker):
+    # The first worker has loaded the old key when another one rotates it.
+    first = worker.start(
+        "import os, time\n"
+        "from ai_manager import add_ai\n"
+        "add_ai('Before', 'API', {'endpoint': 'http://x', 'api_key': 'k1'})\n"
+        "open('ready', 'w').close()\n"
+        "while not os.path.exists('rotated'): time.sleep(0.01)\n"
+        "add_ai('After', 'API', {'endpoint': 'http://x', 'api_key': 'k2'})\n")
+    wait_for(worker.path / 'ready')
+    worker("from ai_manager import rotate_encryption_key; rotate_encryption_key()")
+    (worker.path / 'rotated').touch()
+    assert first.wait(60) == 0, first.stderr.read()
+    assert json.loads(worker(READ_KEYS)) == {'Before': 'k1', 'After': 'k2'}
+
+
+def test_rotation_keeps_concurrent_writes(worker):
+    if worker.backend == 'json':
+        pytest.skip("the JSON store does not lock its file across processes")
+    writer = worker.start(
+        "from ai_manager import add_ai\n"
+        "for i in range(40): add_ai(f'AI{i}', 'API', {'endpoint': 'http://x', 'api_key': f'key{i}'})\n")
+    while writer.poll() is None:
+        worker("from ai_manager import rotate_encryption_key; rotate_encryption_key()")
+    assert writer.returncode == 0, writer.stderr.read()
+    assert json.loads(worker(READ_KEYS)) == {f'AI{i}': f'key{i}' for i in range(40)}
+
+
+def test_decrypted_secrets_are_dropped_with_their_ai(registry):
+    import ai_manager
+    from ai_manager import add_ai, get_ai, get_api_key, remove_ai, update_ai
+
+    ai_id = add_ai('Secret', 'API', {'endpoint': 'http://x', 'api_key': 'old'})
+    old = get_ai(ai_id, decrypt=False)['details']['api_key']
+    assert get_api_key(get_ai(ai_id, decrypt=False)) == 'old'
+    assert old in ai_manager._decrypted_secrets
+
+    update_ai(ai_id, {'api_key': 'new'})
+    new = get_ai(ai_id, decrypt=False)['details']['api_key']
+    assert get_api_key(get_ai(ai_id, decrypt=False)) == 'new'
+    assert old not in ai_manager._decrypted_secrets
+
+    remove_ai(ai_id)
+    assert new not in ai_manager._decrypted_secrets
@@ -0,0 +1,48 @@
+from ai_manager import add_ai, remove_ai, update_ai
+
+
+def test_unchanged_registry_answers_304(client):
+    add_ai('One', 'Bot', {'description': 'one', 'file_path': 'one.py'})
+    response = client.get('/list_ais')
+    assert response.status_code == 200
+    tag = response.json['version']
+    assert response.headers['ETag'] == f'"{tag}"'
+
+    assert client.get('/list_ais', headers={'If-None-Match': f'"{tag}"'}).status_code == 304
+    add_ai('Two', 'Bot', {'description': 'two', 'file_path': 'two.py'})
+    assert client.get('/list_ais', headers={'If-None-Match': f'"{tag}"'}).status_code == 200
+
+
+def test_since_returns_only_the_changes(client):
+    first = add_ai('One', 'Bot', {'description': 'one', 'file_path': 'one.py'})
+    second = add_ai('Two', 'Bot', {'description': 'two', 'file_path': 'two.py'})
+    tag = client.get('/list_ais').json['version']
+
+    update_ai(first, {'description': 'first'})
+    remove_ai(second)
+    third = add_ai('Three', 'Bot', {'description': 'three', 'file_path': 'three.py'})
+
+    body = client.get('/list_ais', query_string={'since': tag}).json
+    changes = {change['id']: change for change in body['changes']}
+    assert set(changes) == {first, second, third}
+    assert changes[first]['op'] == 'upsert' and changes[first]['ai']['details']['description'] == 'first'
+    assert changes[second] == {'id': second, 'op': 'remove'}
+    assert changes[third]['ai']['name'] == 'Three'
+
+    assert client.get('/list_ais', query_string={'since': body['version']}).json['changes'] == []
+
+
+def test_unknown_tag_asks_for_a_full_listing(client):
+    add_ai('One', 'Bot', {'description': 'one', 'file_path': 'one.py'})
+    body = client.get('/list_ais', query_string={'since': 'elsewhere-3'}).json
+    assert body['reset'] is True
+
+
+def test_pages_follow_the_cursor(client):
+    ids = [add_ai(name, 'Bot', {'description': name, 'file_path': 'x.py'}) for name in ('A', 'B', 'C')]
+    first = client.get('/list_ais', query_string={'limit': 2}).json
+    assert [ai['id'] for ai in first['ais']] == ids[:2]
+    second = client.get('/list_ais', query_string={'limit': 2, 'cursor': first['next_cursor']}).json
+    assert [ai['id'] for ai in second['ais']] == ids[2:]
+    assert second['next_cursor'] is None
+    assert len(client.get('/list_ais').json['ais']) == 3
@@ -0,0 +1,47 @@
+import time
+
+import pytest
+
+from plugin_pool import PluginPool, PluginTimeout
+
+PLUGIN = """import os
+import time
+
+
+def process(text):
+    if text == 'hang':
+        time.sleep(30)
+    return os.getpid()
+"""
+
+
+@pytest.fixture
+def plugin(tmp_path):
+    path = tmp_path / 'plugin.py'
+    path.write_text(PLUGIN)
+    return str(path)
+
+
+def test_timed_out_worker_is_replaced(plugin):
+    pool = PluginPool(size=1, timeout=10)
+    try:
+        first = pool.call('ai', plugin, 'hi')
+        start = time.monotonic()
+        with pytest.raises(PluginTimeout):
+            pool.call('ai', plugin, 'hang', timeout=0.5)
+        assert time.monotonic() - start < 2
+        # The next call waits for the replacement process.
+        assert pool.call('ai', plugin, 'hi') != first
+        assert pool.stats()['timeouts'] == 1
+    finally:
+        pool.close()
+
+
+def test_workers_are_recycled_after_max_calls(plugin):
+    pool = PluginPool(size=1, max_calls=2)
+    try:
+        pids = [pool.call('ai', plugin, 'hi') for _ in range(3)]
+        assert pids[0] == pids[1] != pids[2]
+        assert pool.stats()['recycled'] == 1
+    finally:
+        pool.close()
@@ -0,0 +1,59 @@
+import pytest
+
+import ai_manager
+import junction
+from ai_manager import add_ai, load_ai_database
+from registry_store import JsonRegistryStore, SqliteRegistryStore
+
+STORES = {'json': ('ai_database.json', JsonRegistryStore), 'sqlite': ('ai_registry.db', SqliteRegistryStore)}
+
+
+@pytest.fixture(params=sorted(STORES))
+def store(request, tmp_path, monkeypatch):
+    # A fresh registry in tmp_path; other() opens it as another worker would.
+    name, store_class = STORES[request.param]
+    path = str(tmp_path / name)
+    monkeypatch.setattr(ai_manager, '_store', store_class(path))
+    monkeypatch.setattr(ai_manager, '_registry', None)
+    monkeypatch.setattr(ai_manager, '_registry_signature', None)
+    monkeypatch.setattr(ai_manager, '_registry_version', 0)
+    monkeypatch.setattr(junction, '_routing_indexes', {})
+    monkeypatch.setattr(junction, '_stale_indexes', set())
+    events = []
+    monkeypatch.setattr(ai_manager, '_registry_listeners',
+                        ai_manager._registry_listeners + [lambda event, ai_id, ai_info: events.append((event, ai_id))])
+    return lambda: store_class(path), events
+
+
+def api_ai(description):
+    return {'name': description, 'type': 'API', 'details': {'endpoint': 'http://x', 'description': description}}
+
+
+def test_write_by_another_worker_patches_the_index(store):
+    other, events = store
+    weather = add_ai('Weather', 'API', {'endpoint': 'http://x', 'description': 'weather forecast'})
+    index = junction.get_routing_index('index')
+    del events[:]
+
+    other().put('translator', lambda: api_ai('translate text'))
+    other().delete(weather)
+    load_ai_database(force=True)
+
+    assert events == [('add', 'translator'), ('remove', weather)]
+    assert junction.get_routing_index('index') is index
+    assert [ai_id for ai_id, _ in index.search(['translate'])] == ['translator']
+    assert index.search(['weather']) == []
+
+
+def test_reload_is_rebuilt_on_next_use(store):
+    add_ai('Weather', 'API', {'endpoint': 'http://x', 'description': 'weather forecast'})
+    index = junction.get_routing_index('index')
+    with ai_manager._registry_lock:
+        ai_manager._notify_listeners('reload')
+    assert junction._stale_indexes == {'index'}
+
+    rebuilt = junction.get_routing_index('index')
+    assert rebuilt is not index
+    ai_ids = [ai['id'] for ai in ai_manager.list_ais(decrypt=False)]
+    assert [ai_id for ai_id, _ in rebuilt.search(['weather'])] == ai_ids
+    assert junction.get_routing_index('index') is rebuilt
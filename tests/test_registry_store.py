@@ -0,0 +1,74 @@
+import json
+import sqlite3
+
+import ai_manager
+from registry_store import JsonRegistryStore, SqliteRegistryStore, migrate_json_to_sqlite
+
+
+def record(name, **details):
+    return {'name': name, 'type': 'API', 'details': {'endpoint': 'http://x', **details}}
+
+
+def test_sqlite_store_writes_are_versioned(tmp_path):
+    store = SqliteRegistryStore(str(tmp_path / 'ai_registry.db'))
+    assert store.signature() == 0
+
+    assert store.put('a', lambda: record('A', api_key='secret-a')) == (record('A', api_key='secret-a'), 0, 1)
+    store.put('b', lambda: record('B'))
+    updated, before, after = store.update('a', lambda ai: dict(ai, name='A2'))
+    assert (updated['name'], before, after) == ('A2', 2, 3)
+    assert store.update('missing', lambda ai: ai) == (None, 3, 3)
+    assert store.delete('b')[0] == record('B')
+    assert store.delete('b') == (None, 4, 4)
+
+    assert store.load_all() == {'a': record('A2', api_key='secret-a')}
+    # Secrets live in their own column, out of the plain details.
+    details, secrets = sqlite3.connect(store.path).execute('SELECT details, secrets FROM ais').fetchone()
+    assert 'api_key' not in json.loads(details)
+    assert json.loads(secrets) == {'api_key': 'secret-a'}
+
+
+def test_update_each_writes_only_the_records_it_returns(tmp_path):
+    store = SqliteRegistryStore(str(tmp_path / 'ai_registry.db'))
+    for name in 'abc':
+        store.put(name, lambda name=name: record(name.upper()))
+
+    changed, before, after = store.update_each(lambda ai_id, ai: dict(ai, name='B2') if ai_id == 'b' else None)
+    assert (changed, after) == (['b'], before + 1)
+    assert [ai['name'] for ai in store.load_all().values()] == ['A', 'B2', 'C']
+    assert store.changes_since(before) == [(after, 'b', False)]
+
+
+def test_changes_since_stops_at_the_change_log(tmp_path):
+    store = SqliteRegistryStore(str(tmp_path / 'ai_registry.db'), change_log_versions=2)
+    store.put('a', lambda: record('A'))
+    store.put('b', lambda: record('B'))
+    store.delete('a')
+
+    assert store.changes_since(0) is None
+    assert store.changes_since(1) == [(2, 'b', False), (3, 'a', True)]
+    assert store.load_changes(1) == (3, [('b', record('B')), ('a', None)])
+    assert store.changes_since(3) == []
+
+
+def test_migrate_json_to_sqlite_copies_records_in_order(tmp_path):
+    source = JsonRegistryStore(str(tmp_path / 'ai_database.json'))
+    for name in ('z', 'a', 'm'):
+        source.put(name, lambda name=name: record(name.upper(), api_key=f'ciphertext-{name}'))
+
+    assert migrate_json_to_sqlite(source.path, str(tmp_path / 'ai_registry.db')) == 3
+    target = SqliteRegistryStore(str(tmp_path / 'ai_registry.db'))
+    assert target.load_all() == source.load_all()
+    assert list(target.load_all()) == ['z', 'a', 'm']
+
+
+def test_sqlite_backend_migrates_an_existing_json_registry(tmp_path, monkeypatch):
+    monkeypatch.setattr(ai_manager, 'AI_DATABASE_FILE', str(tmp_path / 'ai_database.json'))
+    monkeypatch.setattr(ai_manager, 'AI_REGISTRY_DB', str(tmp_path / 'ai_registry.db'))
+    JsonRegistryStore(ai_manager.AI_DATABASE_FILE).put('a', lambda: record('A'))
+
+    store = ai_manager.create_registry_store('sqlite')
+    assert store.load_all() == {'a': record('A')}
+    # Only the first start migrates; later writes to the JSON file are not copied.
+    JsonRegistryStore(ai_manager.AI_DATABASE_FILE).put('b', lambda: record('B'))
+    assert list(ai_manager.create_registry_store('sqlite').load_all()) == ['a']
@@ -0,0 +1,83 @@
+import time
+
+import junction
+from response_cache import ResponseCache, cache_key, is_cacheable
+
+ECHO = {'id': 'echo', 'name': 'Echo', 'type': 'API', 'details': {'endpoint': 'http://x'}}
+
+
+def request(text):
+    return {'original_input': text, 'tokens': text.split()}
+
+
+def test_key_ignores_case_and_spacing_but_not_the_config():
+    assert cache_key(ECHO, request('Hello  World')) == cache_key(ECHO, request(' hello world'))
+    changed = dict(ECHO, details={'endpoint': 'http://y'})
+    assert cache_key(changed, request('hello world')) != cache_key(ECHO, request('hello world'))
+    assert is_cacheable(ECHO)
+    assert not is_cacheable(dict(ECHO, details={'cacheable': 'false'}))
+
+
+def test_entries_expire_and_are_evicted_least_recently_used_first():
+    cache = ResponseCache(enabled=True, max_entries=2, ttl=0.05)
+    keys = [cache_key(ECHO, request(text)) for text in ('a', 'b', 'c')]
+    cache.put(keys[0], 'A')
+    cache.put(keys[1], 'B')
+    assert cache.get(keys[0]) == (True, 'A')
+    cache.put(keys[2], 'C')
+    assert cache.get(keys[1]) == (False, None)
+    assert cache.get(keys[0]) == (True, 'A')
+
+    time.sleep(0.1)
+    assert cache.get(keys[0]) == (False, None)
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['evictions'], stats['entries']) == (2, 2, 1, 1)
+
+
+def test_byte_budget_and_invalidation():
+    cache = ResponseCache(enabled=True, max_bytes=20)
+    other = dict(ECHO, id='other')
+    cache.put(cache_key(ECHO, request('a')), 'x' * 30)
+    assert cache.stats()['entries'] == 0
+
+    cache.put(cache_key(ECHO, request('a')), 'A')
+    cache.put(cache_key(other, request('a')), 'A')
+    cache.invalidate_ai('echo')
+    assert cache.get(cache_key(ECHO, request('a'))) == (False, None)
+    assert cache.get(cache_key(other, request('a'))) == (True, 'A')
+
+
+def test_disk_tier_outlives_the_process_cache(tmp_path):
+    path = str(tmp_path / 'responses.db')
+    key = cache_key(ECHO, request('a'))
+    ResponseCache(enabled=True, db_path=path).put(key, {'answer': 42})
+    cache = ResponseCache(enabled=True, db_path=path)
+    assert cache.get(key) == (True, {'answer': 42})
+    cache.invalidate_ai('echo')
+    assert ResponseCache(enabled=True, db_path=path).get(key) == (False, None)
+
+
+def test_call_ai_cached_calls_the_backend_once(monkeypatch):
+    calls = []
+
+    def call_ai(ai_info, analyzed_input):
+        calls.append(ai_info['id'])
+        return analyzed_input['original_input'].upper()
+    monkeypatch.setattr(junction, 'call_ai', call_ai)
+    monkeypatch.setattr(junction, '_response_cache', ResponseCache(enabled=True))
+    # ECHO is not registered; keep it out of the routing indexes.
+    monkeypatch.setattr(junction, '_routing_indexes', {})
+
+    assert junction.call_ai_cached(ECHO, request('hi')) == 'HI'
+    assert junction.call_ai_cached(ECHO, request('HI ')) == 'HI'
+    assert calls == ['echo']
+
+    uncached = dict(ECHO, id='uncached', details={'cacheable': False, 'coalesce': False})
+    junction.call_ai_cached(uncached, request('hi'))
+    junction.call_ai_cached(uncached, request('hi'))
+    assert calls == ['echo', 'uncached', 'uncached']
+
+    # Changing the AI drops its cached responses.
+    junction._on_registry_change('update', 'echo', ECHO)
+    junction.call_ai_cached(ECHO, request('hi'))
+    assert calls == ['echo', 'uncached', 'uncached', 'echo']
@@ -0,0 +1,83 @@
+import math
+import random
+from collections import Counter
+
+import pytest
+
+from router import TfidfIndex, tokenize_text
+
+pytest.importorskip('numpy')
+
+WORDS = ['weather', 'forecast', 'rain', 'translate', 'french', 'text', 'code', 'python', 'news', 'sports']
+
+
+def cosine_ranking(descriptions, query, top_k):
+    # Dense TF-IDF with the same weighting, as a reference: tf = 1 + log(count),
+    # idf = log((1 + n) / (1 + df)) + 1, ties broken by insertion order.
+    counts = {ai_id: Counter(tokenize_text(text)) for ai_id, text in descriptions.items()}
+    df = Counter(term for terms in counts.values() for term in terms)
+    idf = {term: math.log((1 + len(counts)) / (1 + n)) + 1 for term, n in df.items()}
+
+    def vector(terms):
+        return {term: (1 + math.log(count)) * idf[term] for term, count in terms.items() if term in idf}
+
+    query_vector = vector(Counter(tokenize_text(query)))
+    query_norm = math.sqrt(sum(weight * weight for weight in query_vector.values()))
+    scores = []
+    for order, (ai_id, terms) in enumerate(counts.items()):
+        row = vector(terms)
+        dot = sum(weight * row.get(term, 0) for term, weight in query_vector.items())
+        if dot:
+            row_norm = math.sqrt(sum(weight * weight for weight in row.values()))
+            scores.append((-dot / (row_norm * query_norm), order, ai_id))
+    return [(ai_id, -score) for score, _, ai_id in sorted(scores)[:top_k]]
+
+
+def assert_ranks_like(index, descriptions, query, top_k=3):
+    ranking = index.search([query], top_k)
+    expected = cosine_ranking(descriptions, query, top_k)
+    assert [ai_id for ai_id, _ in ranking] == [ai_id for ai_id, _ in expected]
+    assert [score for _, score in ranking] == pytest.approx([score for _, score in expected], rel=1e-5)
+
+
+def test_tfidf_matches_dense_cosine_similarity_through_changes():
+    rng = random.Random(7)
+    index = TfidfIndex()
+    descriptions = {}
+    for step in range(300):
+        ai_id = f'ai{rng.randrange(40)}'
+        if ai_id in descriptions and rng.random() < 0.3:
+            index.remove(ai_id)
+            del descriptions[ai_id]
+        else:
+            text = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 6)))
+            index.add(ai_id, text)
+            # An update keeps the AI's original place for tie-breaking.
+            descriptions[ai_id] = text
+        if step % 10 == 0:
+            assert_ranks_like(index, descriptions, ' '.join(rng.sample(WORDS, 2)))
+    assert len(index) == len(descriptions)
+    for word in WORDS:
+        assert_ranks_like(index, descriptions, word)
+
+
+def test_search_many_matches_search():
+    index = TfidfIndex()
+    index.rebuild([{'id': f'ai{i}', 'details': {'description': ' '.join(WORDS[i:i + 3])}} for i in range(8)])
+    queries = [['rain'], ['python', 'code'], ['unknown']]
+    assert index.search_many(queries, 2) == [index.search(query, 2) for query in queries]
+    assert index.search(['unknown']) == []
+
+
+def test_freed_rows_and_columns_are_reused():
+    index = TfidfIndex()
+    index.add('a', 'alpha beta')
+    index.add('b', 'gamma')
+    index.remove('a')
+    index.add('c', 'delta epsilon')
+    # 'c' takes over the row and both columns 'a' freed.
+    assert len(index._row_ids) == 2
+    assert len(index._terms) == 3
+    assert index.search(['alpha']) == []
+    assert [ai_id for ai_id, _ in index.search(['delta'])] == ['c']
+
@@ -0,0 +1,94 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def test_concurrent_identical_calls_share_one_result():
+    flight = SingleFlight()
+    calls = []
+
+    def work():
+        calls.append(1)
+        time.sleep(0.2)
+        return 'done'
+
+    with ThreadPoolExecutor(4) as executor:
+        results = list(executor.map(lambda _: flight.do('key', work), range(4)))
+    assert results == ['done'] * 4
+    assert len(calls) == 1
+    assert flight.stats() == {'calls': 1, 'collapsed': 3, 'timed_out': 0, 'in_flight': 0}
+
+
+def test_followers_get_the_leaders_error():
+    flight = SingleFlight()
+
+    def work():
+        time.sleep(0.2)
+        raise ValueError('broken')
+
+    with ThreadPoolExecutor(2) as executor:
+        futures = [executor.submit(flight.do, 'key', work) for _ in range(2)]
+    for future in futures:
+        with pytest.raises(ValueError):
+            future.result()
+
+
+def test_followers_stop_waiting_at_their_timeout():
+    flight = SingleFlight()
+    started = threading.Event()
+
+    def work():
+        started.set()
+        time.sleep(0.5)
+        return 'late'
+
+    with ThreadPoolExecutor(1) as executor:
+        leader = executor.submit(flight.do, 'key', work)
+        started.wait()
+        with pytest.raises(TimeoutError):
+            flight.do('key', work, timeout=0.1)
+        assert leader.result() == 'late'
+    assert flight.stats()['timed_out'] == 1
+
+
+def test_async_followers_share_a_threaded_call():
+    flight = SingleFlight()
+    started = threading.Event()
+    calls = []
+
+    def work():
+        calls.append(1)
+        started.set()
+        time.sleep(0.2)
+        return 'done'
+
+    async def coroutine():
+        calls.append(1)
+        return 'unused'
+
+    async def followers():
+        return await asyncio.gather(*[flight.do_async('key', coroutine) for _ in range(3)])
+
+    with ThreadPoolExecutor(1) as executor:
+        leader = executor.submit(flight.do, 'key', work)
+        started.wait()
+        assert asyncio.run(followers()) == ['done'] * 3
+        assert leader.result() == 'done'
+    assert len(calls) == 1
+
+
+def test_coalesced_ai_runs_once_for_identical_requests(registry, local_ai, tmp_path):
+    from junction import call_ai_cached
+
+    log = tmp_path / 'calls.log'
+    ai = local_ai('Counted', 'counted', f"import sys, time\nopen({str(log)!r}, 'a').write('x')\n"
+                                        "time.sleep(0.3)\nprint(sys.argv[1])\n", coalesce=True)
+    with ThreadPoolExecutor(4) as executor:
+        outputs = list(executor.map(lambda _: call_ai_cached(ai, {'original_input': 'same'}), range(4)))
+    assert outputs == ['same\n'] * 4
+    assert log.read_text() == 'x'
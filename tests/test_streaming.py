@@ -0,0 +1,29 @@
+import time
+
+from circuit_breaker import HALF_OPEN
+from junction import get_breakers, stream_with_ai
+from admission import get_limiter
+
+HANGING = "import time\nprint('first', flush=True)\ntime.sleep(30)\n"
+
+
+def test_abandoned_stream_records_no_outcome(registry, local_ai):
+    ai = local_ai('Hanging', 'hanging', HANGING, max_concurrency=1)
+    breaker = get_breakers().get(ai['id'])
+    breaker.open_seconds = 0
+    for _ in range(breaker.min_calls):
+        breaker.record(0.01, failed=True)
+
+    stream = stream_with_ai(ai, {'original_input': 'x'})
+    assert breaker.state == HALF_OPEN
+    assert 'first' in next(stream)
+    calls = breaker.snapshot()['calls']
+    start = time.monotonic()
+    stream.close()
+    assert time.monotonic() - start < 5
+
+    assert breaker.state == HALF_OPEN
+    assert breaker.snapshot()['calls'] == calls
+    assert get_limiter(ai['id'], ai['details']).stats()['active'] == 0
+    # The probe is free again for the next call.
+    assert breaker.allow()
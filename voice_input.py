@@ -0,0 +1,304 @@
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+import speech_recognition as sr
+
+# 'google' (online), 'sphinx' or 'vosk' (offline, optional packages), or
+# 'transcript', which reads <file>.txt next to each WAV file for testing.
+VOICE_RECOGNIZER = os.getenv('VOICE_RECOGNIZER', 'google')
+VOSK_MODEL_PATH = os.getenv('VOSK_MODEL_PATH', 'model')
+# WAV files to play instead of the microphone, separated by os.pathsep.
+VOICE_WAV_FILES = os.getenv('VOICE_WAV_FILES', '')
+# Phrases captured but not yet recognised; when full the oldest is dropped.
+VOICE_QUEUE_SIZE = int(os.getenv('VOICE_QUEUE_SIZE', '8'))
+VOICE_PHRASE_LIMIT = float(os.getenv('VOICE_PHRASE_LIMIT', '5'))
+# Utterances kept for stats().
+VOICE_HISTORY_SIZE = 100
+
+
+class RecognizerUnavailable(Exception):
+    pass
+
+
+class Utterance:
+    __slots__ = ('audio', 'captured_at', 'source')
+
+    def __init__(self, audio, source=None):
+        self.audio = audio
+        self.captured_at = time.monotonic()
+        self.source = source
+
+    @property
+    def duration(self):
+        return len(self.audio.frame_data) / (self.audio.sample_rate * self.audio.sample_width)
+
+
+class GoogleRecognizer:
+    name = 'google'
+
+    def __init__(self):
+        self._recognizer = sr.Recognizer()
+
+    def recognize(self, utterance):
+        return self._recognizer.recognize_google(utterance.audio)
+
+
+class SphinxRecognizer:
+    name = 'sphinx'
+
+    def __init__(self):
+        try:
+            import pocketsphinx  # noqa: F401
+        except ImportError:
+            raise RecognizerUnavailable("The sphinx recognizer needs the pocketsphinx package")
+        self._recognizer = sr.Recognizer()
+
+    def recognize(self, utterance):
+        return self._recognizer.recognize_sphinx(utterance.audio)
+
+
+class VoskRecognizer:
+    name = 'vosk'
+
+    def __init__(self, model_path=VOSK_MODEL_PATH):
+        try:
+            from vosk import KaldiRecognizer, Model
+        except ImportError:
+            raise RecognizerUnavailable("The vosk recognizer needs the vosk package")
+        if not os.path.isdir(model_path):
+            raise RecognizerUnavailable(f"Vosk model not found at '{model_path}' (set VOSK_MODEL_PATH)")
+        # Loading the model takes seconds, so it is done once per recognizer.
+        self._model = Model(model_path)
+        self._kaldi_recognizer = KaldiRecognizer
+
+    def recognize(self, utterance):
+        recognizer = self._kaldi_recognizer(self._model, 16000)
+        recognizer.AcceptWaveform(utterance.audio.get_raw_data(convert_rate=16000, convert_width=2))
+        text = json.loads(recognizer.FinalResult()).get('text', '')
+        if not text:
+            raise sr.UnknownValueError()
+        return text
+
+
+class TranscriptRecognizer:
+    # Stand-in for tests and benchmarks: the "recognised" text of a WAV file
+    # is read from the .txt file beside it, after an optional fixed delay.
+    name = 'transcript'
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+
+    def recognize(self, utterance):
+        if utterance.source is None:
+            raise sr.RequestError("The transcript recognizer only works with WAV input")
+        time.sleep(self.delay)
+        try:
+            with open(os.path.splitext(utterance.source)[0] + '.txt') as f:
+                text = f.read().strip()
+        except OSError as e:
+            raise sr.RequestError(f"No transcript for {utterance.source}: {e}")
+        if not text:
+            raise sr.UnknownValueError()
+        return text
+
+
+RECOGNIZERS = {
+    'google': GoogleRecognizer,
+    'sphinx': SphinxRecognizer,
+    'vosk': VoskRecognizer,
+    'transcript': TranscriptRecognizer,
+}
+
+
+def create_recognizer(name=None):
+    name = name or VOICE_RECOGNIZER
+    if name not in RECOGNIZERS:
+        raise RecognizerUnavailable(f"Unknown recognizer '{name}'; use one of {', '.join(RECOGNIZERS)}")
+    return RECOGNIZERS[name]()
+
+
+class MicrophoneSource:
+    def __init__(self, phrase_time_limit=VOICE_PHRASE_LIMIT):
+        self.phrase_time_limit = phrase_time_limit
+
+    def listen(self, stopped):
+        recognizer = sr.Recognizer()
+        with sr.Microphone() as source:
+            while not stopped.is_set():
+                try:
+                    audio = recognizer.listen(source, timeout=1, phrase_time_limit=self.phrase_time_limit)
+                except sr.WaitTimeoutError:
+                    continue
+                yield Utterance(audio)
+
+
+class WavSource:
+    # Plays WAV files as if each were one spoken phrase. In real time, each
+    # file is delivered only after its own duration has passed.
+    def __init__(self, paths, realtime=True):
+        self.paths = list(paths)
+        self.realtime = realtime
+
+    def listen(self, stopped):
+        recognizer = sr.Recognizer()
+        for path in self.paths:
+            with sr.AudioFile(path) as source:
+                utterance = Utterance(recognizer.record(source), path)
+            if stopped.wait(utterance.duration) if self.realtime else stopped.is_set():
+                return
+            utterance.captured_at = time.monotonic()
+            yield utterance
+
+
+def create_source(wav_files=None):
+    wav_files = VOICE_WAV_FILES if wav_files is None else wav_files
+    if wav_files:
+        return WavSource(wav_files.split(os.pathsep))
+    return MicrophoneSource()
+
+
+class VoicePipeline:
+    # Capture and recognition run on separate threads joined by a bounded
+    # queue, so the next phrase is heard while the last one is transcribed.
+    # on_text(text, record) is called from the recognition thread.
+    def __init__(self, source, recognizer, on_text, queue_size=VOICE_QUEUE_SIZE):
+        self.source = source
+        self.recognizer = recognizer
+        self.on_text = on_text
+        self.queue_size = queue_size
+        # One slot more than phrases may use, so the stop marker always fits.
+        self._queue = queue.Queue(maxsize=queue_size + 1)
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._history = deque(maxlen=VOICE_HISTORY_SIZE)
+        self._threads = []
+        self.captured = 0
+        self.dropped = 0
+        self.recognized = 0
+        self.unrecognized = 0
+        self.failed = 0
+        self.capture_error = None
+
+    def start(self):
+        self._threads = [threading.Thread(target=self._capture, daemon=True),
+                         threading.Thread(target=self._recognize, daemon=True)]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        # Phrases already captured are still recognised.
+        self._stopped.set()
+
+    def join(self, timeout=None):
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _put(self, utterance):
+        # Never blocks: a full queue loses its oldest phrase instead. Only
+        # this thread adds to the queue, so the check cannot race.
+        while self._queue.qsize() >= self.queue_size:
+            try:
+                self._queue.get_nowait()
+                self.dropped += 1
+            except queue.Empty:
+                break
+        self._queue.put_nowait(utterance)
+
+    def _capture(self):
+        try:
+            for utterance in self.source.listen(self._stopped):
+                self.captured += 1
+                self._put(utterance)
+        except Exception as e:
+            self.capture_error = e
+            print(f"Voice capture stopped: {e}")
+        finally:
+            self._queue.put_nowait(None)
+
+    def _recognize(self):
+        while True:
+            utterance = self._queue.get()
+            if utterance is None:
+                return
+            started = time.monotonic()
+            text, outcome = None, 'recognized'
+            try:
+                text = self.recognizer.recognize(utterance)
+            except sr.UnknownValueError:
+                outcome = 'unrecognized'
+            except sr.RequestError as e:
+                outcome = 'failed'
+                print(f"Could not request results; {e}")
+            except Exception as e:
+                # A broken recognizer plugin fails this phrase, not the pipeline.
+                outcome = 'failed'
+                print(f"Recognizer {self.recognizer.name} failed: {e!r}")
+            finished = time.monotonic()
+            record = {
+                'outcome': outcome,
+                'audio_seconds': utterance.duration,
+                'queue_seconds': started - utterance.captured_at,
+                'recognition_seconds': finished - started,
+                'latency_seconds': finished - utterance.captured_at,
+            }
+            with self._lock:
+                setattr(self, outcome, getattr(self, outcome) + 1)
+                self._history.append(record)
+            if text is not None:
+                try:
+                    self.on_text(text, record)
+                except Exception as e:
+                    print(f"Voice input handler failed: {e!r}")
+
+    def stats(self):
+        with self._lock:
+            history = list(self._history)
+        latencies = sorted(record['latency_seconds'] for record in history)
+        audio_seconds = sum(record['audio_seconds'] for record in history)
+        recognition_seconds = sum(record['recognition_seconds'] for record in history)
+        return {
+            'recognizer': self.recognizer.name,
+            'captured': self.captured,
+            'dropped': self.dropped,
+            'queued': self._queue.qsize(),
+            'recognized': self.recognized,
+            'unrecognized': self.unrecognized,
+            'failed': self.failed,
+            'mean_latency': sum(latencies) / len(latencies) if latencies else None,
+            'p95_latency': latencies[int(0.95 * (len(latencies) - 1))] if latencies else None,
+            'mean_queue_wait': sum(record['queue_seconds'] for record in history) / len(history) if history else None,
+            # Seconds of speech recognised per second of recognition; below 1
+            # the queue grows while someone keeps talking.
+            'real_time_factor': audio_seconds / recognition_seconds if recognition_seconds else None,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run WAV files through the voice pipeline and report timings.")
+    parser.add_argument('files', nargs='+', help="WAV files, each treated as one phrase")
+    parser.add_argument('--recognizer', choices=sorted(RECOGNIZERS), default=VOICE_RECOGNIZER)
+    parser.add_argument('--no-realtime', action='store_true', help="deliver files as fast as they can be read")
+    args = parser.parse_args()
+
+    def on_text(text, record):
+        print(f"{record['audio_seconds']:6.2f}s audio  queued {record['queue_seconds'] * 1000:8.1f} ms  "
+              f"recognised in {record['recognition_seconds'] * 1000:8.1f} ms  {text!r}")
+
+    try:
+        recognizer = create_recognizer(args.recognizer)
+    except RecognizerUnavailable as e:
+        parser.error(str(e))
+    pipeline = VoicePipeline(WavSource(args.files, realtime=not args.no_realtime), recognizer, on_text)
+    pipeline.start()
+    pipeline.join()
+    for name, value in pipeline.stats().items():
+        print(f"{name:>20}: {value:.3f}" if isinstance(value, float) else f"{name:>20}: {value}")
+
+
+if __name__ == '__main__':
+    main()